@@ -1 +1 @@
-from .core import SqlFun
+from .core import SqlFun, SqlTableFun
@@ -1,7 +1,16 @@
 from django import apps
+from django.db.backends.signals import connection_created
 
 
 class FunctionConfig(apps.AppConfig):
     name = 'sqlfun'
     verbose_name = 'Django SQL Fun'
     default_auto_field = 'django.db.models.AutoField'
+
+    def ready(self):
+        from sqlfun import checks  # noqa: F401
+        from sqlfun.sqlite import register_python_functions
+
+        connection_created.connect(
+            register_python_functions, dispatch_uid='sqlfun_register_python_functions'
+        )
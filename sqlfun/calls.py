@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import hashlib
+import re
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from itertools import islice
+from typing import TYPE_CHECKING, Any
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from sqlfun.conf import get_setting
+from sqlfun.sqlite import register_python_function
+
+if TYPE_CHECKING:
+    from sqlfun.core import SqlFun
+    from sqlfun.metadata import FunctionMetadata
+
+# rows fetched from the cursor at a time while streaming results
+FETCH_SIZE = 2_000
+
+# eg. integer[], integer[3] or integer ARRAY
+_ARRAY_TYPE_RE = re.compile(r'(\]|\bARRAY)\s*$', re.IGNORECASE)
+
+
+def to_python(value: Any) -> Any:
+    """Convert NumPy arrays and scalars, which the database driver can't adapt"""
+    tolist = getattr(value, 'tolist', None)
+    return tolist() if callable(tolist) else value
+
+
+def _get_prepared_statements(connection) -> set[str]:
+    """Return the names of the statements prepared in the current session"""
+    prepared = getattr(connection, '_sqlfun_prepared_statements', None)
+    # prepared statements belong to a session, so a reconnect forgets them
+    if prepared is None or prepared[0] is not connection.connection:
+        prepared = (connection.connection, set())
+        connection._sqlfun_prepared_statements = prepared
+    return prepared[1]
+
+
+def _execute(
+    cursor,
+    build_sql: Callable[[list[str]], str],
+    types: Sequence[str],
+    params: list,
+):
+    """Execute the statement ``build_sql`` returns for the given parameters.
+
+    Unless ``SQLFUN_PREPARED_STATEMENTS`` is disabled, the statement is
+    prepared once per connection and executed by name afterwards.
+    """
+    if not get_setting('PREPARED_STATEMENTS'):
+        cursor.execute(build_sql([f'CAST(%s AS {sql_type})' for sql_type in types]), params)
+        return
+
+    statement = build_sql([f'${number}' for number in range(1, len(types) + 1)])
+    name = 'sqlfun_' + hashlib.sha256(
+        f'{statement}\0{",".join(types)}'.encode()
+    ).hexdigest()[:24]
+    prepared_statements = _get_prepared_statements(cursor.db)
+
+    if name not in prepared_statements:
+        types_sql = f'({", ".join(types)})' if types else ''
+        cursor.execute(f'PREPARE {name}{types_sql} AS {statement}')
+        prepared_statements.add(name)
+
+    params_sql = f'({", ".join(["%s"] * len(params))})' if params else ''
+    cursor.execute(f'EXECUTE {name}{params_sql}', params)
+
+
+def _get_argument_types(metadata: FunctionMetadata, args: Sequence[Any]) -> tuple[str, ...]:
+    """Return the types of the given arguments, which have to fit the signature"""
+    input_arguments = [argument for argument in metadata.arguments if argument.is_input]
+    required_count = sum(not argument.has_default for argument in input_arguments)
+    if not required_count <= len(args) <= len(input_arguments):
+        expected = (
+            f'{required_count} to {len(input_arguments)}'
+            if required_count < len(input_arguments) else f'{required_count}'
+        )
+        raise TypeError(
+            f'{metadata.signature} takes {expected} arguments, got {len(args)}.'
+        )
+    return metadata.argument_types[:len(args)]
+
+
+def call_function(
+    sqlfun_cls: type[SqlFun],
+    args: Sequence[Any],
+    *,
+    using: str = DEFAULT_DB_ALIAS,
+) -> Any:
+    """Call a function with the given arguments and return its result"""
+    metadata = sqlfun_cls.get_metadata()
+    types = _get_argument_types(metadata, args)
+
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        return next(_call_python_function_many(sqlfun_cls, [args], connection))
+
+    with connection.cursor() as cursor:
+        _execute(
+            cursor,
+            lambda params: f'SELECT {metadata.qualified_name}({", ".join(params)})',
+            types,
+            [to_python(arg) for arg in args],
+        )
+        return cursor.fetchone()[0]
+
+
+def _to_rows(rows: Iterable[Any], argument_count: int) -> Iterator[Sequence[Any]]:
+    for row in to_python(rows):
+        row = to_python(row)
+        # single values are accepted as the rows of one argument functions
+        is_single_value = isinstance(row, (str, bytes)) or not isinstance(row, Sequence)
+        if argument_count == 1 and is_single_value:
+            row = (row,)
+        if len(row) != argument_count:
+            raise ValueError(
+                f'Expected rows of {argument_count} arguments, got {len(row)}: {row!r}'
+            )
+        yield row
+
+
+def _call_python_function_many(
+    sqlfun_cls: type[SqlFun],
+    rows: Iterable[Sequence[Any]],
+    connection,
+) -> Iterator[Any]:
+    """Call the Python implementation of a function once per row, on SQLite"""
+    function_name = connection.ops.quote_name(register_python_function(sqlfun_cls, connection))
+    with connection.cursor() as cursor:
+        for row in rows:
+            # there are no round trips to save on SQLite, which runs in process
+            cursor.execute(
+                f'SELECT {function_name}({", ".join(["%s"] * len(row))})',
+                [to_python(arg) for arg in row],
+            )
+            yield cursor.fetchone()[0]
+
+
+def call_function_many(
+    sqlfun_cls: type[SqlFun],
+    rows: Iterable[Any],
+    *,
+    batch_size: int | None = None,
+    using: str = DEFAULT_DB_ALIAS,
+) -> Iterator[Any]:
+    """Call a function once per row of arguments, and yield the results in order.
+
+    Rows are sent ``batch_size`` at a time, ``SQLFUN_CALL_BATCH_SIZE`` by
+    default, as one array per argument that is unnested by the database, so
+    each batch is a single round trip. Results are streamed: nothing is sent
+    before iteration starts, and each batch only once the previous one has
+    been consumed. Functions taking arrays raise ``TypeError``, since arrays
+    of arrays can't be unnested one level.
+    """
+    metadata = sqlfun_cls.get_metadata()
+    types = metadata.argument_types
+    if not types:
+        raise ValueError(f'{metadata.qualified_name} takes no arguments to call it with.')
+
+    row_iterator = _to_rows(rows, len(types))
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        yield from _call_python_function_many(sqlfun_cls, row_iterator, connection)
+        return
+
+    array_types = [sql_type for sql_type in types if _ARRAY_TYPE_RE.search(sql_type)]
+    if array_types:
+        # unnest flattens arrays of arrays all the way down, not by one level
+        raise TypeError(
+            f'{metadata.qualified_name} takes array arguments ({", ".join(array_types)}), '
+            'which call_many cannot batch. Use call for each row instead.'
+        )
+
+    batch_size = batch_size or get_setting('CALL_BATCH_SIZE')
+    columns = [f'arg_{number}' for number in range(1, len(types) + 1)]
+
+    def build_sql(params):
+        return (
+            f'SELECT {metadata.qualified_name}('
+            f'{", ".join(f"a.{column}" for column in columns)}) '
+            f'FROM unnest({", ".join(params)}) WITH ORDINALITY '
+            f'AS a({", ".join(columns)}, ordinality) '
+            'ORDER BY a.ordinality'
+        )
+
+    with connection.cursor() as cursor:
+        while batch := list(islice(row_iterator, batch_size)):
+            _execute(
+                cursor,
+                build_sql,
+                [f'{sql_type}[]' for sql_type in types],
+                [list(column) for column in zip(*batch)],
+            )
+            while results := cursor.fetchmany(FETCH_SIZE):
+                for (result,) in results:
+                    yield result
+
+
+def iterate_function(
+    sqlfun_cls: type[SqlFun],
+    args: Sequence[Any],
+    *,
+    chunk_size: int | None = None,
+    using: str = DEFAULT_DB_ALIAS,
+) -> Iterator[tuple]:
+    """Yield the rows of a set-returning function, fetched in chunks"""
+    metadata = sqlfun_cls.get_metadata()
+    placeholders = [
+        f'CAST(%s AS {sql_type})' for sql_type in _get_argument_types(metadata, args)
+    ]
+    chunk_size = chunk_size or get_setting('TABLE_CHUNK_SIZE')
+
+    # a named cursor on postgres, unless DISABLE_SERVER_SIDE_CURSORS is set
+    with connections[using].chunked_cursor() as cursor:
+        cursor.execute(
+            f'SELECT * FROM {metadata.qualified_name}({", ".join(placeholders)})',
+            [to_python(arg) for arg in args],
+        )
+        while rows := cursor.fetchmany(chunk_size):
+            yield from rows
@@ -0,0 +1,86 @@
+from django.apps import apps
+from django.core import checks
+
+from sqlfun.core import SqlFun
+from sqlfun.dependencies import get_indexed_functions
+
+
+@checks.register('sqlfun')
+def check_planner_attributes(app_configs=None, **kwargs):
+    """Warn about functions missing the attributes the planner relies on"""
+    app_labels = {app_config.label for app_config in app_configs} if app_configs else None
+    messages = []
+
+    for sqlfun_cls in SqlFun._registry:
+        if app_labels is not None and sqlfun_cls.get_app_label() not in app_labels:
+            continue
+
+        metadata = sqlfun_cls.get_metadata()
+        name = metadata.qualified_name
+
+        if metadata.volatility is None:
+            messages.append(checks.Warning(
+                f'{name} does not declare its volatility, so it defaults to VOLATILE.',
+                hint=(
+                    "Set volatility = 'immutable' or 'stable' if it allows, so "
+                    'postgres can inline it and use it in index scans, or '
+                    "volatility = 'volatile' to silence this warning."
+                ),
+                obj=sqlfun_cls,
+                id='sqlfun.W001',
+            ))
+
+        # volatile functions are rarely parallel safe, so only nag about the others
+        if metadata.parallel is None and metadata.volatility in ('immutable', 'stable'):
+            messages.append(checks.Warning(
+                f'{name} is {metadata.volatility.upper()} but does not declare its '
+                'parallel safety, so it defaults to '
+                'PARALLEL UNSAFE and prevents parallel plans for queries using it.',
+                hint=(
+                    "Set parallel = 'safe' if it allows, or parallel = 'unsafe' "
+                    'to silence this warning.'
+                ),
+                obj=sqlfun_cls,
+                id='sqlfun.W002',
+            ))
+
+        if metadata.returns_set and metadata.rows is None:
+            messages.append(checks.Warning(
+                f'{name} returns a set but does not declare ROWS, so the planner '
+                'assumes it returns 1000 rows.',
+                hint='Set rows to the number of rows it typically returns.',
+                obj=sqlfun_cls,
+                id='sqlfun.W003',
+            ))
+
+    return messages
+
+
+@checks.register('sqlfun', checks.Tags.models)
+def check_indexed_functions(app_configs=None, **kwargs):
+    """Refuse functions that aren't immutable in indexes, constraints and generated fields"""
+    if app_configs is None:
+        models = apps.get_models()
+    else:
+        models = [model for app_config in app_configs for model in app_config.get_models()]
+    messages = []
+
+    for model in models:
+        for usage, sqlfun_cls in get_indexed_functions(model):
+            metadata = sqlfun_cls.get_metadata()
+            if metadata.volatility == 'immutable':
+                continue
+
+            messages.append(checks.Error(
+                f'{model._meta.label} uses {metadata.qualified_name} in its {usage}, '
+                f'but the function is {(metadata.volatility or "volatile").upper()}.',
+                hint=(
+                    'Postgres only stores the results of IMMUTABLE functions. Set '
+                    "volatility = 'immutable' if its result only depends on its "
+                    'arguments.'
+                ),
+                obj=model,
+                id='sqlfun.E001',
+            ))
+
+    return messages
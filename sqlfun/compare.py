@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import math
+import time
+from collections.abc import Collection
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from sqlfun.calls import to_python
+from sqlfun.conf import get_setting
+from sqlfun.core import SqlFun, get_registry_by_function_name
+from sqlfun.metadata import (
+    FunctionMetadata,
+    parse_function_definition,
+    quote_identifier,
+    rename_definition,
+)
+from sqlfun.state import get_state
+from sqlfun.utils import get_registry_changes, scope_to_app_labels
+
+# names the definitions are created under while they are compared
+PREVIOUS_NAME = 'sqlfun_compare_previous'
+CURRENT_NAME = 'sqlfun_compare_current'
+
+
+def _percentile(sorted_values: tuple[float, ...], percent: float) -> float:
+    """Return the nearest-rank percentile of sorted values"""
+    rank = math.ceil(percent / 100 * len(sorted_values))
+    return sorted_values[max(rank - 1, 0)]
+
+
+@dataclass(frozen=True)
+class Measurement:
+    """Timings of one definition, in seconds per sample, and its estimated cost"""
+
+    durations: tuple[float, ...]
+    # the planner's total cost, summed over the samples
+    cost: float
+
+    @property
+    def p50(self) -> float:
+        return _percentile(tuple(sorted(self.durations)), 50)
+
+    @property
+    def p95(self) -> float:
+        return _percentile(tuple(sorted(self.durations)), 95)
+
+    @property
+    def p99(self) -> float:
+        return _percentile(tuple(sorted(self.durations)), 99)
+
+
+def _change(previous: float, current: float) -> float:
+    if previous == 0:
+        return 0.0 if current == 0 else math.inf
+    return current / previous - 1
+
+
+@dataclass(frozen=True)
+class Comparison:
+    """The previous and current definitions of a function, measured side by side"""
+
+    sqlfun_cls: type[SqlFun]
+    previous: Measurement
+    current: Measurement
+
+    @property
+    def latency_change(self) -> float:
+        """Relative change of the median latency, eg. ``0.1`` for 10% slower"""
+        return _change(self.previous.p50, self.current.p50)
+
+    @property
+    def cost_change(self) -> float:
+        return _change(self.previous.cost, self.current.cost)
+
+    def is_regression(self, threshold: Optional[float] = None) -> bool:
+        """Whether the current definition is slower or costlier by more than ``threshold``.
+
+        ``threshold`` defaults to the ``SQLFUN_COMPARE_THRESHOLD`` setting.
+        """
+        threshold = get_setting('COMPARE_THRESHOLD') if threshold is None else threshold
+        return self.latency_change > threshold or self.cost_change > threshold
+
+
+def get_samples(
+    sqlfun_cls: type[SqlFun],
+    metadata: FunctionMetadata,
+    function_name: str,
+) -> list[tuple[str, Optional[list[Any]]]]:
+    """Return the statements, with their parameters, that call a definition.
+
+    ``metadata`` is that of the definition, whose argument types can differ
+    from the current ones, and ``function_name`` the name it was created as.
+    """
+    if sqlfun_cls.sample_query is not None:
+        # without parameters, so the driver leaves any % in the query alone
+        return [(sqlfun_cls.sample_query % {'function': function_name}, None)]
+
+    if metadata.returns_set:
+        template = 'SELECT * FROM {}({})'
+    else:
+        template = 'SELECT {}({})'
+
+    input_arguments = [argument for argument in metadata.arguments if argument.is_input]
+    required_count = sum(not argument.has_default for argument in input_arguments)
+
+    samples = []
+    for arguments in sqlfun_cls.sample_arguments or ():
+        arguments = to_python(arguments)
+        if not required_count <= len(arguments) <= len(input_arguments):
+            raise ValueError(
+                f'{metadata.qualified_name}({", ".join(metadata.argument_types)}) '
+                f'cannot be called with the sample arguments {tuple(arguments)!r}.'
+            )
+        placeholders = [
+            f'CAST(%s AS {sql_type})'
+            for sql_type in metadata.argument_types[:len(arguments)]
+        ]
+        samples.append((
+            template.format(function_name, ', '.join(placeholders)),
+            [to_python(argument) for argument in arguments],
+        ))
+    return samples
+
+
+def _get_cost(cursor, samples: list[tuple[str, Optional[list[Any]]]]) -> float:
+    cost = 0.0
+    for sql, params in samples:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        (plan,) = cursor.fetchone()[0]
+        cost += plan['Plan']['Total Cost']
+    return cost
+
+
+def compare_definitions(
+    sqlfun_cls: type[SqlFun],
+    previous_sql: str,
+    *,
+    iterations: Optional[int] = None,
+    using: str = DEFAULT_DB_ALIAS,
+) -> Comparison:
+    """Time the previous and current definitions of a function against each other.
+
+    Both are created under temporary names in a transaction that is rolled
+    back, and each of their samples is run ``iterations`` times,
+    ``SQLFUN_COMPARE_ITERATIONS`` by default. Runs alternate between the two
+    definitions, so neither one benefits from running last. Raises
+    ``ValueError`` if the samples can't call both definitions.
+    """
+    iterations = iterations or get_setting('COMPARE_ITERATIONS')
+    definitions = (previous_sql, sqlfun_cls.get_definition())
+    samples = []
+
+    metadatas = [parse_function_definition(sql) for sql in definitions]
+    if sqlfun_cls.sample_query is None and metadatas[0].argument_types != metadatas[1].argument_types:
+        raise ValueError(
+            f'The arguments of {metadatas[1].qualified_name} changed from '
+            f'({", ".join(metadatas[0].argument_types)}) to '
+            f'({", ".join(metadatas[1].argument_types)}), so the same sample_arguments '
+            'cannot call both definitions. Use a sample_query instead.'
+        )
+
+    for metadata, name in zip(metadatas, (PREVIOUS_NAME, CURRENT_NAME)):
+        function_name = quote_identifier(name)
+        if metadata.schema:
+            function_name = f'{metadata.schema}.{function_name}'
+        samples.append(get_samples(sqlfun_cls, metadata, function_name))
+
+    if not samples[1]:
+        raise ValueError(
+            f'{sqlfun_cls.get_metadata().qualified_name} declares no sample_arguments '
+            'or sample_query to compare its definitions with.'
+        )
+
+    durations = ([], [])
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        for sql, name in zip(definitions, (PREVIOUS_NAME, CURRENT_NAME)):
+            cursor.execute(rename_definition(sql, name))
+        costs = [_get_cost(cursor, variant_samples) for variant_samples in samples]
+
+        # a first run of each sample warms up the plans and caches, untimed
+        for variant_samples in samples:
+            for sql, params in variant_samples:
+                cursor.execute(sql, params)
+                cursor.fetchall()
+
+        for iteration in range(iterations):
+            order = (0, 1) if iteration % 2 == 0 else (1, 0)
+            for variant in order:
+                for sql, params in samples[variant]:
+                    start = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    durations[variant].append(time.perf_counter() - start)
+
+        transaction.set_rollback(True, using=using)
+
+    return Comparison(
+        sqlfun_cls=sqlfun_cls,
+        previous=Measurement(durations=tuple(durations[0]), cost=costs[0]),
+        current=Measurement(durations=tuple(durations[1]), cost=costs[1]),
+    )
+
+
+def get_changed_definitions(
+    app_labels: Optional[Collection[str]] = None,
+    *,
+    offline: Optional[bool] = None,
+    workers: Optional[int] = None,
+) -> dict[type[SqlFun], str]:
+    """Return the previous definition of each function whose definition changed"""
+    registry = get_registry_by_function_name()
+    scoped_registry = scope_to_app_labels(registry, app_labels)
+    state = get_state(app_labels, scoped_registry, offline=offline)
+    _, _, changed = get_registry_changes(
+        registry, scoped_registry, state.get_digests(workers=workers), workers=workers
+    )
+    return {
+        registry[function_name]: previous_sql
+        for function_name, previous_sql in sorted(state.get_definitions(changed).items())
+    }
@@ -0,0 +1,45 @@
+from django.conf import settings
+
+DEFAULTS = {
+    # optional path of an on-disk cache of normalized SQL, eg.
+    # '~/.cache/django-sqlfun/normalized_sql.json'
+    'NORMALIZATION_CACHE': None,
+    'NORMALIZATION_CACHE_MAX_ENTRIES': 10_000,
+    # processes used to normalize SQL missing from the cache: 1 normalizes
+    # serially, 0 uses one process per CPU core
+    'NORMALIZATION_WORKERS': 1,
+    # where the last known function definitions come from: 'database' reads the
+    # SqlFunDefinition table, 'migrations' replays the migration files offline
+    'STATE_SOURCE': 'database',
+    # optional file caching the state replayed from migrations
+    'STATE_SNAPSHOT': None,
+    # function definitions sent to the database per statement by update_all
+    'DEPLOY_BATCH_SIZE': 500,
+    # threads applying functions to several databases at once
+    'DEPLOY_WORKERS': 4,
+    # schemas committed per transaction when installing functions into schemas
+    'SCHEMA_CHUNK_SIZE': 100,
+    # callable, or dotted path to one, that sqlfun_stats exports snapshots to
+    'STATS_SINK': None,
+    # prefix the SQL of every function call with a /* sqlfun:<name> */ comment
+    'QUERY_TAGS': False,
+    # fraction of queries QueryCollector measures
+    'QUERY_SAMPLE_RATE': 1.0,
+    # rows of arguments sent per round trip by SqlFun.call_many
+    'CALL_BATCH_SIZE': 10_000,
+    # prepare the statements of SqlFun.call and call_many once per connection;
+    # disable this behind poolers that don't keep sessions, eg. pgbouncer
+    'PREPARED_STATEMENTS': True,
+    # rows fetched per round trip by SqlTableFun.iterate
+    'TABLE_CHUNK_SIZE': 2_000,
+    # runs of each sample per definition when sqlfun_compare times them
+    'COMPARE_ITERATIONS': 50,
+    # fraction by which a new definition may be slower or costlier than the
+    # previous one before sqlfun_compare fails
+    'COMPARE_THRESHOLD': 0.2,
+}
+
+
+def get_setting(name: str):
+    """Get a sqlfun setting, eg. ``SQLFUN_NORMALIZATION_CACHE``, or its default"""
+    return getattr(settings, f'SQLFUN_{name}', DEFAULTS[name])
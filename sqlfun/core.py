@@ -1,16 +1,63 @@
-import re
+import inspect
+import os
 from abc import ABC
-from typing import ClassVar, Optional, Type
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Any, Callable, ClassVar, Optional, Type
 
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.db.models.expressions import Func
 from django.db.models.fields import Field
 
+from sqlfun.calls import call_function, call_function_many, iterate_function
+from sqlfun.inline import InlineTemplate, compile_inline_template
+from sqlfun.instrumentation import track_compiled
+from sqlfun.metadata import FunctionMetadata, merge_attributes, parse_function_definition
+from sqlfun.sqlite import register_python_function
+
+
+def get_app_name(filepath: str) -> str | None:
+    """
+    Returns the name of the Django app that contains the module at the given filepath.
+    Returns None if the module is not part of a Django app.
+    """
+    while filepath != '/':
+        filepath, module_name = os.path.split(filepath)
+        if module_name == 'apps.py':
+            app_name = os.path.basename(filepath)
+            if app_name != '__init__':
+                return app_name
+        elif module_name == 'models.py':
+            app_name = os.path.basename(filepath)
+            if app_name != '__init__':
+                return app_name
+    return None
+
 
 class SqlFun(Func, ABC):
     _registry: ClassVar[list[Type['SqlFun']]] = []
     sql: str
     output_field: Optional[Field] = None
     app_label: Optional[str] = None
+    # planner attributes merged into, or checked against, the SQL definition
+    volatility: ClassVar[Optional[str]] = None
+    parallel: ClassVar[Optional[str]] = None
+    cost: ClassVar[Optional[float]] = None
+    rows: ClassVar[Optional[float]] = None
+    leakproof: ClassVar[Optional[bool]] = None
+    # compile calls into the function body instead of calling the function
+    inline: ClassVar[bool] = False
+    # implementation registered on SQLite connections, which can't run the SQL
+    python_function: ClassVar[Optional[Callable[..., Any]]] = None
+    # rows of arguments, or a query calling %(function)s, that sqlfun_compare
+    # times the previous and current definitions with
+    sample_arguments: ClassVar[Optional[Sequence[Sequence[Any]]]] = None
+    sample_query: ClassVar[Optional[str]] = None
+    _definition: ClassVar[str]
+    _definition_key: ClassVar[tuple]
+    _metadata: ClassVar[FunctionMetadata]
+    _qualified_name: ClassVar[tuple[str, str]]
+    _inline_template: ClassVar[Optional[InlineTemplate]]
+    _module_app_label: ClassVar[Optional[str]]
 
     def __init__(self, *expressions, output_field: Optional[Field] = None, **extra):
         if output_field is None:
@@ -23,28 +70,119 @@ class SqlFun(Func, ABC):
         super().__init__(*expressions, output_field=output_field, **extra)
 
     def __init_subclass__(cls, **kwargs):
+        # base classes for other kinds of functions, like SqlTableFun
+        if cls.__dict__.get('abstract'):
+            return
         if not hasattr(cls, 'sql') or not isinstance(cls.sql, str):
             raise NotImplementedError("Subclass must define the 'sql' class variable as a string.")
+        cls._definition_key = ()
+        cls.get_definition()
+        try:
+            cls._module_app_label = get_app_name(inspect.getfile(cls))
+        except (TypeError, OSError):
+            # classes defined in modules without a file, eg. in a shell
+            cls._module_app_label = None
         cls._registry.append(cls)
 
+    @classmethod
+    def get_definition(cls) -> str:
+        """Get the SQL definition with the declared planner attributes merged in.
+
+        The definition, and the inline template if ``inline`` is set, are built
+        once at class creation and only built again if ``sql`` or one of the
+        attributes is reassigned afterwards.
+        """
+        definition_key = (
+            cls.sql, cls.volatility, cls.parallel, cls.cost, cls.rows, cls.leakproof, cls.inline,
+        )
+        if cls._definition_key != definition_key:
+            cls._definition = merge_attributes(
+                cls.sql,
+                volatility=cls.volatility,
+                parallel=cls.parallel,
+                cost=cls.cost,
+                rows=cls.rows,
+                leakproof=cls.leakproof,
+            )
+            cls._metadata = parse_function_definition(cls._definition)
+            cls._inline_template = (
+                compile_inline_template(cls._metadata) if cls.inline else None
+            )
+            cls._definition_key = definition_key
+        return cls._definition
+
+    @classmethod
+    def get_metadata(cls) -> FunctionMetadata:
+        """Get the metadata parsed from the SQL definition"""
+        cls.get_definition()
+        return cls._metadata
+
+    @classmethod
+    def get_qualified_name(cls) -> str:
+        """Get the function name, cached per ``sql`` since every compile needs it"""
+        cached = cls.__dict__.get('_qualified_name')
+        if cached is None or cached[0] is not cls.sql:
+            cached = (cls.sql, cls.get_metadata().qualified_name)
+            cls._qualified_name = cached
+        return cached[1]
+
+    @classmethod
+    def get_inline_template(cls) -> Optional[InlineTemplate]:
+        """Get the body to compile calls into, if ``inline`` is set and it allows"""
+        cls.get_definition()
+        return cls._inline_template
+
+    @classmethod
+    def get_app_label(cls) -> Optional[str]:
+        """Get the app label, resolved from the defining module if not set explicitly"""
+        return cls.app_label or cls._module_app_label
+
     @classmethod
     def get_function_name_from_sql(cls) -> str:
         """Get the function name from the SQL definition"""
+        return cls.get_qualified_name()
 
-        pattern = re.compile(r'FUNCTION.+?(\w+).+')
+    @classmethod
+    def update(cls, using: str = DEFAULT_DB_ALIAS):
+        """Create or update the function in the database"""
+        with connections[using].cursor() as cursor:
+            cursor.execute(cls.get_definition())
 
-        if match := pattern.search(cls.sql):
-            return match.group(1)
-        else:
-            raise ValueError('Could not determine function name from SQL definition.')
+    @classmethod
+    def update_all(
+        cls,
+        *,
+        force: bool = False,
+        using: str = DEFAULT_DB_ALIAS,
+    ) -> list[Type['SqlFun']]:
+        """Create or update every registered function in a single transaction.
+
+        Functions whose deployed definition already matches are skipped unless
+        ``force`` is set. Returns the classes whose functions were applied.
+        """
+        from sqlfun.deploy import apply_definitions
+
+        return apply_definitions(force=force, using=using)
 
     @classmethod
-    def update(cls):
-        """Create or update the function in the database"""
-        from django.db import connection
+    def call(cls, *args, using: str = DEFAULT_DB_ALIAS) -> Any:
+        """Call the function in the database and return its result"""
+        return call_function(cls, args, using=using)
+
+    @classmethod
+    def call_many(
+        cls,
+        rows: Iterable,
+        *,
+        batch_size: Optional[int] = None,
+        using: str = DEFAULT_DB_ALIAS,
+    ) -> Iterator:
+        """Lazily call the function for each row of arguments, in batches.
 
-        with connection.cursor() as cursor:
-            cursor.execute(cls.sql)
+        Rows can be sequences of arguments, a 2D NumPy array, or single values
+        for functions of one argument.
+        """
+        return call_function_many(cls, rows, batch_size=batch_size, using=using)
 
     @classmethod
     def deregister(cls):
@@ -55,5 +193,101 @@ class SqlFun(Func, ABC):
         cls._registry.remove(cls)
 
     def as_sql(self, compiler, connection, function=None, **extra_context):
-        function_name = self.get_function_name_from_sql()
-        return super().as_sql(compiler, connection, function=function_name, **extra_context)
+        if (
+            function is None
+            and self.inline
+            and connection.vendor == 'postgresql'
+            and (inline_template := self.get_inline_template())
+            and (inlined := inline_template.render(
+                compiler, connection, self.get_source_expressions()
+            ))
+        ):
+            sql, params = inlined
+        else:
+            if function is None:
+                function = self.get_qualified_name()
+            sql, params = super().as_sql(
+                compiler, connection, function=function, **extra_context
+            )
+        return track_compiled(type(self), sql), params
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        function = register_python_function(type(self), connection)
+        return self.as_sql(compiler, connection, function=function, **extra_context)
+
+
+class SqlTableFun(SqlFun):
+    """A set-returning function, eg. ``RETURNS TABLE (...)`` or ``RETURNS SETOF``.
+
+    In querysets it is a subquery selecting ``column`` from the function, eg. for
+    ``filter(pk__in=TopScores(10))``, by default its first column. From Python,
+    ``iterate`` streams its rows.
+    """
+
+    abstract = True
+    template = '(SELECT %(column)s FROM %(function)s(%(expressions)s))'
+    # the column selected when used as a subquery, the first one if not set
+    column: Optional[str] = None
+
+    def __init__(self, *expressions, column: Optional[str] = None, **extra):
+        super().__init__(*expressions, **extra)
+        if column is not None:
+            self.column = column
+
+    def as_sql(self, compiler, connection, function=None, **extra_context):
+        extra_context.setdefault('column', self.column or self.get_default_column())
+        return super().as_sql(compiler, connection, function=function, **extra_context)
+
+    @classmethod
+    def get_default_column(cls) -> str:
+        """Return the first column the function returns, or ``*`` for ``SETOF`` a scalar"""
+        columns = cls.get_metadata().table_columns
+        return columns[0] if columns else '*'
+
+    @classmethod
+    def iterate(
+        cls,
+        *args,
+        chunk_size: Optional[int] = None,
+        using: str = DEFAULT_DB_ALIAS,
+    ) -> Iterator[tuple]:
+        """Lazily yield the rows the function returns, with a server-side cursor.
+
+        Rows are fetched ``chunk_size`` at a time, ``SQLFUN_TABLE_CHUNK_SIZE`` by
+        default, so memory use doesn't grow with the size of the result. Run it
+        in a transaction, or postgres materializes the whole result on the
+        server first.
+        """
+        return iterate_function(cls, args, chunk_size=chunk_size, using=using)
+
+    @classmethod
+    def call(cls, *args, using: str = DEFAULT_DB_ALIAS) -> list[tuple]:
+        """Call the function in the database and return all of its rows"""
+        return list(cls.iterate(*args, using=using))
+
+    @classmethod
+    def call_many(cls, rows, *, batch_size=None, using=DEFAULT_DB_ALIAS):
+        raise TypeError('Set-returning functions are called one at a time with iterate.')
+
+
+def get_registry_by_function_name() -> dict[str, type[SqlFun]]:
+    """Return the registered functions by name.
+
+    Functions are migrated, deployed and checked by name, so overloads sharing
+    a name raise ``ValueError`` instead of silently replacing each other. A
+    class redefining the same signature, eg. after a module is reloaded,
+    replaces the earlier one.
+    """
+    registry = {}
+    for sqlfun_cls in SqlFun._registry:
+        metadata = sqlfun_cls.get_metadata()
+        function_name = metadata.qualified_name
+        other_cls = registry.get(function_name)
+        if other_cls is not None and other_cls.get_metadata().signature != metadata.signature:
+            raise ValueError(
+                f'{other_cls.__qualname__} and {sqlfun_cls.__qualname__} both define '
+                f'{function_name}. Overloaded functions are not supported, give each '
+                'one its own name.'
+            )
+        registry[function_name] = sqlfun_cls
+    return registry
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from typing import Any, Optional
+
+from django.db import migrations, models
+from django.db.migrations.loader import MigrationLoader
+
+from sqlfun.core import SqlFun
+from sqlfun.state import get_sqlfun_operations
+
+Node = tuple[str, str]
+
+
+def find_sqlfun_classes(value: Any) -> set[type[SqlFun]]:
+    """Return the functions used anywhere in an expression, index, field or operation.
+
+    Expressions are walked through their source expressions, and anything else
+    that can be deconstructed, eg. an index or a ``Q``, through its arguments.
+    """
+    sqlfun_classes = set()
+    stack = [value]
+
+    while stack:
+        value = stack.pop()
+        if isinstance(value, SqlFun):
+            sqlfun_classes.add(type(value))
+
+        if isinstance(value, (list, tuple, set, frozenset)):
+            stack.extend(value)
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, type):
+            continue
+        elif hasattr(value, 'get_source_expressions'):
+            stack.extend(value.get_source_expressions())
+        elif hasattr(value, 'deconstruct'):
+            # fields return their name first, everything else only its path
+            *_, args, kwargs = value.deconstruct()
+            stack.extend(args)
+            stack.extend(kwargs.values())
+
+    return sqlfun_classes
+
+
+def get_indexed_functions(model: type[models.Model]) -> Iterator[tuple[str, type[SqlFun]]]:
+    """Yield the functions a model uses in its indexes, constraints and generated fields.
+
+    Postgres stores the results of these, so the functions have to be immutable.
+    Each is yielded with a description of where it is used.
+    """
+    for index in model._meta.indexes:
+        for sqlfun_cls in find_sqlfun_classes(index):
+            yield f'index {index.name}', sqlfun_cls
+
+    for constraint in model._meta.constraints:
+        for sqlfun_cls in find_sqlfun_classes(constraint):
+            yield f'constraint {constraint.name}', sqlfun_cls
+
+    for field in model._meta.local_fields:
+        if getattr(field, 'generated', False):
+            for sqlfun_cls in find_sqlfun_classes(field.expression):
+                yield f'generated field {field.name}', sqlfun_cls
+
+
+def get_migrated_usages(loader: MigrationLoader) -> set[str]:
+    """Return the names of the functions that migrations use, eg. in an index"""
+    return {
+        sqlfun_cls.get_metadata().qualified_name
+        for migration in loader.graph.nodes.values()
+        for operation in migration.operations
+        for sqlfun_cls in find_sqlfun_classes(operation)
+    }
+
+
+def get_function_migration(loader: MigrationLoader, function_name: str) -> Optional[Node]:
+    """Return the last migration creating a function, or ``None`` if there is none"""
+    creating_nodes = [
+        node
+        for node, migration in loader.graph.nodes.items()
+        if any(
+            name == function_name and sql is not None
+            for name, sql in get_sqlfun_operations(migration, (function_name,))
+        )
+    ]
+    ancestors = {
+        node: set(loader.graph.forwards_plan(node)) - {node} for node in creating_nodes
+    }
+    latest_nodes = [
+        node for node in creating_nodes
+        if not any(node in ancestors[other] for other in creating_nodes)
+    ]
+    return max(latest_nodes, default=None)
+
+
+def add_function_dependencies(
+    changes: dict[str, list[migrations.Migration]],
+    loader: Optional[MigrationLoader] = None,
+):
+    """Make new migrations depend on the migrations creating the functions they use.
+
+    ``changes`` are the migrations ``makemigrations`` is about to write, which
+    are updated in place, so an index on a function is only created once the
+    function exists.
+    """
+    function_names = {
+        (app_label, migration.name): {
+            sqlfun_cls.get_metadata().qualified_name
+            for operation in migration.operations
+            for sqlfun_cls in find_sqlfun_classes(operation)
+        }
+        for app_label, app_migrations in changes.items()
+        for migration in app_migrations
+    }
+    if not any(function_names.values()):
+        return
+
+    if loader is None:
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+
+    function_migrations = {}
+    for app_label, app_migrations in changes.items():
+        for migration in app_migrations:
+            for function_name in sorted(function_names[app_label, migration.name]):
+                if function_name not in function_migrations:
+                    function_migrations[function_name] = get_function_migration(
+                        loader, function_name
+                    )
+                dependency = function_migrations[function_name]
+                if dependency is not None and dependency not in migration.dependencies:
+                    migration.dependencies.append(dependency)
@@ -0,0 +1,380 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import time
+from collections.abc import Callable, Iterable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+
+from sqlfun.conf import get_setting
+from sqlfun.core import SqlFun, get_registry_by_function_name
+from sqlfun.metadata import qualify_definition, quote_identifier, split_qualified_name
+from sqlfun.normalize import get_sql_digest, normalize_many
+from sqlfun.state import SQLFUN_HINT
+
+# prefix of the comment sqlfun stamps on the functions it deploys
+FINGERPRINT_PREFIX = 'sqlfun:'
+# prefix stamped on the copies installed in other schemas, which drift ignores
+SCHEMA_FINGERPRINT_PREFIX = 'sqlfun-schema:'
+
+VOLATILITY_CODES = {'immutable': 'i', 'stable': 's', 'volatile': 'v'}
+PARALLEL_CODES = {'safe': 's', 'restricted': 'r', 'unsafe': 'u'}
+
+# signatures are resolved by postgres itself, so type aliases like int and
+# integer match, and unqualified ones are looked up in the search path
+_DEPLOYED_FUNCTIONS_SQL = """
+    SELECT s.signature, md5(p.prosrc), p.provolatile, p.proparallel, l.lanname,
+           obj_description(p.oid, 'pg_proc')
+    FROM unnest(%s::text[]) AS s(signature)
+    JOIN pg_proc p ON p.oid = to_regprocedure(s.signature)
+    JOIN pg_language l ON l.oid = p.prolang
+"""
+
+
+@dataclass(frozen=True)
+class DeployedFunction:
+    """The parts of a function's catalog entry its definition is compared with"""
+
+    source_hash: str
+    volatility: str
+    parallel: str
+    language: str
+    comment: Optional[str]
+
+
+def get_catalog_key(sqlfun_cls: type[SqlFun]) -> tuple[Optional[str], str]:
+    """Return the schema and name of a function as stored in the catalog.
+
+    The schema is ``None`` for functions that are not schema qualified, which
+    resolve through the search path.
+    """
+    return split_qualified_name(sqlfun_cls.get_metadata().qualified_name)
+
+
+def get_fingerprints(
+    sqlfun_classes: Sequence[type[SqlFun]],
+    *,
+    workers: Optional[int] = None,
+) -> list[str]:
+    """Return the digest of each function's normalized definition"""
+    return [
+        get_sql_digest(normalized_sql)
+        for normalized_sql in normalize_many(
+            (sqlfun_cls.get_definition() for sqlfun_cls in sqlfun_classes), workers=workers
+        )
+    ]
+
+
+def get_source_hash(sqlfun_cls: type[SqlFun]) -> Optional[str]:
+    """Return the hash ``md5(prosrc)`` has when the function is deployed as defined"""
+    body = sqlfun_cls.get_metadata().body
+    if body is None:
+        return None
+    return hashlib.md5(body.encode(), usedforsecurity=False).hexdigest()
+
+
+def get_deployed_functions(cursor, signatures: Iterable[str]) -> dict[str, DeployedFunction]:
+    """Return the catalog entries of the deployed functions by signature, in one query"""
+    cursor.execute(_DEPLOYED_FUNCTIONS_SQL, [list(signatures)])
+    return {
+        signature: DeployedFunction(*catalog_entry)
+        for signature, *catalog_entry in cursor.fetchall()
+    }
+
+
+def is_deployed(
+    sqlfun_cls: type[SqlFun],
+    fingerprint: str,
+    deployed: Optional[DeployedFunction],
+    prefix: str = FINGERPRINT_PREFIX,
+) -> bool:
+    """Whether a function is deployed as currently defined, according to the catalog.
+
+    The stamp survives ``CREATE OR REPLACE``, eg. by ``SqlFun.update`` or a
+    migration, so it is only trusted for bodies sqlfun can't extract, eg.
+    ``BEGIN ATOMIC``.
+    """
+    if deployed is None:
+        return False
+
+    metadata = sqlfun_cls.get_metadata()
+    if (source_hash := get_source_hash(sqlfun_cls)) is not None:
+        if deployed.source_hash != source_hash:
+            return False
+    elif deployed.comment != f'{prefix}{fingerprint}':
+        return False
+
+    if metadata.language and metadata.language != deployed.language:
+        return False
+    return (
+        VOLATILITY_CODES[metadata.volatility or 'volatile'] == deployed.volatility
+        and PARALLEL_CODES[metadata.parallel or 'unsafe'] == deployed.parallel
+    )
+
+
+def get_deploy_sql(
+    sqlfun_cls: type[SqlFun],
+    fingerprint: str,
+    schema: Optional[str] = None,
+) -> str:
+    """Return the definition of a function followed by its fingerprint stamp.
+
+    With ``schema``, a copy of the function is created in that schema instead,
+    stamped with ``SCHEMA_FINGERPRINT_PREFIX``.
+    """
+    definition = sqlfun_cls.get_definition().strip().rstrip(';')
+    signature = sqlfun_cls.get_metadata().signature
+    prefix = FINGERPRINT_PREFIX
+    if schema is not None:
+        definition = qualify_definition(definition, schema)
+        signature = f'{quote_identifier(schema)}.{signature}'
+        prefix = SCHEMA_FINGERPRINT_PREFIX
+    return (
+        f'{definition};\n'
+        f"COMMENT ON FUNCTION {signature} IS '{prefix}{fingerprint}';"
+    )
+
+
+def allow_deploy(sqlfun_cls: type[SqlFun], using: str) -> bool:
+    """Ask the database routers whether a function belongs in a database.
+
+    Routers get the same hint as for the migration operations sqlfun writes.
+    """
+    return router.allow_migrate(
+        using,
+        sqlfun_cls.get_app_label(),
+        **{SQLFUN_HINT: sqlfun_cls.get_metadata().qualified_name},
+    )
+
+
+def get_deployable_classes(
+    sqlfun_classes: Optional[Iterable[type[SqlFun]]],
+    using: str,
+) -> list[type[SqlFun]]:
+    """Return the given classes, or the registry, that the routers allow in ``using``"""
+    if sqlfun_classes is None:
+        sqlfun_classes = get_registry_by_function_name().values()
+
+    return [
+        sqlfun_cls for sqlfun_cls in sqlfun_classes if allow_deploy(sqlfun_cls, using)
+    ]
+
+
+def apply_definitions(
+    sqlfun_classes: Optional[Iterable[type[SqlFun]]] = None,
+    *,
+    force: bool = False,
+    batch_size: Optional[int] = None,
+    using: str = DEFAULT_DB_ALIAS,
+) -> list[type[SqlFun]]:
+    """Create or update functions in the database in a single transaction.
+
+    Functions the database routers don't allow in the database are left out.
+    Functions whose source, volatility and parallel safety in the catalog
+    already match their definition are skipped unless ``force`` is set. The rest are sent ``batch_size`` definitions
+    per statement, which defaults to the ``SQLFUN_DEPLOY_BATCH_SIZE`` setting.
+    Returns the classes whose functions were applied.
+    """
+    sqlfun_classes = get_deployable_classes(sqlfun_classes, using)
+    # eg. when routers keep functions out of a database other than postgres
+    if not sqlfun_classes:
+        return []
+
+    batch_size = batch_size or get_setting('DEPLOY_BATCH_SIZE')
+    fingerprints = get_fingerprints(sqlfun_classes)
+
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        deployed_functions = {} if force else get_deployed_functions(
+            cursor, (sqlfun_cls.get_metadata().signature for sqlfun_cls in sqlfun_classes)
+        )
+        pending = [
+            (sqlfun_cls, fingerprint)
+            for sqlfun_cls, fingerprint in zip(sqlfun_classes, fingerprints)
+            if not is_deployed(
+                sqlfun_cls,
+                fingerprint,
+                deployed_functions.get(sqlfun_cls.get_metadata().signature),
+            )
+        ]
+
+        for start in range(0, len(pending), batch_size):
+            cursor.execute('\n'.join(
+                get_deploy_sql(sqlfun_cls, fingerprint)
+                for sqlfun_cls, fingerprint in pending[start:start + batch_size]
+            ))
+
+    return [sqlfun_cls for sqlfun_cls, _ in pending]
+
+
+@dataclass
+class RolloutResult:
+    """The outcome of applying functions to one database"""
+
+    database: str
+    applied: list[type[SqlFun]] = field(default_factory=list)
+    # seconds spent on the database, including failed attempts
+    duration: float = 0.0
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _rollout_to(
+    database: str,
+    sqlfun_classes: Optional[Sequence[type[SqlFun]]],
+    force: bool,
+) -> RolloutResult:
+    result = RolloutResult(database=database)
+    start = time.perf_counter()
+    try:
+        result.applied = apply_definitions(sqlfun_classes, force=force, using=database)
+    except Exception as e:
+        result.error = e
+    finally:
+        result.duration = time.perf_counter() - start
+        # connections are per thread, so the pool's would otherwise linger
+        connections.close_all()
+    return result
+
+
+def rollout(
+    databases: Iterable[str],
+    sqlfun_classes: Optional[Iterable[type[SqlFun]]] = None,
+    *,
+    force: bool = False,
+    workers: Optional[int] = None,
+) -> list[RolloutResult]:
+    """Apply functions to several databases concurrently.
+
+    Each database is updated in its own transaction by ``apply_definitions`` on
+    a pool of at most ``workers`` threads, which defaults to the
+    ``SQLFUN_DEPLOY_WORKERS`` setting. A failure in one database does not stop
+    the others; results are returned in the order of ``databases``.
+    """
+    databases = list(databases)
+    if sqlfun_classes is not None:
+        sqlfun_classes = list(sqlfun_classes)
+    workers = workers or get_setting('DEPLOY_WORKERS')
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(databases)))) as executor:
+        return list(executor.map(
+            lambda database: _rollout_to(database, sqlfun_classes, force), databases
+        ))
+
+
+def load_checkpoint(path: str | os.PathLike, rollout_digest: str) -> set[str]:
+    """Return the schemas a previous run of the same rollout completed"""
+    try:
+        with pathlib.Path(path).open() as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except (OSError, ValueError):
+        return set()
+    # schemas completed with other definitions still need these
+    if checkpoint.get('rollout') != rollout_digest:
+        return set()
+    return set(checkpoint['completed_schemas'])
+
+
+def save_checkpoint(
+    path: str | os.PathLike,
+    rollout_digest: str,
+    completed_schemas: Iterable[str],
+):
+    """Write the checkpoint atomically, so a crash never leaves it half written"""
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        'w', dir=path.parent, suffix='.tmp', delete=False
+    ) as temp_file:
+        json.dump({
+            'rollout': rollout_digest,
+            'completed_schemas': sorted(completed_schemas),
+        }, temp_file)
+    os.replace(temp_file.name, path)
+
+
+def install_in_schemas(
+    schemas: Iterable[str],
+    sqlfun_classes: Optional[Iterable[type[SqlFun]]] = None,
+    *,
+    force: bool = False,
+    chunk_size: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    checkpoint: Optional[str | os.PathLike] = None,
+    using: str = DEFAULT_DB_ALIAS,
+    on_chunk: Optional[Callable[[list[str]], None]] = None,
+) -> list[str]:
+    """Create or update functions in each of several schemas, eg. one per tenant.
+
+    Functions that are not schema qualified are created in every schema. Each
+    chunk of ``chunk_size`` schemas (``SQLFUN_SCHEMA_CHUNK_SIZE`` by default) is
+    committed in its own transaction, with the definitions of all of its schemas
+    sent ``batch_size`` at a time. Functions already deployed as defined, see
+    ``is_deployed``, are skipped unless ``force`` is set.
+
+    With a ``checkpoint`` file, schemas completed by a failed run are skipped
+    when it is run again with the same definitions. The file is removed once
+    every schema is done. Returns the schemas processed by this run.
+    """
+    sqlfun_classes = [
+        sqlfun_cls for sqlfun_cls in get_deployable_classes(sqlfun_classes, using)
+        if sqlfun_cls.get_metadata().schema is None
+    ]
+    fingerprints = get_fingerprints(sqlfun_classes)
+    chunk_size = chunk_size or get_setting('SCHEMA_CHUNK_SIZE')
+    batch_size = batch_size or get_setting('DEPLOY_BATCH_SIZE')
+
+    rollout_digest = get_sql_digest('\n'.join(sorted(
+        f'{sqlfun_cls.get_metadata().signature}:{fingerprint}'
+        for sqlfun_cls, fingerprint in zip(sqlfun_classes, fingerprints)
+    )))
+    completed_schemas = load_checkpoint(checkpoint, rollout_digest) if checkpoint else set()
+    pending_schemas = [
+        schema for schema in dict.fromkeys(schemas) if schema not in completed_schemas
+    ]
+
+    for start in range(0, len(pending_schemas), chunk_size):
+        chunk = pending_schemas[start:start + chunk_size]
+
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            copies = [
+                (schema, sqlfun_cls, fingerprint,
+                 f'{quote_identifier(schema)}.{sqlfun_cls.get_metadata().signature}')
+                for schema in chunk
+                for sqlfun_cls, fingerprint in zip(sqlfun_classes, fingerprints)
+            ]
+            deployed_functions = {} if force else get_deployed_functions(
+                cursor, (signature for *_, signature in copies)
+            )
+            statements = [
+                get_deploy_sql(sqlfun_cls, fingerprint, schema)
+                for schema, sqlfun_cls, fingerprint, signature in copies
+                if not is_deployed(
+                    sqlfun_cls,
+                    fingerprint,
+                    deployed_functions.get(signature),
+                    SCHEMA_FINGERPRINT_PREFIX,
+                )
+            ]
+            for batch_start in range(0, len(statements), batch_size):
+                cursor.execute('\n'.join(statements[batch_start:batch_start + batch_size]))
+
+        completed_schemas.update(chunk)
+        if checkpoint:
+            save_checkpoint(checkpoint, rollout_digest, completed_schemas)
+        if on_chunk:
+            on_chunk(chunk)
+
+    if checkpoint:
+        pathlib.Path(checkpoint).unlink(missing_ok=True)
+
+    return pending_schemas
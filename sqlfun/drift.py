@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import Optional
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from sqlfun.core import SqlFun, get_registry_by_function_name
+from sqlfun.deploy import (
+    FINGERPRINT_PREFIX,
+    PARALLEL_CODES,
+    VOLATILITY_CODES,
+    get_catalog_key,
+    get_fingerprints,
+    get_source_hash,
+)
+from sqlfun.metadata import split_qualified_name
+from sqlfun.state import get_state
+
+# registered signatures are resolved by postgres itself, so type aliases like
+# int and integer match. Functions sharing a name with a registered or
+# migrated function, or stamped by sqlfun, are also returned so leftovers can
+# be reported.
+_CATALOG_SQL = """
+    WITH registered AS (
+        SELECT signature, to_regprocedure(signature)::oid AS oid
+        FROM unnest(%s::text[]) AS signature
+    )
+    SELECT r.signature, n.nspname, p.proname, pg_function_is_visible(p.oid),
+           oidvectortypes(p.proargtypes), md5(p.prosrc), p.provolatile,
+           p.proparallel, l.lanname, d.description
+    FROM registered r
+    FULL JOIN (
+        pg_proc p
+        JOIN pg_namespace n ON n.oid = p.pronamespace
+        JOIN pg_language l ON l.oid = p.prolang
+        LEFT JOIN pg_description d
+            ON d.objoid = p.oid
+            AND d.classoid = 'pg_proc'::regclass
+            AND d.objsubid = 0
+    ) ON p.oid = r.oid
+    WHERE r.signature IS NOT NULL
+        OR p.proname = ANY(%s)
+        OR d.description LIKE %s
+"""
+
+
+@dataclass
+class DriftReport:
+    """Differences between the registered functions and those in ``pg_proc``"""
+
+    database: str
+    # signatures of registered functions that are not deployed
+    missing: list[str] = field(default_factory=list)
+    # signatures of deployed functions whose definition differs from the registry
+    stale: list[str] = field(default_factory=list)
+    # signatures of deployed functions sqlfun manages, or migrated before, but
+    # are not registered
+    extra: list[str] = field(default_factory=list)
+
+    @property
+    def has_drift(self) -> bool:
+        return bool(self.missing or self.stale or self.extra)
+
+
+def is_stale(
+    sqlfun_cls: type[SqlFun],
+    fingerprint: str,
+    source_hash: str,
+    volatility: str,
+    parallel: str,
+    language: str,
+    comment: Optional[str],
+) -> bool:
+    metadata = sqlfun_cls.get_metadata()
+
+    if (expected_hash := get_source_hash(sqlfun_cls)) is not None:
+        if source_hash != expected_hash:
+            return True
+    # bodies sqlfun can't extract, eg. BEGIN ATOMIC, are compared by fingerprint
+    elif comment and comment.startswith(FINGERPRINT_PREFIX):
+        if comment.removeprefix(FINGERPRINT_PREFIX) != fingerprint:
+            return True
+
+    if metadata.language and metadata.language != language:
+        return True
+
+    return (
+        VOLATILITY_CODES[metadata.volatility or 'volatile'] != volatility
+        or PARALLEL_CODES[metadata.parallel or 'unsafe'] != parallel
+    )
+
+
+def get_unregistered_keys(offline: Optional[bool] = None) -> set[tuple[Optional[str], str]]:
+    """Return the catalog keys of the functions migrated before that are no longer registered.
+
+    They come from the last known definitions, see ``get_state``, so functions
+    removed from the registry whose migrations created them are still known.
+    """
+    registered_names = get_registry_by_function_name().keys()
+    return {
+        split_qualified_name(function_name)
+        for function_name in get_state(offline=offline).get_function_names()
+        if function_name not in registered_names
+    }
+
+
+def detect_drift(
+    sqlfun_classes: Optional[Iterable[type[SqlFun]]] = None,
+    *,
+    using: str = DEFAULT_DB_ALIAS,
+    offline: Optional[bool] = None,
+) -> DriftReport:
+    """Compare functions with their deployed definitions using one catalog query.
+
+    Functions that are deployed but no longer registered are reported when
+    sqlfun stamped them, when they share a name with one of the functions, or
+    when migrations created them, according to the state ``offline`` selects.
+    """
+    if sqlfun_classes is None:
+        sqlfun_classes = get_registry_by_function_name().values()
+
+    sqlfun_classes = list(sqlfun_classes)
+    by_signature = {
+        sqlfun_cls.get_metadata().signature: (sqlfun_cls, fingerprint)
+        for sqlfun_cls, fingerprint in zip(sqlfun_classes, get_fingerprints(sqlfun_classes))
+    }
+    catalog_keys = {get_catalog_key(sqlfun_cls) for sqlfun_cls in sqlfun_classes}
+    catalog_keys |= get_unregistered_keys(offline)
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(_CATALOG_SQL, [
+            list(by_signature),
+            sorted({name for _, name in catalog_keys}),
+            f'{FINGERPRINT_PREFIX}%',
+        ])
+        rows = cursor.fetchall()
+
+    report = DriftReport(database=using)
+
+    for (
+        signature, schema, name, is_visible, argument_types,
+        source_hash, volatility, parallel, language, comment,
+    ) in rows:
+        if signature is not None:
+            if name is None:
+                report.missing.append(signature)
+            elif is_stale(
+                *by_signature[signature], source_hash, volatility, parallel, language, comment
+            ):
+                report.stale.append(signature)
+            continue
+
+        # overloads left behind by a signature change, or migrated or stamped
+        # functions whose class was removed
+        is_registered_name = (schema, name) in catalog_keys or (
+            is_visible and (None, name) in catalog_keys
+        )
+        if is_registered_name or (comment or '').startswith(FINGERPRINT_PREFIX):
+            report.extra.append(f'{schema}.{name}({argument_types})')
+
+    report.missing.sort()
+    report.stale.sort()
+    report.extra.sort()
+    return report
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from collections import Counter
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Optional
+
+import sqlparse
+from django.db.models.expressions import Col, Value
+from sqlparse import tokens as T
+
+from sqlfun.metadata import FunctionMetadata, unquote_identifier
+
+# keywords that make a SELECT more than a single expression
+_CLAUSE_KEYWORDS = frozenset((
+    'as', 'distinct', 'except', 'fetch', 'for', 'from', 'group by', 'having',
+    'intersect', 'into', 'limit', 'offset', 'order by', 'union', 'where', 'window',
+))
+# argument types postgres resolves per call, which a cast can't express
+_UNCASTABLE_TYPE_PREFIXES = ('any', 'record', 'internal', 'void', 'trigger')
+
+
+@dataclass(frozen=True)
+class InlineTemplate:
+    """A function body split into SQL text and references to its arguments"""
+
+    # SQL text, with ``%`` escaped, and indexes of the arguments between them
+    parts: tuple[str | int, ...]
+    argument_types: tuple[str, ...]
+    return_type: str
+
+    @property
+    def repeated_arguments(self) -> frozenset[int]:
+        counts = Counter(part for part in self.parts if isinstance(part, int))
+        return frozenset(index for index, count in counts.items() if count > 1)
+
+    def render(self, compiler, connection, expressions: Sequence) -> Optional[tuple[str, list]]:
+        """Return the body with the compiled arguments substituted.
+
+        Returns ``None`` if the call can't be inlined, ie. when the arguments
+        don't match the function's or an argument used more than once is not a
+        plain column or value, which must not be evaluated more than once.
+        """
+        if len(expressions) != len(self.argument_types):
+            return None
+        if any(
+            not isinstance(expressions[index], (Col, Value))
+            for index in self.repeated_arguments
+        ):
+            return None
+
+        compiled_arguments = [compiler.compile(expression) for expression in expressions]
+        sql_parts = []
+        params = []
+
+        for part in self.parts:
+            if isinstance(part, int):
+                argument_sql, argument_params = compiled_arguments[part]
+                sql_parts.append(f'CAST(({argument_sql}) AS {self.argument_types[part]})')
+                params.extend(argument_params)
+            else:
+                sql_parts.append(part)
+
+        return f'CAST(({"".join(sql_parts).strip()}) AS {self.return_type})', params
+
+
+def _is_inlinable_function(metadata: FunctionMetadata) -> bool:
+    return (
+        metadata.language == 'sql'
+        and metadata.body is not None
+        and metadata.return_type is not None
+        and not metadata.returns_set
+        and not metadata.strict
+        and not metadata.security_definer
+        and not metadata.sets_configuration
+        and all(
+            argument.mode == 'in' and not argument.has_default
+            for argument in metadata.arguments
+        )
+        and not any(
+            sql_type.lower().startswith(_UNCASTABLE_TYPE_PREFIXES) or '%' in sql_type
+            for sql_type in (*metadata.argument_types, metadata.return_type)
+        )
+    )
+
+
+def _find_significant(tokens: list, start: int, step: int):
+    """Return the first token from ``start`` on, in direction ``step``, that isn't whitespace"""
+    index = start
+    while 0 <= index < len(tokens):
+        if not tokens[index].is_whitespace:
+            return tokens[index]
+        index += step
+    return None
+
+
+def compile_inline_template(metadata: FunctionMetadata) -> Optional[InlineTemplate]:
+    """Split the body of a function into an ``InlineTemplate``.
+
+    Only ``LANGUAGE sql`` functions whose body is a single ``SELECT <expression>``
+    can be inlined, and only if inlining can't change what they return, eg.
+    ``STRICT`` or ``SECURITY DEFINER`` functions can't. Returns ``None`` for
+    anything else.
+    """
+    if not _is_inlinable_function(metadata):
+        return None
+
+    body = sqlparse.format(metadata.body, strip_comments=True).strip().rstrip(';')
+    statements = [statement for statement in sqlparse.parse(body) if str(statement).strip()]
+    if len(statements) != 1 or statements[0].get_type() != 'SELECT':
+        return None
+
+    tokens = list(statements[0].flatten())
+    select_index = next(index for index, token in enumerate(tokens) if token.ttype is T.DML)
+    tokens = tokens[select_index + 1:]
+    input_arguments = [argument for argument in metadata.arguments if argument.is_input]
+    argument_indexes = {
+        unquote_identifier(argument.name): index
+        for index, argument in enumerate(input_arguments)
+        if argument.name
+    }
+
+    parts = []
+    depth = 0
+
+    for index, token in enumerate(tokens):
+        value = token.value
+
+        # columns of a subquery could shadow the arguments
+        if token.ttype is T.DML:
+            return None
+        if token.ttype is T.Punctuation:
+            if value == '(':
+                depth += 1
+            elif value == ')':
+                depth -= 1
+            elif value == ',' and depth == 0:
+                return None
+        elif (
+            depth == 0
+            and token.is_keyword
+            and ' '.join(value.lower().split()) in _CLAUSE_KEYWORDS
+        ):
+            return None
+
+        if token.ttype is T.Name.Placeholder:
+            if not value[1:].isdigit() or not 0 < int(value[1:]) <= len(input_arguments):
+                return None
+            parts.append(int(value[1:]) - 1)
+            continue
+
+        is_argument = (
+            (token.ttype in T.Name or token.is_keyword)
+            and unquote_identifier(value) in argument_indexes
+        )
+        if is_argument:
+            previous = _find_significant(tokens, index - 1, -1)
+            following = _find_significant(tokens, index + 1, 1)
+            # qualified references, eg. fn.arg or arg.field, are not worth resolving
+            if '.' in (getattr(previous, 'value', None), getattr(following, 'value', None)):
+                return None
+            # a function that happens to share the name of an argument
+            is_argument = getattr(following, 'value', None) != '('
+
+        if is_argument:
+            parts.append(argument_indexes[unquote_identifier(value)])
+        elif parts and isinstance(parts[-1], str):
+            parts[-1] += value.replace('%', '%%')
+        else:
+            parts.append(value.replace('%', '%%'))
+
+    if not any(isinstance(part, int) or part.strip() for part in parts):
+        return None
+
+    return InlineTemplate(
+        parts=tuple(parts),
+        argument_types=metadata.argument_types,
+        return_type=metadata.return_type,
+    )
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from sqlfun.conf import get_setting
+
+if TYPE_CHECKING:
+    from sqlfun.core import SqlFun
+
+_QUERY_TAG_RE = re.compile(r'/\* sqlfun:(\S+) \*/')
+
+# functions compiled since the last query executed while a collector is active
+_compiled_functions: ContextVar[Optional[set[str]]] = ContextVar(
+    'sqlfun_compiled_functions', default=None
+)
+
+# the SQLFUN_QUERY_TAGS setting, read on the first compile and whenever it changes
+_query_tags: Optional[bool] = None
+
+
+def is_tagging_queries() -> bool:
+    global _query_tags
+    if _query_tags is None:
+        _query_tags = bool(get_setting('QUERY_TAGS'))
+    return _query_tags
+
+
+@receiver(setting_changed)
+def _reset_query_tags(setting, **kwargs):
+    global _query_tags
+    if setting == 'SQLFUN_QUERY_TAGS':
+        _query_tags = None
+
+
+def get_query_tag(function_name: str) -> str:
+    # a quoted identifier could contain the end of the comment
+    return f'/* sqlfun:{function_name.replace("*/", "").replace(" ", "")} */'
+
+
+def track_compiled(sqlfun_cls: type[SqlFun], sql: str) -> str:
+    """Record that a function was compiled into a query, and tag its SQL.
+
+    The SQL is prefixed with a comment naming the function when the
+    ``SQLFUN_QUERY_TAGS`` setting is enabled.
+    """
+    compiled_functions = _compiled_functions.get()
+    is_tagging = is_tagging_queries()
+    # compiling queries is hot, so nothing else happens unless it is needed
+    if compiled_functions is None and not is_tagging:
+        return sql
+
+    function_name = sqlfun_cls.get_qualified_name()
+    if compiled_functions is not None:
+        compiled_functions.add(function_name)
+    if is_tagging:
+        return f'{get_query_tag(function_name)} {sql}'
+    return sql
+
+
+def get_tagged_functions(sql: str) -> set[str]:
+    return set(_QUERY_TAG_RE.findall(sql))
+
+
+@dataclass
+class QueryStats:
+    """Sampled queries using a function, and the time they took in seconds"""
+
+    queries: int = 0
+    duration: float = 0.0
+    rows: int = 0
+
+
+class QueryCollector:
+    """An execute wrapper aggregating query time and rows per function.
+
+    Queries are attributed to the functions tagged in their SQL, see
+    ``SQLFUN_QUERY_TAGS``, and inside ``collect()`` also to the functions
+    compiled since the previous query. Only a ``sample_rate`` fraction of
+    queries is measured, ``SQLFUN_QUERY_SAMPLE_RATE`` by default; the other
+    queries only pay for drawing a random number.
+    """
+
+    def __init__(self, sample_rate: Optional[float] = None):
+        self.sample_rate = get_setting('QUERY_SAMPLE_RATE') if sample_rate is None else sample_rate
+        self.stats: dict[str, QueryStats] = defaultdict(QueryStats)
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        compiled_functions = _compiled_functions.get()
+        if compiled_functions:
+            function_names = set(compiled_functions)
+            compiled_functions.clear()
+        else:
+            function_names = set()
+
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return execute(sql, params, many, context)
+
+        function_names.update(get_tagged_functions(sql))
+        if not function_names:
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            rows = max(getattr(context.get('cursor'), 'rowcount', 0) or 0, 0)
+            with self._lock:
+                for function_name in function_names:
+                    stats = self.stats[function_name]
+                    stats.queries += 1
+                    stats.duration += duration
+                    stats.rows += rows
+
+    def reset(self) -> dict[str, QueryStats]:
+        """Return the statistics collected so far and start over"""
+        with self._lock:
+            stats, self.stats = dict(self.stats), defaultdict(QueryStats)
+        return stats
+
+    @contextmanager
+    def collect(self, databases: Iterable[str] = (DEFAULT_DB_ALIAS,)) -> Iterator[QueryCollector]:
+        """Collect the queries run on the given databases in this thread"""
+        token = _compiled_functions.set(set())
+        try:
+            with ExitStack() as stack:
+                for database in databases:
+                    stack.enter_context(connections[database].execute_wrapper(self))
+                yield self
+        finally:
+            _compiled_functions.reset(token)
+
+    def _add_to_connection(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self):
+        """Collect the queries of every connection, in every thread, from now on.
+
+        Queries are then only attributed through their tags, so enable
+        ``SQLFUN_QUERY_TAGS`` too.
+        """
+        connection_created.connect(self._add_to_connection, weak=False)
+        for connection in connections.all(initialized_only=True):
+            self._add_to_connection(connection)
+
+    def uninstall(self):
+        connection_created.disconnect(self._add_to_connection)
+        for connection in connections.all(initialized_only=True):
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
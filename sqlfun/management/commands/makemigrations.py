@@ -4,10 +4,37 @@ import django
 from django.core.management.base import CommandError
 from django.core.management.commands.makemigrations import Command as BaseCommand
 
+from sqlfun.dependencies import add_function_dependencies
 from sqlfun.utils import make_sqlfun_migrations
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--sqlfun-workers',
+            type=int,
+            default=None,
+            help=(
+                'Number of processes used to normalize sqlfun functions missing '
+                'from the normalization cache. Use 0 for one per CPU core. '
+                'Defaults to the SQLFUN_NORMALIZATION_WORKERS setting.'
+            ),
+        )
+        parser.add_argument(
+            '--sqlfun-offline',
+            action='store_true',
+            default=None,
+            help=(
+                'Detect sqlfun function changes from the migration files instead '
+                'of the SqlFunDefinition table, without a database connection. '
+                'The SqlFunDefinition table is not updated, so once a project '
+                'makes sqlfun migrations offline it should not switch back: a '
+                'later run without this option reports every function changed '
+                "since as new. Defaults to SQLFUN_STATE_SOURCE == 'migrations'."
+            ),
+        )
+
     def handle(self, *args, **options):
         is_check = options.get('check_changes', False)
         # Django only sets its internal self.dry_run when --check is passed,
@@ -21,6 +48,8 @@ class Command(BaseCommand):
                 app_labels=args or None,
                 stdout=self.stdout,
                 is_dry_run=is_dry_run,
+                workers=options.get('sqlfun_workers'),
+                offline=options.get('sqlfun_offline'),
             )
         except django.db.utils.ProgrammingError as e:
             if is_check:
@@ -62,3 +91,8 @@ class Command(BaseCommand):
             sys.exit(1)
 
         return result
+
+    def write_migration_files(self, changes, *args, **kwargs):
+        # sqlfun migrations are written first, so they can be depended on here
+        add_function_dependencies(changes)
+        return super().write_migration_files(changes, *args, **kwargs)
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from sqlfun.deploy import rollout
+
+
+class Command(BaseCommand):
+    help = (
+        'Create or update the registered sqlfun functions in one or more '
+        'databases, skipping functions that are already up to date.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            action='append',
+            dest='databases',
+            help='Database alias to apply functions to. Can be repeated. Defaults to "default".',
+        )
+        parser.add_argument(
+            '--all-databases',
+            action='store_true',
+            help='Apply functions to every database in the DATABASES setting.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help=(
+                'Number of databases updated concurrently. '
+                'Defaults to the SQLFUN_DEPLOY_WORKERS setting.'
+            ),
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Apply every function, even those that are already up to date.',
+        )
+
+    def handle(self, *args, **options):
+        if options['all_databases']:
+            databases = list(settings.DATABASES)
+        else:
+            databases = options['databases'] or [DEFAULT_DB_ALIAS]
+
+        results = rollout(databases, force=options['force'], workers=options['workers'])
+
+        for result in results:
+            if result.ok:
+                self.stdout.write(
+                    f'[sqlfun] {result.database}: applied {len(result.applied)} '
+                    f'function(s) in {result.duration:.2f}s'
+                )
+                if options['verbosity'] > 1:
+                    for sqlfun_cls in result.applied:
+                        self.stdout.write(f'  {sqlfun_cls.get_metadata().signature}')
+            else:
+                self.stderr.write(
+                    f'[sqlfun] {result.database}: failed after {result.duration:.2f}s: '
+                    f'{result.error}'
+                )
+
+        if failed := [result.database for result in results if not result.ok]:
+            raise CommandError(f'[sqlfun] Could not apply functions to: {", ".join(failed)}')
@@ -0,0 +1,104 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from sqlfun.compare import compare_definitions, get_changed_definitions
+from sqlfun.conf import get_setting
+
+
+def format_change(change: float) -> str:
+    return f'{change:+.0%}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the previous and current definitions of changed sqlfun functions '
+        'against their samples, in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'app_label',
+            nargs='*',
+            help='Only compare the functions of these apps.',
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Database alias to run the comparison on. Defaults to "default".',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=None,
+            help=(
+                'Runs of each sample per definition. Defaults to the '
+                'SQLFUN_COMPARE_ITERATIONS setting.'
+            ),
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=None,
+            help=(
+                'Fail if a function gets slower or costlier by more than this '
+                'fraction, eg. 0.2 for 20%%. Defaults to the '
+                'SQLFUN_COMPARE_THRESHOLD setting.'
+            ),
+        )
+        parser.add_argument(
+            '--sqlfun-offline',
+            action='store_true',
+            default=None,
+            help='Read the previous definitions from the migration files.',
+        )
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        if threshold is None:
+            threshold = get_setting('COMPARE_THRESHOLD')
+        changed_definitions = get_changed_definitions(
+            options['app_label'] or None,
+            offline=options['sqlfun_offline'],
+        )
+
+        if not changed_definitions:
+            self.stdout.write('[sqlfun] No changed functions to compare.')
+            return
+
+        regressions = []
+        for sqlfun_cls, previous_sql in changed_definitions.items():
+            function_name = sqlfun_cls.get_metadata().qualified_name
+            if sqlfun_cls.sample_arguments is None and sqlfun_cls.sample_query is None:
+                self.stdout.write(
+                    f'[sqlfun] {function_name}: skipped, no sample_arguments or sample_query'
+                )
+                continue
+
+            try:
+                comparison = compare_definitions(
+                    sqlfun_cls,
+                    previous_sql,
+                    iterations=options['iterations'],
+                    using=options['database'],
+                )
+            except ValueError as e:
+                self.stderr.write(f'[sqlfun] {function_name}: skipped. {e}')
+                continue
+            previous, current = comparison.previous, comparison.current
+            self.stdout.write(
+                f'[sqlfun] {function_name}: '
+                f'p50 {previous.p50 * 1000:.3f}ms -> {current.p50 * 1000:.3f}ms '
+                f'({format_change(comparison.latency_change)}), '
+                f'p95 {previous.p95 * 1000:.3f}ms -> {current.p95 * 1000:.3f}ms, '
+                f'p99 {previous.p99 * 1000:.3f}ms -> {current.p99 * 1000:.3f}ms, '
+                f'cost {previous.cost:.2f} -> {current.cost:.2f} '
+                f'({format_change(comparison.cost_change)})'
+            )
+            if comparison.is_regression(threshold):
+                regressions.append(function_name)
+
+        if regressions:
+            raise CommandError(
+                f'[sqlfun] {len(regressions)} function(s) regressed by more than '
+                f'{threshold:.0%}: {", ".join(regressions)}'
+            )
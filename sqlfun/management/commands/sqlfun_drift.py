@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from sqlfun.drift import detect_drift
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the registered sqlfun functions with the functions deployed in '
+        'the database, and exit with a non-zero status if they differ.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            action='append',
+            dest='databases',
+            help='Database alias to check. Can be repeated. Defaults to "default".',
+        )
+
+    def handle(self, *args, **options):
+        has_drift = False
+
+        for database in options['databases'] or [DEFAULT_DB_ALIAS]:
+            report = detect_drift(using=database)
+            has_drift = has_drift or report.has_drift
+
+            for status, signatures in (
+                ('missing', report.missing),
+                ('stale', report.stale),
+                ('extra', report.extra),
+            ):
+                for signature in signatures:
+                    self.stderr.write(f'[sqlfun] {database}: {status} {signature}')
+
+            if not report.has_drift and options['verbosity'] > 0:
+                self.stdout.write(f'[sqlfun] {database}: no drift')
+
+        if has_drift:
+            sys.exit(1)
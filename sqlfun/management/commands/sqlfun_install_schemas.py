@@ -0,0 +1,86 @@
+import pathlib
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from sqlfun.deploy import install_in_schemas
+
+
+class Command(BaseCommand):
+    help = (
+        'Create or update the registered sqlfun functions that are not schema '
+        'qualified in each of the given schemas, eg. one per tenant.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('schemas', nargs='*', help='Schemas to install functions into.')
+        parser.add_argument(
+            '--schemas-file',
+            type=pathlib.Path,
+            help='File listing schemas to install functions into, one per line.',
+        )
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Database alias to install functions into. Defaults to "default".',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help=(
+                'Number of schemas committed per transaction. '
+                'Defaults to the SQLFUN_SCHEMA_CHUNK_SIZE setting.'
+            ),
+        )
+        parser.add_argument(
+            '--checkpoint',
+            type=pathlib.Path,
+            help=(
+                'File recording the schemas already completed, so an interrupted '
+                'run resumes where it stopped.'
+            ),
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Apply every function, even those that are already up to date.',
+        )
+
+    def handle(self, *args, **options):
+        schemas = list(options['schemas'])
+        if options['schemas_file']:
+            schemas.extend(
+                line.strip()
+                for line in options['schemas_file'].read_text().splitlines()
+                if line.strip()
+            )
+        if not schemas:
+            raise CommandError('[sqlfun] No schemas given.')
+
+        completed = 0
+
+        def report_progress(chunk):
+            nonlocal completed
+            completed += len(chunk)
+            if options['verbosity'] > 0:
+                self.stdout.write(f'[sqlfun] Installed functions in {completed} schema(s)')
+
+        try:
+            install_in_schemas(
+                schemas,
+                force=options['force'],
+                chunk_size=options['chunk_size'],
+                checkpoint=options['checkpoint'],
+                using=options['database'],
+                on_chunk=report_progress,
+            )
+        except Exception as e:
+            resume_hint = (
+                ' Run the command again with the same --checkpoint to resume.'
+                if options['checkpoint'] else ''
+            )
+            raise CommandError(
+                f'[sqlfun] Could not install functions after {completed} schema(s): '
+                f'{e}.{resume_hint}'
+            ) from e
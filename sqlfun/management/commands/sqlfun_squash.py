@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sqlfun.squash import squash_sqlfun_migrations
+
+
+class Command(BaseCommand):
+    help = (
+        'Squash a range of sqlfun migrations into one that only creates the '
+        'latest definition of each function.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label', help='App label of the migrations to squash.')
+        parser.add_argument(
+            'start_migration_name',
+            nargs='?',
+            help='Migration to start squashing from. Defaults to the first one.',
+        )
+        parser.add_argument('migration_name', help='Migration to squash up to, included.')
+        parser.add_argument(
+            '--squashed-name',
+            help='Name of the squashed migration, after its number.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report the saving without writing the squashed migration.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            result = squash_sqlfun_migrations(
+                options['app_label'],
+                options['start_migration_name'],
+                options['migration_name'],
+                squashed_name=options['squashed_name'],
+                is_dry_run=options['dry_run'],
+            )
+        except (KeyError, ValueError) as e:
+            raise CommandError(f'[sqlfun] {e}') from e
+
+        verb = 'Would write' if options['dry_run'] else 'Wrote'
+        replaced = len(result.migration.replaces)
+        self.stdout.write(
+            f'[sqlfun] {verb} {result.path}, replacing {replaced} migration(s).'
+        )
+        self.stdout.write(
+            f'[sqlfun] Statements run on a fresh database: '
+            f'{result.original_statements} -> {result.squashed_statements} '
+            f'({result.original_statements - result.squashed_statements} fewer).'
+        )
@@ -0,0 +1,113 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from sqlfun.stats import get_sink, take_snapshot
+
+SORT_KEYS = {
+    'total': lambda stats: stats.total_time,
+    'self': lambda stats: stats.self_time,
+    'calls': lambda stats: stats.calls,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Report the calls and time spent in each sqlfun function, from '
+        'pg_stat_user_functions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database',
+            default=DEFAULT_DB_ALIAS,
+            help='Database alias to read statistics from. Defaults to "default".',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=None,
+            help=(
+                'Take a snapshot every INTERVAL seconds and report what changed '
+                'since the previous one, instead of the cumulative statistics.'
+            ),
+        )
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=None,
+            help='Number of intervals to report before exiting. Defaults to no limit.',
+        )
+        parser.add_argument(
+            '--sort',
+            choices=sorted(SORT_KEYS),
+            default='total',
+            help='Order functions by total time, self time, or calls.',
+        )
+        parser.add_argument(
+            '--by-app',
+            action='store_true',
+            help='Sum the statistics per app instead of listing functions.',
+        )
+        parser.add_argument(
+            '--sink',
+            default=None,
+            help=(
+                'Dotted path to a callable every snapshot is exported to. '
+                'Defaults to the SQLFUN_STATS_SINK setting.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        sink = get_sink(options['sink'])
+        snapshot = take_snapshot(using=options['database'])
+
+        if snapshot.track_functions == 'none':
+            self.stderr.write(
+                "[sqlfun] track_functions is 'none', so no function calls are "
+                "counted. Set it to 'all' (or 'pl' to skip LANGUAGE sql functions)."
+            )
+
+        if options['interval'] is None:
+            self.report(snapshot, options)
+            if sink:
+                sink(snapshot)
+            return
+
+        reported = 0
+        while options['count'] is None or reported < options['count']:
+            time.sleep(options['interval'])
+            previous, snapshot = snapshot, take_snapshot(using=options['database'])
+            delta = snapshot - previous
+            self.report(delta, options)
+            if sink:
+                sink(delta)
+            reported += 1
+
+    def report(self, snapshot, options):
+        period = f' since {snapshot.since:%H:%M:%S}' if snapshot.since else ''
+        self.stdout.write(
+            f'[sqlfun] {snapshot.database} at {snapshot.taken_at:%H:%M:%S}{period}'
+        )
+        self.stdout.write(f'{"calls":>12} {"total ms":>14} {"self ms":>14}  function')
+
+        if options['by_app']:
+            rows = [
+                (calls, total_time, self_time, str(app_label))
+                for app_label, (calls, total_time, self_time) in snapshot.by_app().items()
+            ]
+            index = {'calls': 0, 'total': 1, 'self': 2}[options['sort']]
+            rows.sort(key=lambda row: row[index], reverse=True)
+        else:
+            rows = [
+                (stats.calls, stats.total_time, stats.self_time, signature)
+                for signature, stats in sorted(
+                    snapshot.functions.items(),
+                    key=lambda item: SORT_KEYS[options['sort']](item[1]),
+                    reverse=True,
+                )
+            ]
+
+        for calls, total_time, self_time, label in rows:
+            self.stdout.write(f'{calls:>12} {total_time:>14.3f} {self_time:>14.3f}  {label}')
@@ -0,0 +1,363 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlparse import lexer
+from sqlparse import tokens as T
+
+_FUNCTION_HEADER_RE = re.compile(
+    r'CREATE\s+(?:OR\s+REPLACE\s+)?FUNCTION\s+'
+    r'(?:(?P<schema>"[^"]+"|\w+)\s*\.\s*)?(?P<name>"[^"]+"|\w+)\s*\(',
+    re.IGNORECASE,
+)
+_QUALIFIED_NAME_RE = re.compile(r'(?:(?P<schema>"[^"]+"|\w+)\s*\.\s*)?(?P<name>"[^"]+"|\w+)')
+_DOLLAR_QUOTE_RE = re.compile(r'\$(\w*)\$')
+_SINGLE_QUOTED_BODY_RE = re.compile(r"\bAS\s+'((?:[^']|'')*)'", re.IGNORECASE)
+_LANGUAGE_RE = re.compile(r"\bLANGUAGE\s+'?(\w+)'?", re.IGNORECASE)
+_VOLATILITY_RE = re.compile(r'\b(IMMUTABLE|STABLE|VOLATILE)\b', re.IGNORECASE)
+_PARALLEL_RE = re.compile(r'\bPARALLEL\s+(SAFE|RESTRICTED|UNSAFE)\b', re.IGNORECASE)
+_COST_RE = re.compile(r'\bCOST\s+(\d+(?:\.\d*)?)', re.IGNORECASE)
+_ROWS_RE = re.compile(r'\bROWS\s+(\d+(?:\.\d*)?)', re.IGNORECASE)
+_LEAKPROOF_RE = re.compile(r'\b(NOT\s+)?LEAKPROOF\b', re.IGNORECASE)
+_STRICT_RE = re.compile(r'\b(?:STRICT|RETURNS\s+NULL\s+ON\s+NULL\s+INPUT)\b', re.IGNORECASE)
+_SECURITY_DEFINER_RE = re.compile(r'\bSECURITY\s+DEFINER\b', re.IGNORECASE)
+_SET_RE = re.compile(r'\bSET\s+\w', re.IGNORECASE)
+# the return type directly follows the argument list
+_RETURNS_RE = re.compile(r'\s*RETURNS\s+', re.IGNORECASE)
+_RETURNS_END_RE = re.compile(
+    r'\s*(?:\b(?:AS|LANGUAGE|TRANSFORM|WINDOW|IMMUTABLE|STABLE|VOLATILE|NOT|'
+    r'LEAKPROOF|CALLED|STRICT|RETURNS|SECURITY|EXTERNAL|PARALLEL|COST|ROWS|'
+    r'SUPPORT|SET|BEGIN|RETURN)\b|;|$)',
+    re.IGNORECASE,
+)
+_DEFAULT_RE = re.compile(r'\s+DEFAULT\s+|\s*=\s*', re.IGNORECASE)
+
+_ARGUMENT_MODES = frozenset(('in', 'out', 'inout', 'variadic'))
+# second words that continue a multi-word type name rather than follow an
+# argument name, eg. "double precision" or "timestamp with time zone"
+_TYPE_CONTINUATIONS = frozenset((
+    'precision', 'varying', 'with', 'without', 'zone', 'to',
+    'year', 'month', 'day', 'hour', 'minute', 'second',
+))
+VOLATILITIES = ('immutable', 'stable', 'volatile')
+PARALLEL_SAFETIES = ('safe', 'restricted', 'unsafe')
+
+
+def unquote_identifier(identifier: str) -> str:
+    """Return an identifier as stored in the catalog, eg. in ``pg_proc.proname``"""
+    if identifier.startswith('"'):
+        return identifier[1:-1].replace('""', '"')
+    return identifier.lower()
+
+
+def quote_identifier(identifier: str) -> str:
+    """Quote a name as stored in the catalog so it can be used in SQL"""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def split_qualified_name(qualified_name: str) -> tuple[Optional[str], str]:
+    """Return the schema, or ``None``, and name of a function as stored in the catalog"""
+    if not (match := _QUALIFIED_NAME_RE.fullmatch(qualified_name.strip())):
+        raise ValueError(f'{qualified_name!r} is not a function name.')
+    schema = match.group('schema')
+    return unquote_identifier(schema) if schema else None, unquote_identifier(match.group('name'))
+
+
+@dataclass(frozen=True, slots=True)
+class FunctionArgument:
+    name: Optional[str]
+    type: str
+    mode: str = 'in'
+    has_default: bool = False
+
+    @property
+    def is_input(self) -> bool:
+        return self.mode != 'out'
+
+
+@dataclass(frozen=True, slots=True)
+class FunctionMetadata:
+    """The parts of a ``CREATE FUNCTION`` statement that sqlfun cares about."""
+
+    name: str
+    schema: Optional[str]
+    arguments: tuple[FunctionArgument, ...]
+    return_type: Optional[str]
+    language: Optional[str]
+    volatility: Optional[str]
+    # the source between the quotes of ``AS``, as stored in ``pg_proc.prosrc``
+    body: Optional[str] = None
+    parallel: Optional[str] = None
+    cost: Optional[float] = None
+    rows: Optional[float] = None
+    leakproof: Optional[bool] = None
+    strict: bool = False
+    security_definer: bool = False
+    # whether the function sets configuration parameters, eg. SET search_path
+    sets_configuration: bool = False
+
+    @property
+    def returns_set(self) -> bool:
+        return bool(self.return_type) and self.return_type.lower().startswith(('setof', 'table'))
+
+    @property
+    def table_columns(self) -> tuple[str, ...]:
+        """The names of the columns of a ``RETURNS TABLE`` function, or of its OUT arguments"""
+        if self.return_type and self.return_type.lower().startswith('table'):
+            columns = _split_top_level(self.return_type[self.return_type.find('(') + 1:-1])
+            return tuple(_parse_argument(column).name for column in columns)
+        return tuple(arg.name for arg in self.arguments if arg.mode in ('out', 'inout') and arg.name)
+
+    @property
+    def qualified_name(self) -> str:
+        if self.schema:
+            return f'{self.schema}.{self.name}'
+        return self.name
+
+    @property
+    def argument_types(self) -> tuple[str, ...]:
+        return tuple(arg.type for arg in self.arguments if arg.is_input)
+
+    @property
+    def signature(self) -> str:
+        """The name and input argument types identifying the function, eg. for DROP"""
+        return f'{self.qualified_name}({", ".join(self.argument_types)})'
+
+
+def _find_closing_paren(sql: str, start: int) -> int:
+    """Return the index of the parenthesis closing the one opened before ``start``"""
+    depth = 1
+    quote = None
+
+    for index in range(start, len(sql)):
+        char = sql[index]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return index
+
+    raise ValueError('Could not find the end of the argument list in SQL definition.')
+
+
+def _split_top_level(text: str) -> list[str]:
+    parts = []
+    depth = 0
+    quote = None
+    current = []
+
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+
+    parts.append(''.join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _parse_argument(text: str) -> FunctionArgument:
+    text, *default = _DEFAULT_RE.split(text, maxsplit=1)
+    tokens = text.split(None, 1)
+    mode = 'in'
+
+    if len(tokens) > 1 and tokens[0].lower() in _ARGUMENT_MODES:
+        mode = tokens[0].lower()
+        tokens = tokens[1].split(None, 1)
+
+    name = None
+    if len(tokens) > 1 and tokens[1].split(None, 1)[0].lower() not in _TYPE_CONTINUATIONS:
+        name, arg_type = tokens
+    else:
+        arg_type = ' '.join(tokens)
+
+    return FunctionArgument(
+        name=name,
+        type=' '.join(arg_type.split()),
+        mode=mode,
+        has_default=bool(default),
+    )
+
+
+def _blank_comments(sql: str) -> str:
+    """Replace comments outside of string literals with spaces, keeping offsets"""
+    return ''.join(
+        ' ' * len(value) if ttype in T.Comment else value
+        for ttype, value in lexer.tokenize(sql)
+    )
+
+
+def _parse_body(clauses: str) -> Optional[str]:
+    if match := _DOLLAR_QUOTE_RE.search(clauses):
+        end = clauses.find(match.group(0), match.end())
+        if end != -1:
+            return clauses[match.end():end]
+    if match := _SINGLE_QUOTED_BODY_RE.search(clauses):
+        return match.group(1).replace("''", "'")
+    return None
+
+
+def _strip_body(clauses: str) -> str:
+    """Blank out the function body so its contents can't be mistaken for clauses"""
+    if match := _DOLLAR_QUOTE_RE.search(clauses):
+        end = clauses.find(match.group(0), match.end())
+        if end != -1:
+            return clauses[:match.start()] + ' $$ ' + clauses[end + len(match.group(0)):]
+    return _SINGLE_QUOTED_BODY_RE.sub(' AS $$ ', clauses)
+
+
+def _find_return_type(clauses: str) -> Optional[tuple[int, int]]:
+    """Return the start and end of the return type in the clauses after the arguments"""
+    if not (match := _RETURNS_RE.match(clauses)):
+        return None
+
+    start = match.end()
+    if clauses[start:start + 5].upper() == 'TABLE':
+        paren = clauses.find('(', start)
+        end = _find_closing_paren(clauses, paren + 1) + 1
+    else:
+        end = _RETURNS_END_RE.search(clauses, start).start()
+
+    return start, end
+
+
+def _parse_return_type(clauses: str) -> Optional[str]:
+    if not (span := _find_return_type(clauses)):
+        return None
+    return ' '.join(clauses[span[0]:span[1]].split()) or None
+
+
+def _parse_number(pattern: re.Pattern, clauses: str) -> Optional[float]:
+    match = pattern.search(clauses)
+    return float(match.group(1)) if match else None
+
+
+def parse_function_definition(sql: str) -> FunctionMetadata:
+    """Parse the metadata out of a ``CREATE FUNCTION`` statement."""
+    if not (match := _FUNCTION_HEADER_RE.search(sql)):
+        raise ValueError('Could not determine function name from SQL definition.')
+
+    arguments_end = _find_closing_paren(sql, match.end())
+    # eg. a comment between the argument list and RETURNS
+    uncommented = _blank_comments(sql[arguments_end + 1:])
+    body = _parse_body(uncommented)
+    clauses = _strip_body(uncommented)
+    language = _LANGUAGE_RE.search(clauses)
+    volatility = _VOLATILITY_RE.search(clauses)
+    parallel = _PARALLEL_RE.search(clauses)
+    leakproof = _LEAKPROOF_RE.search(clauses)
+
+    return FunctionMetadata(
+        name=match.group('name'),
+        schema=match.group('schema'),
+        arguments=tuple(
+            _parse_argument(argument)
+            for argument in _split_top_level(sql[match.end():arguments_end])
+        ),
+        return_type=_parse_return_type(clauses),
+        language=language.group(1).lower() if language else None,
+        volatility=volatility.group(1).lower() if volatility else None,
+        body=body,
+        parallel=parallel.group(1).lower() if parallel else None,
+        cost=_parse_number(_COST_RE, clauses),
+        rows=_parse_number(_ROWS_RE, clauses),
+        leakproof=not leakproof.group(1) if leakproof else None,
+        strict=bool(_STRICT_RE.search(clauses)),
+        security_definer=bool(_SECURITY_DEFINER_RE.search(clauses)),
+        sets_configuration=bool(_SET_RE.search(clauses)),
+    )
+
+
+def qualify_definition(sql: str, schema: str) -> str:
+    """Rewrite a ``CREATE FUNCTION`` statement to create the function in ``schema``"""
+    if not (match := _FUNCTION_HEADER_RE.search(sql)):
+        raise ValueError('Could not determine function name from SQL definition.')
+    if match.group('schema'):
+        raise ValueError(f'Function {match.group("schema")}.{match.group("name")} is already schema qualified.')
+
+    name_start = match.start('name')
+    return f'{sql[:name_start]}{quote_identifier(schema)}.{sql[name_start:]}'
+
+
+def rename_definition(sql: str, name: str) -> str:
+    """Rewrite a ``CREATE FUNCTION`` statement to create the function as ``name``, in the same schema"""
+    if not (match := _FUNCTION_HEADER_RE.search(sql)):
+        raise ValueError('Could not determine function name from SQL definition.')
+
+    return f'{sql[:match.start("name")]}{quote_identifier(name)}{sql[match.end("name"):]}'
+
+
+def _format_number(value: float) -> str:
+    return f'{value:g}' if isinstance(value, float) else str(value)
+
+
+def merge_attributes(
+    sql: str,
+    *,
+    volatility: Optional[str] = None,
+    parallel: Optional[str] = None,
+    cost: Optional[float] = None,
+    rows: Optional[float] = None,
+    leakproof: Optional[bool] = None,
+) -> str:
+    """Add planner attributes missing from a ``CREATE FUNCTION`` statement.
+
+    Attributes the statement already has are checked instead, and a
+    ``ValueError`` is raised if they differ. The statement is returned
+    unchanged when there is nothing to add.
+    """
+    if volatility is not None and volatility.lower() not in VOLATILITIES:
+        raise ValueError(f'volatility must be one of {", ".join(VOLATILITIES)}, not {volatility!r}.')
+    if parallel is not None and parallel.lower() not in PARALLEL_SAFETIES:
+        raise ValueError(f'parallel must be one of {", ".join(PARALLEL_SAFETIES)}, not {parallel!r}.')
+
+    metadata = parse_function_definition(sql)
+    declared = (
+        ('volatility', volatility and volatility.lower(), metadata.volatility,
+         lambda value: value.upper()),
+        ('parallel', parallel and parallel.lower(), metadata.parallel,
+         lambda value: f'PARALLEL {value.upper()}'),
+        ('cost', cost, metadata.cost, lambda value: f'COST {_format_number(value)}'),
+        ('rows', rows, metadata.rows, lambda value: f'ROWS {_format_number(value)}'),
+        ('leakproof', leakproof, metadata.leakproof,
+         lambda value: 'LEAKPROOF' if value else 'NOT LEAKPROOF'),
+    )
+    clauses = []
+
+    for attribute, value, defined_value, format_clause in declared:
+        if value is None:
+            continue
+        if defined_value is None:
+            clauses.append(format_clause(value))
+        elif value != defined_value:
+            raise ValueError(
+                f'{attribute} = {value!r} conflicts with the SQL definition of '
+                f'{metadata.qualified_name}, which has {defined_value!r}.'
+            )
+
+    if not clauses:
+        return sql
+
+    # clauses go right after the return type, since SQL-standard bodies
+    # (RETURN ... or BEGIN ATOMIC ... END) must come last
+    header = _FUNCTION_HEADER_RE.search(sql)
+    arguments_end = _find_closing_paren(sql, header.end()) + 1
+    span = _find_return_type(_strip_body(_blank_comments(sql[arguments_end:])))
+    insert_at = arguments_end + (span[1] if span else 0)
+    return f'{sql[:insert_at]} {" ".join(clauses)}{sql[insert_at:]}'
@@ -0,0 +1,35 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_sql_digests(apps, schema_editor):
+    SqlFunDefinition = apps.get_model('sqlfun', 'SqlFunDefinition')
+    definitions = list(
+        SqlFunDefinition.objects.using(schema_editor.connection.alias)
+        .only('id', 'sql_definition')
+    )
+
+    for definition in definitions:
+        definition.sql_digest = hashlib.sha256(
+            definition.sql_definition.encode()
+        ).hexdigest()
+
+    SqlFunDefinition.objects.using(schema_editor.connection.alias).bulk_update(
+        definitions, ['sql_digest'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sqlfun", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sqlfundefinition",
+            name="sql_digest",
+            field=models.CharField(default="", max_length=64),
+        ),
+        migrations.RunPython(backfill_sql_digests, migrations.RunPython.noop),
+    ]
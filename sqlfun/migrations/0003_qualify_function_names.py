@@ -0,0 +1,39 @@
+from django.db import migrations
+
+from sqlfun.metadata import parse_function_definition
+
+
+def qualify_function_names(apps, schema_editor):
+    """Rename definitions to the schema-qualified names functions are now looked up by.
+
+    Names used to be matched with a regex, which returned the schema instead of
+    the name of a schema-qualified function, eg. ``public`` for
+    ``public.bad_sum``. Each name is parsed again from its stored definition.
+    """
+    SqlFunDefinition = apps.get_model('sqlfun', 'SqlFunDefinition')
+    definitions = SqlFunDefinition.objects.using(schema_editor.connection.alias)
+
+    for definition in definitions.only('id', 'function_name', 'sql_definition'):
+        try:
+            function_name = parse_function_definition(definition.sql_definition).qualified_name
+        except ValueError:
+            continue
+        if function_name == definition.function_name:
+            continue
+
+        # a definition already stored under the new name is the more recent one
+        if definitions.filter(function_name=function_name).exists():
+            definition.delete()
+        else:
+            definition.function_name = function_name
+            definition.save(update_fields=['function_name'])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sqlfun", "0002_sqlfundefinition_sql_digest"),
+    ]
+
+    operations = [
+        migrations.RunPython(qualify_function_names, migrations.RunPython.noop),
+    ]
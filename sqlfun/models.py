@@ -4,6 +4,7 @@ from django.db import models
 class SqlFunDefinition(models.Model):
     function_name = models.CharField(max_length=255, unique=True)
     sql_definition = models.TextField()
+    sql_digest = models.CharField(max_length=64, default='')
     app_label = models.CharField(max_length=255)
 
     def __str__(self):
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import pathlib
+import tempfile
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import sqlparse
+
+from sqlfun.conf import get_setting
+
+# below this many definitions starting worker processes costs more than it saves
+PARALLEL_NORMALIZATION_THRESHOLD = 64
+# chunks handed to each worker: enough to balance uneven definitions while
+# keeping the inter-process overhead low for many small ones
+CHUNKS_PER_WORKER = 4
+
+
+def normalize_sql(sql: str) -> str:
+    return sqlparse.format(sql, reindent=True, keyword_case='upper')
+
+
+def get_sql_digest(normalized_sql: str) -> str:
+    return hashlib.sha256(normalized_sql.encode()).hexdigest()
+
+
+class NormalizationCache:
+    """On-disk cache of normalized SQL.
+
+    Entries are keyed by a hash of the raw SQL and the sqlparse version, so
+    upgrading sqlparse invalidates them. Once the cache holds more than
+    ``max_entries``, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str | os.PathLike, max_entries: int):
+        self.path = pathlib.Path(path).expanduser()
+        self.max_entries = max_entries
+        self._entries: Optional[dict[str, str]] = None
+        self._used_keys: set[str] = set()
+        self._is_dirty = False
+
+    @classmethod
+    def from_settings(cls) -> Optional[NormalizationCache]:
+        if path := get_setting('NORMALIZATION_CACHE'):
+            return cls(path, get_setting('NORMALIZATION_CACHE_MAX_ENTRIES'))
+        return None
+
+    @staticmethod
+    def get_key(sql: str) -> str:
+        return hashlib.sha256(f'{sqlparse.__version__}\0{sql}'.encode()).hexdigest()
+
+    @property
+    def entries(self) -> dict[str, str]:
+        if self._entries is None:
+            try:
+                with self.path.open() as cache_file:
+                    self._entries = json.load(cache_file)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def get(self, sql: str) -> Optional[str]:
+        key = self.get_key(sql)
+        self._used_keys.add(key)
+        return self.entries.get(key)
+
+    def set(self, sql: str, normalized_sql: str):
+        key = self.get_key(sql)
+        self._used_keys.add(key)
+        self.entries[key] = normalized_sql
+        self._is_dirty = True
+
+    def save(self):
+        """Write the cache to disk if anything was added to it.
+
+        Failing to write the cache is not an error, it only means the next run
+        has to normalize again.
+        """
+        if not self._is_dirty:
+            return
+
+        # entries used during this run become the most recently used ones
+        entries = {
+            key: value for key, value in self.entries.items()
+            if key not in self._used_keys
+        }
+        entries.update(
+            (key, self.entries[key]) for key in self._used_keys if key in self.entries
+        )
+        for key in list(entries)[:max(len(entries) - self.max_entries, 0)]:
+            del entries[key]
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                'w', dir=self.path.parent, suffix='.tmp', delete=False
+            ) as temp_file:
+                json.dump(entries, temp_file)
+            os.replace(temp_file.name, self.path)
+        except OSError:
+            return
+
+        self._entries = entries
+        self._is_dirty = False
+
+
+def _normalize_uncached(sqls: list[str], workers: int) -> list[str]:
+    if workers == 1 or len(sqls) < PARALLEL_NORMALIZATION_THRESHOLD:
+        return [normalize_sql(sql) for sql in sqls]
+
+    workers = min(workers or os.cpu_count() or 1, len(sqls))
+    chunksize = math.ceil(len(sqls) / (workers * CHUNKS_PER_WORKER))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(normalize_sql, sqls, chunksize=chunksize))
+
+
+def normalize_many(sqls: Iterable[str], workers: Optional[int] = None) -> list[str]:
+    """Normalize several SQL definitions, skipping those already in the cache.
+
+    Definitions missing from the cache are normalized across ``workers``
+    processes, which defaults to the ``SQLFUN_NORMALIZATION_WORKERS`` setting.
+    """
+    sqls = list(sqls)
+    cache = NormalizationCache.from_settings()
+    normalized = {}
+
+    if cache is not None:
+        for sql in sqls:
+            if (normalized_sql := cache.get(sql)) is not None:
+                normalized[sql] = normalized_sql
+
+    if workers is None:
+        workers = get_setting('NORMALIZATION_WORKERS')
+    missing = [sql for sql in dict.fromkeys(sqls) if sql not in normalized]
+    normalized.update(zip(missing, _normalize_uncached(missing, workers)))
+
+    if cache is not None:
+        for sql in missing:
+            cache.set(sql, normalized[sql])
+        cache.save()
+
+    return [normalized[sql] for sql in sqls]
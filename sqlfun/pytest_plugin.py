@@ -0,0 +1,40 @@
+"""Create test databases with ``sqlfun.testing.fast_function_setup``.
+
+Add ``pytest_plugins = ['sqlfun.pytest_plugin']`` to your ``conftest.py``,
+then enable it with ``--sqlfun-fast-setup`` or ``sqlfun_fast_setup = true``
+in your pytest configuration.
+"""
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--sqlfun-fast-setup',
+        action='store_true',
+        default=None,
+        help='Install sqlfun functions in one step instead of migrating them '
+             'when creating test databases.',
+    )
+    parser.addini(
+        'sqlfun_fast_setup',
+        type='bool',
+        default=False,
+        help='Install sqlfun functions in one step when creating test databases.',
+    )
+
+
+def _is_enabled(config) -> bool:
+    option = config.getoption('--sqlfun-fast-setup')
+    return config.getini('sqlfun_fast_setup') if option is None else option
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_fixture_setup(fixturedef, request):
+    if fixturedef.argname != 'django_db_setup' or not _is_enabled(request.config):
+        yield
+        return
+
+    from sqlfun.testing import fast_function_setup
+
+    with fast_function_setup():
+        yield
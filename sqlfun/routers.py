@@ -0,0 +1,17 @@
+from django.db import connections
+
+from sqlfun.state import SQLFUN_HINT
+
+
+class PostgresOnlyRouter:
+    """Keep function definitions out of databases other than postgres.
+
+    Migration operations written by sqlfun, and deploys, are skipped on eg.
+    SQLite, where functions with a ``python_function`` are registered on each
+    connection instead. Everything else is left to the other routers.
+    """
+
+    def allow_migrate(self, db, app_label, **hints):
+        if SQLFUN_HINT in hints and connections[db].vendor != 'postgresql':
+            return False
+        return None
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import functools
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+from django.db import NotSupportedError
+
+from sqlfun.metadata import unquote_identifier
+
+if TYPE_CHECKING:
+    from sqlfun.core import SqlFun
+
+
+def _get_registered_functions(connection) -> set[str]:
+    """Return the names of the functions registered on the current connection"""
+    registered = getattr(connection, '_sqlfun_python_functions', None)
+    # functions belong to the sqlite3 connection, so a reconnect forgets them
+    if registered is None or registered[0] is not connection.connection:
+        registered = (connection.connection, set())
+        connection._sqlfun_python_functions = registered
+    return registered[1]
+
+
+def _strict(python_function: Callable[..., Any]) -> Callable[..., Any]:
+    """Return NULL for NULL arguments without calling the function, like STRICT"""
+
+    @functools.wraps(python_function)
+    def strict_function(*args):
+        if any(arg is None for arg in args):
+            return None
+        return python_function(*args)
+
+    return strict_function
+
+
+def register_python_function(sqlfun_cls: type[SqlFun], connection) -> str:
+    """Register the Python implementation of a function on a SQLite connection.
+
+    Returns the name the function is called by, which is its name without the
+    schema, since SQLite has none. Immutable functions are registered as
+    deterministic, so SQLite can use them in indexes and factor calls out.
+    """
+    metadata = sqlfun_cls.get_metadata()
+    function_name = unquote_identifier(metadata.name)
+    python_function = sqlfun_cls.python_function
+    if metadata.returns_set:
+        raise NotSupportedError(
+            f'{metadata.qualified_name} returns a set, which only runs on postgres.'
+        )
+    if python_function is None:
+        raise NotSupportedError(
+            f'{metadata.qualified_name} needs a python_function to run on {connection.vendor}.'
+        )
+
+    connection.ensure_connection()
+    registered_functions = _get_registered_functions(connection)
+    if function_name in registered_functions:
+        return function_name
+
+    input_arguments = [argument for argument in metadata.arguments if argument.is_input]
+    # arguments with defaults can be left out, so leave checking them to Python
+    argument_count = (
+        -1 if any(argument.has_default for argument in input_arguments)
+        else len(input_arguments)
+    )
+    connection.connection.create_function(
+        function_name,
+        argument_count,
+        _strict(python_function) if metadata.strict else python_function,
+        deterministic=metadata.volatility == 'immutable',
+    )
+    registered_functions.add(function_name)
+    return function_name
+
+
+def register_python_functions(sender=None, connection=None, **kwargs):
+    """Register every function with a Python implementation on a new SQLite connection"""
+    if connection is None or connection.vendor != 'sqlite':
+        return
+
+    # imported here since sqlfun.core imports this module
+    from sqlfun.core import get_registry_by_function_name
+
+    for sqlfun_cls in get_registry_by_function_name().values():
+        if sqlfun_cls.python_function is not None and not sqlfun_cls.get_metadata().returns_set:
+            register_python_function(sqlfun_cls, connection)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import pathlib
+from dataclasses import dataclass
+from typing import Optional
+
+from django.db import migrations
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from sqlfun.normalize import get_sql_digest, normalize_many
+from sqlfun.core import get_registry_by_function_name
+from sqlfun.state import SQLFUN_HINT, get_sqlfun_operations
+from sqlfun.utils import create_custom_migration, write_migration
+
+
+@dataclass
+class SquashResult:
+    migration: migrations.Migration
+    path: pathlib.Path
+    # RunSQL statements run by the replaced migrations, and by the squashed one
+    original_statements: int
+    squashed_statements: int
+
+
+def get_digests(
+    definitions: dict[str, Optional[str]],
+    function_names: list[str],
+) -> dict[str, str]:
+    """Return the digests of the functions that are defined, rather than dropped"""
+    defined = [name for name in function_names if definitions.get(name)]
+    return {
+        function_name: get_sql_digest(normalized)
+        for function_name, normalized in zip(
+            defined, normalize_many(definitions[name] for name in defined)
+        )
+    }
+
+
+def get_migration_range(
+    loader: MigrationLoader,
+    app_label: str,
+    start_migration_name: Optional[str],
+    end_migration_name: str,
+) -> list[migrations.Migration]:
+    """Return the migrations of an app from the start (or first) to the end one, in order"""
+    end = loader.get_migration_by_prefix(app_label, end_migration_name)
+    plan = [
+        loader.graph.nodes[node]
+        for node in loader.graph.forwards_plan((app_label, end.name))
+        if node[0] == app_label
+    ]
+
+    if start_migration_name:
+        start = loader.get_migration_by_prefix(app_label, start_migration_name)
+        if start not in plan:
+            raise ValueError(
+                f'{start.name} is not an ancestor of {end.name}, so they cannot be squashed.'
+            )
+        plan = plan[plan.index(start):]
+
+    return plan
+
+
+def squash_sqlfun_migrations(
+    app_label: str,
+    start_migration_name: Optional[str],
+    end_migration_name: str,
+    *,
+    squashed_name: Optional[str] = None,
+    is_dry_run: bool = False,
+    loader: Optional[MigrationLoader] = None,
+) -> SquashResult:
+    """Replace a range of sqlfun migrations with one holding the latest definitions.
+
+    Every function created, changed or dropped in the range gets at most one
+    operation, reversing to its definition before the range. Only migrations
+    written by sqlfun can be squashed, so model changes are never reordered
+    around function definitions.
+    """
+    if loader is None:
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+
+    squashed = get_migration_range(loader, app_label, start_migration_name, end_migration_name)
+    squashed_nodes = {(migration.app_label, migration.name) for migration in squashed}
+
+    # the definitions the range started from, which the squashed migration
+    # reverses to
+    registered_names = get_registry_by_function_name().keys()
+    previous_definitions = {}
+    for node in loader.graph.forwards_plan((app_label, squashed[-1].name)):
+        if node in squashed_nodes:
+            continue
+        for function_name, sql in get_sqlfun_operations(
+            loader.graph.nodes[node], registered_names | previous_definitions.keys()
+        ):
+            previous_definitions[function_name] = sql
+
+    final_definitions = {}
+    original_statements = 0
+    for migration in squashed:
+        if migration.replaces:
+            raise ValueError(f'{migration.name} is already a squashed migration.')
+        sqlfun_operations = get_sqlfun_operations(
+            migration,
+            registered_names | previous_definitions.keys() | final_definitions.keys(),
+        )
+        if len(sqlfun_operations) != len(migration.operations):
+            raise ValueError(
+                f'{migration.name} has operations other than sqlfun function '
+                'definitions. Use squashmigrations instead.'
+            )
+        for function_name, sql in sqlfun_operations:
+            final_definitions[function_name] = sql
+            original_statements += 1
+
+    function_names = sorted(final_definitions)
+    previous_digests = get_digests(previous_definitions, function_names)
+    final_digests = get_digests(final_definitions, function_names)
+
+    operations = []
+    for function_name in function_names:
+        sql = final_definitions[function_name]
+        previous_sql = previous_definitions.get(function_name)
+        drop_sql = f'DROP FUNCTION IF EXISTS {function_name};'
+
+        # functions that end up as they started need no operation at all
+        if final_digests.get(function_name) == previous_digests.get(function_name):
+            continue
+        if sql is None:
+            operations.append(migrations.RunSQL(
+                sql=drop_sql,
+                reverse_sql=previous_sql,
+                hints={SQLFUN_HINT: function_name},
+            ))
+        else:
+            operations.append(migrations.RunSQL(
+                sql=sql,
+                reverse_sql=previous_sql or drop_sql,
+                hints={SQLFUN_HINT: function_name},
+            ))
+
+    dependencies = sorted({
+        dependency
+        for migration in squashed
+        for dependency in migration.dependencies
+        if tuple(dependency) not in squashed_nodes
+    })
+    if squashed_name:
+        name = f'{squashed[0].name[:4]}_{squashed_name}'
+    else:
+        name = f'{squashed[0].name}_squashed_{squashed[-1].name}'
+
+    migration = create_custom_migration(
+        name=name,
+        app_label=app_label,
+        dependencies=dependencies,
+        operations=operations,
+        replaces=sorted(squashed_nodes),
+    )
+    migration_path = pathlib.Path(MigrationWriter(migration).path)
+    if not is_dry_run:
+        write_migration(migration_path, migration)
+
+    return SquashResult(
+        migration=migration,
+        path=migration_path,
+        original_statements=original_statements,
+        squashed_statements=len(operations),
+    )
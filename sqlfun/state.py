@@ -0,0 +1,299 @@
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import re
+import tempfile
+from collections.abc import Collection, Iterable, Iterator
+from typing import TYPE_CHECKING, Optional
+
+from django.db import migrations
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Q
+
+from sqlfun.conf import get_setting
+from sqlfun.core import get_registry_by_function_name
+from sqlfun.metadata import parse_function_definition
+from sqlfun.models import SqlFunDefinition
+from sqlfun.normalize import get_sql_digest, normalize_many
+
+if TYPE_CHECKING:
+    from django.db.migrations.graph import MigrationGraph
+
+# hint added to the RunSQL operations sqlfun writes, naming their function
+SQLFUN_HINT = 'sqlfun_function'
+
+_DROP_FUNCTION_RE = re.compile(
+    r'\s*DROP\s+FUNCTION\s+IF\s+EXISTS\s+([^\s;(]+)\s*;?\s*', re.IGNORECASE
+)
+
+
+def get_sqlfun_operation(operation) -> Optional[tuple[str, Optional[str]]]:
+    """Return the function name and SQL of an operation creating a function.
+
+    Operations dropping a function are returned with ``None`` as their SQL, and
+    anything else returns ``None``.
+    """
+    if not isinstance(operation, migrations.RunSQL) or not isinstance(operation.sql, str):
+        return None
+
+    function_name = operation.hints.get(SQLFUN_HINT)
+
+    if drop_match := _DROP_FUNCTION_RE.fullmatch(operation.sql):
+        return function_name or drop_match.group(1), None
+
+    if function_name:
+        return function_name, operation.sql
+
+    if operation.sql.lstrip()[:6].upper() == 'CREATE':
+        try:
+            return parse_function_definition(operation.sql).qualified_name, operation.sql
+        except ValueError:
+            return None
+
+    return None
+
+
+def get_sqlfun_operations(
+    migration: migrations.Migration,
+    function_names: Collection[str] = (),
+) -> list[tuple[str, Optional[str]]]:
+    """Return the functions created and dropped by a migration, in order.
+
+    Operations written by sqlfun carry a hint naming their function. Migrations
+    written before the hint existed are recognized when every one of their
+    operations creates or drops a function, and only for the functions in
+    ``function_names``, eg. the registered ones, so hand-written functions like
+    triggers are never taken for sqlfun's.
+    """
+    hinted_operations = [
+        operation for operation in migration.operations
+        if isinstance(operation, migrations.RunSQL) and SQLFUN_HINT in operation.hints
+    ]
+    if hinted_operations:
+        return [get_sqlfun_operation(operation) for operation in hinted_operations]
+
+    sqlfun_operations = [get_sqlfun_operation(operation) for operation in migration.operations]
+    if sqlfun_operations and all(sqlfun_operations):
+        return [
+            (function_name, sql) for function_name, sql in sqlfun_operations
+            if function_name in function_names
+        ]
+
+    return []
+
+
+def iter_migration_plan(
+    graph: MigrationGraph,
+    targets: Iterable[tuple[str, str]],
+    visited: Optional[set[tuple[str, str]]] = None,
+) -> Iterator[tuple[str, str]]:
+    """Yield the targets and their ancestors, each after all of its parents.
+
+    Nodes already in ``visited`` are skipped, along with their ancestors.
+    """
+    visited = set() if visited is None else visited
+
+    for target in targets:
+        stack = [graph.node_map[target]]
+        while stack:
+            node = stack[-1]
+            if node.key in visited:
+                stack.pop()
+                continue
+            unvisited_parents = [
+                parent for parent in sorted(node.parents) if parent.key not in visited
+            ]
+            if unvisited_parents:
+                stack.extend(unvisited_parents)
+                continue
+            visited.add(node.key)
+            stack.pop()
+            yield node.key
+
+
+def load_snapshot(path: str | os.PathLike) -> Optional[dict]:
+    try:
+        with pathlib.Path(path).open() as snapshot_file:
+            return json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_snapshot(
+    path: str | os.PathLike,
+    leaf_nodes: Iterable[tuple[str, str]],
+    functions: dict[str, tuple[str, str]],
+):
+    """Write the replayed state atomically, ignoring failures like the caches do"""
+    path = pathlib.Path(path)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            'w', dir=path.parent, suffix='.tmp', delete=False
+        ) as temp_file:
+            json.dump({
+                'leaf_nodes': sorted(leaf_nodes),
+                'functions': functions,
+            }, temp_file)
+        os.replace(temp_file.name, path)
+    except OSError:
+        pass
+
+
+def replay_migrations(
+    loader: MigrationLoader,
+    snapshot_path: Optional[str | os.PathLike] = None,
+    function_names: Collection[str] = (),
+) -> dict[str, tuple[str, str]]:
+    """Rebuild the last definition of every function from the migration files.
+
+    Returns a map of function name to the app label and SQL of the migration
+    that last defined it. With a snapshot, only migrations added since it was
+    taken are replayed. Migrations without hints are only replayed for the
+    functions in ``function_names`` or already replayed, see
+    ``get_sqlfun_operations``.
+    """
+    function_names = set(function_names)
+    graph = loader.graph
+    functions = {}
+    visited = set()
+
+    if snapshot_path and (snapshot := load_snapshot(snapshot_path)):
+        snapshot_leaf_nodes = [tuple(node) for node in snapshot['leaf_nodes']]
+        # a snapshot taken at migrations that no longer exist, eg. because they
+        # were squashed, can't be trusted
+        if all(node in graph.nodes for node in snapshot_leaf_nodes):
+            functions = {
+                function_name: tuple(definition)
+                for function_name, definition in snapshot['functions'].items()
+            }
+            for _ in iter_migration_plan(graph, snapshot_leaf_nodes, visited):
+                pass
+
+    leaf_nodes = graph.leaf_nodes()
+    for node in iter_migration_plan(graph, leaf_nodes, visited):
+        migration = graph.nodes[node]
+        for function_name, sql in get_sqlfun_operations(
+            migration, function_names | functions.keys()
+        ):
+            if sql is None:
+                functions.pop(function_name, None)
+            else:
+                functions[function_name] = (migration.app_label, sql)
+
+    if snapshot_path:
+        save_snapshot(snapshot_path, leaf_nodes, functions)
+
+    return functions
+
+
+class DatabaseState:
+    """The last known function definitions, as recorded in SqlFunDefinition"""
+
+    def __init__(
+        self,
+        app_labels: Optional[Collection[str]] = None,
+        function_names: Collection[str] = (),
+    ):
+        self.queryset = SqlFunDefinition.objects.all()
+        if app_labels:
+            self.queryset = self.queryset.filter(
+                Q(app_label__in=app_labels) | Q(function_name__in=function_names)
+            )
+
+    def get_digests(self, *, workers: Optional[int] = None) -> dict[str, tuple[str, str]]:
+        """Return a map of function name to app label and SQL digest"""
+        return {
+            function_name: (app_label, sql_digest)
+            for function_name, app_label, sql_digest in (
+                self.queryset.values_list('function_name', 'app_label', 'sql_digest')
+            )
+        }
+
+    def get_function_names(self) -> set[str]:
+        return set(self.queryset.values_list('function_name', flat=True))
+
+    def get_definitions(self, function_names: Collection[str]) -> dict[str, str]:
+        if not function_names:
+            return {}
+        return dict(
+            SqlFunDefinition.objects.filter(function_name__in=function_names)
+            .values_list('function_name', 'sql_definition')
+        )
+
+
+class MigrationState:
+    """The last known function definitions, rebuilt from the migration files.
+
+    Unlike DatabaseState this does not need a database connection.
+    """
+
+    def __init__(
+        self,
+        loader: MigrationLoader,
+        app_labels: Optional[Collection[str]] = None,
+        function_names: Collection[str] = (),
+        snapshot_path: Optional[str | os.PathLike] = None,
+    ):
+        registered_names = get_registry_by_function_name().keys()
+        self.functions = {
+            function_name: definition
+            for function_name, definition in replay_migrations(
+                loader, snapshot_path, registered_names
+            ).items()
+            if not app_labels
+            or definition[0] in app_labels
+            or function_name in function_names
+        }
+
+    def get_digests(self, *, workers: Optional[int] = None) -> dict[str, tuple[str, str]]:
+        """Return a map of function name to app label and SQL digest"""
+        function_names = list(self.functions)
+        normalized_definitions = normalize_many(
+            (self.functions[function_name][1] for function_name in function_names),
+            workers=workers,
+        )
+        return {
+            function_name: (self.functions[function_name][0], get_sql_digest(normalized))
+            for function_name, normalized in zip(function_names, normalized_definitions)
+        }
+
+    def get_function_names(self) -> set[str]:
+        return set(self.functions)
+
+    def get_definitions(self, function_names: Collection[str]) -> dict[str, str]:
+        return {
+            function_name: self.functions[function_name][1]
+            for function_name in function_names
+            if function_name in self.functions
+        }
+
+
+def is_offline(offline: Optional[bool] = None) -> bool:
+    if offline is None:
+        return get_setting('STATE_SOURCE') == 'migrations'
+    return offline
+
+
+def get_state(
+    app_labels: Optional[Collection[str]] = None,
+    function_names: Collection[str] = (),
+    *,
+    offline: Optional[bool] = None,
+    loader: Optional[MigrationLoader] = None,
+) -> DatabaseState | MigrationState:
+    """Get the last known function definitions from the configured source"""
+    if not is_offline(offline):
+        return DatabaseState(app_labels, function_names)
+
+    if loader is None:
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+
+    return MigrationState(
+        loader,
+        app_labels,
+        function_names,
+        snapshot_path=get_setting('STATE_SNAPSHOT'),
+    )
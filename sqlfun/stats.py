@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import datetime
+import logging
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from typing import Optional
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from sqlfun.conf import get_setting
+from sqlfun.core import SqlFun, get_registry_by_function_name
+
+logger = logging.getLogger('sqlfun.stats')
+
+# functions that were never called have no row, and count as zero
+_FUNCTION_STATS_SQL = """
+    SELECT r.signature, s.calls, s.total_time, s.self_time,
+           current_setting('track_functions')
+    FROM unnest(%s::text[]) AS r(signature)
+    LEFT JOIN pg_stat_user_functions s ON s.funcid = to_regprocedure(r.signature)
+"""
+
+
+@dataclass(frozen=True)
+class FunctionStats:
+    """Calls and time, in milliseconds, spent in one function"""
+
+    sqlfun_cls: type[SqlFun]
+    calls: int = 0
+    total_time: float = 0.0
+    # time spent in the function itself, without the functions it called
+    self_time: float = 0.0
+
+    @property
+    def signature(self) -> str:
+        return self.sqlfun_cls.get_metadata().signature
+
+    @property
+    def app_label(self) -> Optional[str]:
+        return self.sqlfun_cls.get_app_label()
+
+    def __add__(self, other: FunctionStats) -> FunctionStats:
+        return FunctionStats(
+            sqlfun_cls=self.sqlfun_cls,
+            calls=self.calls + other.calls,
+            total_time=self.total_time + other.total_time,
+            self_time=self.self_time + other.self_time,
+        )
+
+    def __sub__(self, earlier: FunctionStats) -> FunctionStats:
+        # counters going down means the statistics were reset in between
+        if self.calls < earlier.calls:
+            return self
+        return FunctionStats(
+            sqlfun_cls=self.sqlfun_cls,
+            calls=self.calls - earlier.calls,
+            total_time=self.total_time - earlier.total_time,
+            self_time=self.self_time - earlier.self_time,
+        )
+
+
+@dataclass(frozen=True)
+class StatsSnapshot:
+    """Function statistics of one database, cumulative or over an interval"""
+
+    database: str
+    taken_at: datetime.datetime
+    functions: dict[str, FunctionStats] = field(default_factory=dict)
+    # the value of track_functions, which must not be 'none' for any to be counted
+    track_functions: str = 'none'
+    # the start of the interval, for the difference of two snapshots
+    since: Optional[datetime.datetime] = None
+
+    def __sub__(self, earlier: StatsSnapshot) -> StatsSnapshot:
+        return StatsSnapshot(
+            database=self.database,
+            taken_at=self.taken_at,
+            functions={
+                signature: (
+                    stats - earlier.functions[signature]
+                    if signature in earlier.functions else stats
+                )
+                for signature, stats in self.functions.items()
+            },
+            track_functions=self.track_functions,
+            since=earlier.taken_at,
+        )
+
+    def by_app(self) -> dict[Optional[str], tuple[int, float, float]]:
+        """Return the calls, total time and self time summed per app label"""
+        totals = {}
+        for stats in self.functions.values():
+            calls, total_time, self_time = totals.get(stats.app_label, (0, 0.0, 0.0))
+            totals[stats.app_label] = (
+                calls + stats.calls,
+                total_time + stats.total_time,
+                self_time + stats.self_time,
+            )
+        return totals
+
+
+def take_snapshot(
+    sqlfun_classes: Optional[Iterable[type[SqlFun]]] = None,
+    *,
+    using: str = DEFAULT_DB_ALIAS,
+) -> StatsSnapshot:
+    """Read the statistics of the registered functions in one query"""
+    if sqlfun_classes is None:
+        sqlfun_classes = get_registry_by_function_name().values()
+
+    by_signature = {
+        sqlfun_cls.get_metadata().signature: sqlfun_cls for sqlfun_cls in sqlfun_classes
+    }
+    with connections[using].cursor() as cursor:
+        cursor.execute(_FUNCTION_STATS_SQL, [list(by_signature)])
+        rows = cursor.fetchall()
+
+    return StatsSnapshot(
+        database=using,
+        taken_at=timezone.now(),
+        functions={
+            signature: FunctionStats(
+                sqlfun_cls=by_signature[signature],
+                calls=calls or 0,
+                total_time=total_time or 0.0,
+                self_time=self_time or 0.0,
+            )
+            for signature, calls, total_time, self_time, _ in rows
+        },
+        track_functions=rows[0][4] if rows else 'none',
+    )
+
+
+def log_snapshot(snapshot: StatsSnapshot):
+    """A sink writing the called functions to the ``sqlfun.stats`` logger"""
+    for signature, stats in sorted(snapshot.functions.items()):
+        if stats.calls:
+            logger.info(
+                '%s %s calls=%d total_time=%.3fms self_time=%.3fms',
+                snapshot.database, signature, stats.calls, stats.total_time, stats.self_time,
+            )
+
+
+def get_sink(sink: Optional[str | Callable[[StatsSnapshot], None]] = None):
+    """Return the sink snapshots are exported to, by default ``SQLFUN_STATS_SINK``.
+
+    A sink is a callable taking a ``StatsSnapshot``, or the dotted path to one.
+    """
+    sink = sink or get_setting('STATS_SINK')
+    if isinstance(sink, str):
+        return import_string(sink)
+    return sink
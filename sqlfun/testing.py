@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import hashlib
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from typing import Optional
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections, migrations
+from django.db.migrations.loader import MigrationLoader
+from django.db.models.signals import post_migrate
+from django.test.runner import DiscoverRunner
+
+from sqlfun.core import SqlFun, get_registry_by_function_name
+from sqlfun.dependencies import get_migrated_usages
+from sqlfun.deploy import apply_definitions, get_deployable_classes
+from sqlfun.metadata import quote_identifier
+from sqlfun.state import SQLFUN_HINT
+
+# prefix of the comment recording the registry installed in a test database
+REGISTRY_FINGERPRINT_PREFIX = 'sqlfun-registry:'
+
+_DATABASE_COMMENT_SQL = """
+    SELECT current_database(), shobj_description(oid, 'pg_database')
+    FROM pg_database
+    WHERE datname = current_database()
+"""
+
+
+def get_registry_fingerprint(sqlfun_classes: Iterable[type[SqlFun]]) -> str:
+    """Return a digest of the definitions of all the given functions.
+
+    Definitions are hashed as they are, without normalizing them, since this
+    is checked on every test run.
+    """
+    digest = hashlib.sha256()
+    for definition in sorted(sqlfun_cls.get_definition() for sqlfun_cls in sqlfun_classes):
+        digest.update(definition.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def install_test_functions(
+    sqlfun_classes: Optional[Iterable[type[SqlFun]]] = None,
+    *,
+    force: bool = False,
+    using: str = DEFAULT_DB_ALIAS,
+) -> Optional[list[type[SqlFun]]]:
+    """Install the registry in a test database in one batched step.
+
+    The fingerprint of the installed registry is recorded as the comment of
+    the database, so a database kept between runs is only updated when the
+    registry changed, unless ``force`` is set. Returns the classes whose
+    functions were applied, or ``None`` if the database was up to date.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+
+    if sqlfun_classes is None:
+        sqlfun_classes = get_registry_by_function_name().values()
+
+    sqlfun_classes = get_deployable_classes(sqlfun_classes, using)
+    fingerprint = REGISTRY_FINGERPRINT_PREFIX + get_registry_fingerprint(sqlfun_classes)
+
+    with connection.cursor() as cursor:
+        cursor.execute(_DATABASE_COMMENT_SQL)
+        database_name, comment = cursor.fetchone()
+
+    if comment == fingerprint and not force:
+        return None
+
+    applied = apply_definitions(sqlfun_classes, force=force, using=using)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'COMMENT ON DATABASE {quote_identifier(database_name)} IS %s', [fingerprint]
+        )
+    return applied
+
+
+def _install_after_migrate(sender, using=DEFAULT_DB_ALIAS, verbosity=1, stdout=None, **kwargs):
+    if connections[using].vendor != 'postgresql':
+        return
+
+    applied = install_test_functions(using=using)
+    if verbosity >= 1 and stdout is not None:
+        if applied is None:
+            stdout.write(f"[sqlfun] Functions of database '{using}' are up to date\n")
+        else:
+            stdout.write(f"[sqlfun] Installed {len(applied)} function(s) in database '{using}'\n")
+
+
+@contextmanager
+def fast_function_setup() -> Iterator[None]:
+    """Install functions in one step, instead of migrating them, while active.
+
+    Migration operations written by sqlfun for registered functions are
+    recorded as applied without running them, and the registry is installed
+    with ``install_test_functions`` once ``migrate`` is done. Wrap the creation of test databases with it,
+    which is what ``SqlFunTestRunner`` and the ``sqlfun.pytest_plugin`` do.
+
+    Functions that migrations use, eg. in an index, constraint or generated
+    field, are still migrated, since those migrations depend on them. Data
+    migrations calling a function through SQL can't be run this way.
+    """
+    database_forwards = migrations.RunSQL.database_forwards
+    skipped_names = get_registry_by_function_name().keys() - get_migrated_usages(
+        MigrationLoader(None, ignore_no_migrations=True)
+    )
+
+    def skip_sqlfun_operations(self, app_label, schema_editor, from_state, to_state):
+        # only what is installed afterwards, hand-written SQL always runs
+        if self.hints.get(SQLFUN_HINT) not in skipped_names:
+            database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    migrations.RunSQL.database_forwards = skip_sqlfun_operations
+    post_migrate.connect(
+        _install_after_migrate,
+        sender=apps.get_app_config('sqlfun'),
+        dispatch_uid='sqlfun_fast_function_setup',
+    )
+    try:
+        yield
+    finally:
+        migrations.RunSQL.database_forwards = database_forwards
+        post_migrate.disconnect(
+            sender=apps.get_app_config('sqlfun'),
+            dispatch_uid='sqlfun_fast_function_setup',
+        )
+
+
+class SqlFunTestRunner(DiscoverRunner):
+    """A test runner creating test databases with ``fast_function_setup``.
+
+    Enable it with ``TEST_RUNNER = 'sqlfun.testing.SqlFunTestRunner'``.
+    """
+
+    def setup_databases(self, **kwargs):
+        with fast_function_setup():
+            return super().setup_databases(**kwargs)
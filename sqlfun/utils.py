@@ -1,88 +1,110 @@
 from __future__ import annotations
 
-import inspect
-import os
 import pathlib
 import re
 from collections import defaultdict
+from collections.abc import Collection
 from typing import TYPE_CHECKING, Optional
 
-import sqlparse
 from django.conf import settings
-from django.db import migrations
+from django.db import migrations, transaction
 from django.db.migrations.loader import MigrationLoader
 from django.db.migrations.writer import MigrationWriter
 from django.utils import timezone
 
-from sqlfun.core import SqlFun
+from sqlfun.core import SqlFun, get_app_name, get_registry_by_function_name  # noqa: F401
 from sqlfun.models import SqlFunDefinition
+from sqlfun.normalize import get_sql_digest, normalize_many, normalize_sql  # noqa: F401
+from sqlfun.state import SQLFUN_HINT, DatabaseState, get_state, is_offline
 
 if TYPE_CHECKING:
     from django.db.migrations.graph import Node
 
 
-def get_previous_sql_definition(cls: SqlFun):
-    try:
-        sqlfun_definition = SqlFunDefinition.objects.get(
-            function_name=cls.get_function_name_from_sql()
-        )
-        return sqlfun_definition.sql_definition
-    except SqlFunDefinition.DoesNotExist:
-        return None
-
-
-def normalize_sql(sql: str) -> str:
-    return sqlparse.format(sql, reindent=True, keyword_case='upper')
-
+def scope_to_app_labels(
+    registry: dict[str, type[SqlFun]],
+    app_labels: Optional[Collection[str]],
+) -> dict[str, type[SqlFun]]:
+    """Limit the registry to the functions of the given apps.
 
-def get_app_name(filepath: str) -> str | None:
+    Functions outside the requested apps are skipped before anything is
+    normalized or read from the database.
     """
-    Returns the name of the Django app that contains the module at the given filepath.
-    Returns None if the module is not part of a Django app.
-    """
-    while filepath != '/':
-        filepath, module_name = os.path.split(filepath)
-        if module_name == 'apps.py':
-            app_name = os.path.basename(filepath)
-            if app_name != '__init__':
-                return app_name
-        elif module_name == 'models.py':
-            app_name = os.path.basename(filepath)
-            if app_name != '__init__':
-                return app_name
-    return None
-
-
-def get_app_label_for_cls(sqlfun_cls: SqlFun) -> str | None:
-    return sqlfun_cls.app_label or get_app_name(inspect.getfile(sqlfun_cls))
-
-
-def get_migration_operations() -> dict[str, list[migrations.RunSQL]]:
+    if not app_labels:
+        return registry
+
+    return {
+        function_name: sqlfun_cls
+        for function_name, sqlfun_cls in registry.items()
+        if sqlfun_cls.get_app_label() in app_labels
+    }
+
+
+def get_registry_changes(
+    registry: dict[str, type[SqlFun]],
+    scoped_registry: dict[str, type[SqlFun]],
+    stored_functions: dict[str, tuple[str, str]],
+    *,
+    workers: Optional[int] = None,
+) -> tuple[set[str], set[str], set[str]]:
+    """Return the names of the functions added, removed and changed since the stored state"""
+    added = scoped_registry.keys() - stored_functions.keys()
+    # checked against the whole registry: a function moved to another app is
+    # not removed from the app it was stored under
+    removed = stored_functions.keys() - registry.keys()
+    kept = sorted(scoped_registry.keys() & stored_functions.keys())
+    changed = {
+        function_name
+        for function_name, current_sql in zip(
+            kept,
+            normalize_many(
+                (registry[function_name].get_definition() for function_name in kept),
+                workers=workers,
+            ),
+        )
+        if get_sql_digest(current_sql) != stored_functions[function_name][1]
+    }
+    return added, removed, changed
+
+
+def get_migration_operations(
+    *,
+    app_labels: Optional[Collection[str]] = None,
+    workers: Optional[int] = None,
+    offline: Optional[bool] = None,
+    loader: Optional[MigrationLoader] = None,
+) -> dict[str, list[migrations.RunSQL]]:
     migration_operations = defaultdict(list)
+    registry = get_registry_by_function_name()
+    scoped_registry = scope_to_app_labels(registry, app_labels)
+    # stored definitions of functions that moved into one of the apps are kept
+    # so they are compared, not re-added
+    state = get_state(app_labels, scoped_registry, offline=offline, loader=loader)
+    stored_functions = state.get_digests(workers=workers)
+    added, removed, changed = get_registry_changes(
+        registry, scoped_registry, stored_functions, workers=workers
+    )
 
-    for sqlfun_cls in SqlFun._registry:
-        app_label = get_app_label_for_cls(sqlfun_cls)
-        function_name = sqlfun_cls.get_function_name_from_sql()
-        current_sql = normalize_sql(sqlfun_cls.sql)
-        previous_sql = get_previous_sql_definition(sqlfun_cls)
-
-        if current_sql != previous_sql:
-            drop_function_sql = f'DROP FUNCTION IF EXISTS {function_name};'
-            migration_operations[app_label].append(migrations.RunSQL(
-                sql=sqlfun_cls.sql,
-                reverse_sql=previous_sql or drop_function_sql,
-            ))
-
-    for stored_function in SqlFunDefinition.objects.all():
-        app_label = stored_function.app_label
-        if not any(
-            func.get_function_name_from_sql() == stored_function.function_name
-            for func in SqlFun._registry
-        ):
-            operation = migrations.RunSQL(
-                sql=f'DROP FUNCTION IF EXISTS {stored_function.function_name};',
-            )
-            migration_operations[app_label].append(operation)
+    # the full previous definitions are only needed as reverse SQL for changes
+    previous_definitions = state.get_definitions(changed)
+
+    for function_name in sorted(added | changed):
+        sqlfun_cls = registry[function_name]
+        reverse_sql = previous_definitions.get(
+            function_name, f'DROP FUNCTION IF EXISTS {function_name};'
+        )
+        migration_operations[sqlfun_cls.get_app_label()].append(migrations.RunSQL(
+            sql=sqlfun_cls.get_definition(),
+            reverse_sql=reverse_sql,
+            hints={SQLFUN_HINT: function_name},
+        ))
+
+    for function_name in sorted(removed):
+        app_label = stored_functions[function_name][0]
+        migration_operations[app_label].append(migrations.RunSQL(
+            sql=f'DROP FUNCTION IF EXISTS {function_name};',
+            hints={SQLFUN_HINT: function_name},
+        ))
 
     return migration_operations
 
@@ -92,10 +114,12 @@ def create_custom_migration(
     app_label: str,
     dependencies: list['Node'],
     operations: list[migrations.RunSQL],
+    replaces: Optional[list[tuple[str, str]]] = None,
 ) -> migrations.Migration:
     SqlFunMigration = type('SqlFunMigration', (migrations.Migration,), {
         'dependencies': dependencies,
-        'operations': operations
+        'operations': operations,
+        'replaces': replaces or [],
     })
     return SqlFunMigration(name=name, app_label=app_label)
 
@@ -113,8 +137,10 @@ def generate_migration(
     app_label: str,
     operations: list[migrations.RunSQL],
     is_dry_run: bool = False,
+    loader: Optional[MigrationLoader] = None,
 ) -> pathlib.Path:
-    loader = MigrationLoader(None, ignore_no_migrations=True)
+    if loader is None:
+        loader = MigrationLoader(None, ignore_no_migrations=True)
     latest_leaf_node: Optional['Node'] = loader.graph.leaf_nodes(app_label)
 
     migration = create_custom_migration(
@@ -133,36 +159,76 @@ def generate_migration(
     return migration_path
 
 
-def update_sqlfun_definition_model():
-    for sqlfun_cls in SqlFun._registry:
-        function_name = sqlfun_cls.get_function_name_from_sql()
-        current_sql = normalize_sql(sqlfun_cls.sql)
-        app_label = get_app_label_for_cls(sqlfun_cls)
+def update_sqlfun_definition_model(
+    *,
+    app_labels: Optional[Collection[str]] = None,
+    workers: Optional[int] = None,
+):
+    registry = get_registry_by_function_name()
+    scoped_registry = scope_to_app_labels(registry, app_labels)
+    stored_definitions_query = DatabaseState(app_labels, scoped_registry).queryset
+
+    with transaction.atomic():
+        stored_definitions = {
+            function_name: (sql_digest, app_label)
+            for function_name, sql_digest, app_label in (
+                stored_definitions_query.values_list(
+                    'function_name', 'sql_digest', 'app_label'
+                )
+            )
+        }
 
-        definition, created = SqlFunDefinition.objects.get_or_create(
-            function_name=function_name,
-            app_label=app_label,
+        changed_definitions = []
+        normalized_definitions = normalize_many(
+            (sqlfun_cls.get_definition() for sqlfun_cls in scoped_registry.values()),
+            workers=workers,
         )
-        definition.sql_definition = current_sql
-        definition.save()
+        for (function_name, sqlfun_cls), current_sql in zip(
+            scoped_registry.items(), normalized_definitions
+        ):
+            current_digest = get_sql_digest(current_sql)
+            app_label = sqlfun_cls.get_app_label()
+            if stored_definitions.get(function_name) != (current_digest, app_label):
+                changed_definitions.append(SqlFunDefinition(
+                    function_name=function_name,
+                    sql_definition=current_sql,
+                    sql_digest=current_digest,
+                    app_label=app_label,
+                ))
+
+        if changed_definitions:
+            SqlFunDefinition.objects.bulk_create(
+                changed_definitions,
+                update_conflicts=True,
+                unique_fields=['function_name'],
+                update_fields=['sql_definition', 'sql_digest', 'app_label'],
+            )
 
-    # Remove deleted functions from the SqlFunDefinition model
-    for stored_function in SqlFunDefinition.objects.all():
+        # Remove deleted functions from the SqlFunDefinition model
+        if removed_functions := stored_definitions.keys() - registry.keys():
+            SqlFunDefinition.objects.filter(
+                function_name__in=removed_functions
+            ).delete()
 
-        if not any(
-            func.get_function_name_from_sql() == stored_function.function_name
-            for func in SqlFun._registry
-        ):
-            stored_function.delete()
 
+def get_next_migration_number(
+    app_label: str,
+    loader: Optional[MigrationLoader] = None,
+) -> int:
+    if loader is not None:
+        migration_names = [
+            migration_name
+            for migration_app_label, migration_name in loader.disk_migrations
+            if migration_app_label == app_label
+        ]
+    else:
+        migrations_directory = pathlib.Path(settings.BASE_DIR) / app_label / 'migrations'
+        migration_names = [migration.name for migration in migrations_directory.glob('*.py')]
 
-def get_next_migration_number(app_label: str) -> int:
-    migrations_directory = pathlib.Path(settings.BASE_DIR) / app_label / 'migrations'
-    existing_migrations = migrations_directory.glob('*.py')
     migration_numbers = []
 
-    for migration in existing_migrations:
-        match = re.match(r'^(\d+)_', migration.name)
+    for migration_name in migration_names:
+        match = re.match(r'^(\d+)_', migration_name)
         if match:
             migration_numbers.append(int(match.group(1)))
 
@@ -175,19 +241,26 @@ def make_sqlfun_migrations(
         app_labels=None,
         is_dry_run=False,
         stdout=None,
+        workers=None,
+        offline=None,
 ) -> list[pathlib.Path]:
-    app_to_operations_map = get_migration_operations()
-
-    if app_labels:
-        app_to_operations_map = {
-            app_label: operations
-            for app_label, operations in app_to_operations_map.items()
-            if app_label in app_labels
-        }
+    # loading the migration graph imports every migration module in the
+    # project, so it is done at most once and shared by all apps
+    offline = is_offline(offline)
+    loader = MigrationLoader(None, ignore_no_migrations=True) if offline else None
+    app_to_operations_map = get_migration_operations(
+        app_labels=app_labels,
+        workers=workers,
+        offline=offline,
+        loader=loader,
+    )
 
     if not app_to_operations_map:
         return []
 
+    if loader is None:
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+
     migration_paths = []
 
     for app_label, operations in app_to_operations_map.items():
@@ -195,7 +268,7 @@ def make_sqlfun_migrations(
             verb = 'Would generate' if is_dry_run else 'Generating'
             stdout.write(f"[sqlfun] {verb} migration for app '{app_label}'")
 
-        next_migration_number = get_next_migration_number(app_label)
+        next_migration_number = get_next_migration_number(app_label, loader)
         migration_name = (
             custom_name or
             f"update_sqlfun_functions_{timezone.now().strftime('%Y%m%d_%H%M%S')}"
@@ -206,11 +279,13 @@ def make_sqlfun_migrations(
                 f'{next_migration_number:04}_{migration_name}',
                 app_label,
                 operations,
-                is_dry_run
+                is_dry_run,
+                loader,
             )
         )
 
-    if not is_dry_run:
-        update_sqlfun_definition_model()
+    # offline, the migration files written above are the record of what changed
+    if not is_dry_run and not offline:
+        update_sqlfun_definition_model(app_labels=app_labels, workers=workers)
 
     return migration_paths
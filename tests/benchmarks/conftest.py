@@ -0,0 +1,26 @@
+import pytest
+from django.db.models import IntegerField
+
+from sqlfun import SqlFun
+
+from .utils import make_synthetic_sql
+
+
+@pytest.fixture
+def synthetic_registry():
+    """Register ``count`` synthetic functions spread over ``apps`` app labels"""
+    registered = []
+
+    def register(count, apps=1, prefix='synthetic'):
+        for i in range(count):
+            registered.append(type(f'Synthetic{i}', (SqlFun,), {
+                'app_label': f'app_{i % apps}',
+                'sql': make_synthetic_sql(f'{prefix}_{i}'),
+                'output_field': IntegerField(),
+            }))
+        return registered
+
+    yield register
+
+    for sqlfun_cls in registered:
+        sqlfun_cls.deregister()
@@ -0,0 +1,37 @@
+import timeit
+
+import pytest
+from django.db.models import F, Func, IntegerField
+
+from test_project.models import BadSum, Foo
+
+ANNOTATIONS = 50
+NUMBER = 200
+
+
+def compile_queryset(queryset):
+    return queryset.query.get_compiler(using='default').as_sql()
+
+
+def best_of(queryset):
+    return min(timeit.repeat(lambda: compile_queryset(queryset), number=NUMBER, repeat=5))
+
+
+@pytest.mark.benchmark
+def test_sqlfun_compile_overhead_matches_plain_func():
+    sqlfun_queryset = Foo.objects.annotate(**{
+        f'value_{i}': BadSum(F('foo'), i) for i in range(ANNOTATIONS)
+    })
+    func_queryset = Foo.objects.annotate(**{
+        f'value_{i}': Func(F('foo'), i, function='bad_sum', output_field=IntegerField())
+        for i in range(ANNOTATIONS)
+    })
+
+    assert compile_queryset(sqlfun_queryset) == compile_queryset(func_queryset)
+
+    sqlfun_time = best_of(sqlfun_queryset)
+    func_time = best_of(func_queryset)
+    print(f'\nSqlFun: {sqlfun_time:.4f}s, Func: {func_time:.4f}s ({NUMBER} compiles)')
+
+    # generous bound so the benchmark is not flaky on noisy machines
+    assert sqlfun_time < func_time * 1.25
@@ -0,0 +1,36 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from django.db.migrations.loader import MigrationLoader
+
+from sqlfun.utils import make_sqlfun_migrations
+
+FUNCTIONS = 40
+
+
+def time_dry_run():
+    start = time.perf_counter()
+    with patch('sqlfun.utils.MigrationLoader', wraps=MigrationLoader) as mock_loader:
+        migration_paths = make_sqlfun_migrations('benchmark', is_dry_run=True)
+    return time.perf_counter() - start, len(migration_paths), mock_loader.call_count
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+def test_migration_generation_time_is_independent_of_changed_apps(synthetic_registry):
+    synthetic_registry(FUNCTIONS, apps=1, prefix='one_app')
+    # warm the normalization cache and import caches so only generation is timed
+    time_dry_run()
+    one_app_time, one_app_paths, one_app_loaders = time_dry_run()
+
+    synthetic_registry(FUNCTIONS, apps=FUNCTIONS, prefix='many_apps')
+    time_dry_run()
+    many_apps_time, many_apps_paths, many_apps_loaders = time_dry_run()
+
+    print(
+        f'\n{one_app_paths} app(s): {one_app_time:.3f}s, '
+        f'{many_apps_paths} app(s): {many_apps_time:.3f}s'
+    )
+    assert one_app_loaders == many_apps_loaders == 1
+    assert many_apps_time < one_app_time * 3
@@ -0,0 +1,23 @@
+import time
+
+import pytest
+
+from sqlfun.normalize import normalize_many
+
+
+@pytest.mark.benchmark
+def test_warm_normalization_cache_skips_sqlparse(settings, tmp_path, synthetic_registry):
+    settings.SQLFUN_NORMALIZATION_CACHE = tmp_path / 'normalized_sql.json'
+    sqls = [sqlfun_cls.sql for sqlfun_cls in synthetic_registry(1_000)]
+
+    start = time.perf_counter()
+    cold = normalize_many(sqls)
+    cold_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    warm = normalize_many(sqls)
+    warm_time = time.perf_counter() - start
+
+    print(f'\n1,000 functions: cold {cold_time:.3f}s, warm {warm_time:.3f}s')
+    assert warm == cold
+    assert warm_time * 10 < cold_time
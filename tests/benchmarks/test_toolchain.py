@@ -0,0 +1,80 @@
+import pytest
+from django.db.models import F
+
+from sqlfun.normalize import normalize_sql
+from sqlfun.utils import (
+    get_migration_operations,
+    make_sqlfun_migrations,
+    update_sqlfun_definition_model,
+)
+from test_project.models import Foo
+
+from .utils import measure
+
+REGISTRY_SIZES = [10, 1_000, 10_000]
+APPS = 50
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db]
+
+
+@pytest.fixture(autouse=True)
+def cold_normalization_cache(settings, tmp_path):
+    settings.SQLFUN_NORMALIZATION_CACHE = tmp_path / 'normalized_sql.json'
+
+
+@pytest.mark.parametrize('size', REGISTRY_SIZES)
+def test_normalize_sql(synthetic_registry, size):
+    registry = synthetic_registry(size, apps=APPS)
+    measure(
+        f'normalize_sql x{size}',
+        lambda: [normalize_sql(sqlfun_cls.sql) for sqlfun_cls in registry],
+    )
+
+
+@pytest.mark.parametrize('size', REGISTRY_SIZES)
+def test_get_migration_operations(synthetic_registry, size):
+    synthetic_registry(size, apps=APPS)
+    measure(f'get_migration_operations, nothing stored x{size}', get_migration_operations)
+
+    update_sqlfun_definition_model()
+    unchanged = measure(f'get_migration_operations, unchanged x{size}', get_migration_operations)
+    assert unchanged.queries == 1
+
+
+@pytest.mark.parametrize('size', REGISTRY_SIZES)
+def test_make_sqlfun_migrations(synthetic_registry, size):
+    synthetic_registry(size, apps=APPS)
+    dry_run = measure(
+        f'make_sqlfun_migrations --dry-run x{size}',
+        lambda: make_sqlfun_migrations('benchmark', is_dry_run=True),
+    )
+    assert dry_run.queries == 1
+
+    measure(
+        f'update_sqlfun_definition_model x{size}',
+        update_sqlfun_definition_model,
+        repeat_for_memory=False,
+    )
+
+
+@pytest.mark.parametrize('size', REGISTRY_SIZES)
+def test_update(synthetic_registry, size):
+    registry = synthetic_registry(size, apps=APPS)
+
+    def update_all():
+        for sqlfun_cls in registry:
+            sqlfun_cls.update()
+
+    measure(f'SqlFun.update x{size}', update_all)
+
+
+@pytest.mark.parametrize('size', [10, 100, 1_000])
+def test_queryset_compile(synthetic_registry, size):
+    registry = synthetic_registry(size, apps=APPS)
+    queryset = Foo.objects.annotate(**{
+        f'value_{i}': sqlfun_cls(F('foo')) for i, sqlfun_cls in enumerate(registry)
+    })
+    measure(
+        f'queryset compile, {size} annotations',
+        lambda: queryset.query.get_compiler(using='default').as_sql(),
+    )
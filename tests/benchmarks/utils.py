@@ -0,0 +1,73 @@
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from django.db import connection
+
+
+def make_synthetic_sql(name, statements=10):
+    body = '\n'.join(
+        f"            IF value > {i} THEN total := total + value * {i}; END IF;"
+        for i in range(statements)
+    )
+    return f"""
+        CREATE OR REPLACE FUNCTION {name}(value integer) RETURNS integer AS $$
+        DECLARE
+            total integer := 0;
+        BEGIN
+{body}
+            RETURN total;
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE;
+    """
+
+
+@dataclass
+class Measurement:
+    name: str
+    seconds: float
+    queries: int
+    peak_memory: int
+
+    def __str__(self):
+        return (
+            f'{self.name:<50} {self.seconds:>9.4f}s {self.queries:>7} queries '
+            f'{self.peak_memory / 1024 / 1024:>9.2f} MiB peak'
+        )
+
+
+class QueryCounter:
+    """Execute wrapper counting queries, without the query log's size limit"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(name, func, *, repeat_for_memory=True):
+    """Run ``func`` and record its wall time, query count and peak memory.
+
+    Memory is traced in a second run because tracemalloc slows everything down,
+    pass ``repeat_for_memory=False`` for functions that can't run twice.
+    """
+    queries = QueryCounter()
+    with connection.execute_wrapper(queries):
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+
+    peak_memory = 0
+    if repeat_for_memory:
+        tracemalloc.start()
+        try:
+            func()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    measurement = Measurement(name, seconds, queries.count, peak_memory)
+    print(f'\n{measurement}', end='')
+    return measurement
@@ -19,3 +19,28 @@ def wait_for_postgres(request, session_scoped_container_getter):
 @pytest.fixture(scope="session")
 def django_db_setup(wait_for_postgres, django_db_setup):
     pass
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--run-benchmarks',
+        action='store_true',
+        default=False,
+        help='Run the performance benchmarks in tests/benchmarks.',
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'benchmark: performance benchmark, only run with --run-benchmarks'
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--run-benchmarks'):
+        return
+
+    skip_benchmark = pytest.mark.skip(reason='needs --run-benchmarks to run')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip_benchmark)
@@ -0,0 +1,95 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from sqlfun import SqlFun
+from test_project.models import BadSum
+
+
+class FakeArray:
+    """Stands in for a NumPy array, which is converted with tolist()"""
+
+    def __init__(self, values):
+        self.values = values
+
+    def tolist(self):
+        return self.values
+
+
+@pytest.fixture
+def bad_sum():
+    BadSum.update()
+    return BadSum
+
+
+@pytest.mark.django_db
+def test_call(bad_sum):
+    with CaptureQueriesContext(connection) as calls:
+        assert bad_sum.call(1, 2) == 4
+        assert bad_sum.call(FakeArray(3), 4) == 8
+
+    statements = [query['sql'] for query in calls.captured_queries]
+    assert sum(sql.startswith('PREPARE') for sql in statements) == 1
+    assert sum(sql.startswith('EXECUTE') for sql in statements) == 2
+
+
+@pytest.mark.django_db
+def test_call_without_prepared_statements(bad_sum, settings):
+    settings.SQLFUN_PREPARED_STATEMENTS = False
+    with CaptureQueriesContext(connection) as calls:
+        assert bad_sum.call(1, 2) == 4
+    assert not any('PREPARE' in query['sql'] for query in calls.captured_queries)
+
+
+@pytest.mark.django_db
+def test_call_rejects_wrong_argument_counts(bad_sum):
+    with CaptureQueriesContext(connection) as calls:
+        with pytest.raises(TypeError, match=r'\(integer, integer\) takes 2 arguments, got 3'):
+            bad_sum.call(1, 2, 3)
+        with pytest.raises(TypeError, match='takes 2 arguments, got 1'):
+            bad_sum.call(1)
+    assert not calls.captured_queries
+
+
+@pytest.mark.django_db
+def test_call_many_batches_rows(bad_sum):
+    rows = [(number, number * 10) for number in range(25)]
+
+    results = bad_sum.call_many(iter(rows), batch_size=10)
+    with CaptureQueriesContext(connection) as calls:
+        assert next(results) == 1
+    # only the first batch has been sent so far
+    assert sum(query['sql'].startswith('EXECUTE') for query in calls.captured_queries) == 1
+
+    with CaptureQueriesContext(connection) as calls:
+        assert [1, *results] == [first + second + 1 for first, second in rows]
+    assert sum(query['sql'].startswith('EXECUTE') for query in calls.captured_queries) == 2
+
+    assert list(bad_sum.call_many(FakeArray([[1, 1], [2, 2]]))) == [3, 5]
+
+
+@pytest.mark.django_db
+def test_call_many_rejects_mismatched_rows(bad_sum):
+    with pytest.raises(ValueError, match='Expected rows of 2 arguments'):
+        list(bad_sum.call_many([(1, 2), (3,)]))
+
+
+@pytest.mark.django_db
+def test_call_many_rejects_array_arguments():
+    array_sum = type('array_sum', (SqlFun,), {
+        'app_label': 'test_project',
+        'sql': """
+            CREATE OR REPLACE FUNCTION array_sum(numbers integer[]) RETURNS bigint AS $$
+            SELECT sum(number) FROM unnest(numbers) AS number;
+            $$ LANGUAGE sql IMMUTABLE;
+        """,
+    })
+    try:
+        array_sum.update()
+        with CaptureQueriesContext(connection) as calls:
+            with pytest.raises(TypeError, match=r'array arguments \(integer\[\]\)'):
+                list(array_sum.call_many([([1, 2],), ([3, 4],)]))
+        assert not calls.captured_queries
+        assert array_sum.call([1, 2]) == 3
+    finally:
+        array_sum.deregister()
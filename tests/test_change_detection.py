@@ -1,11 +1,25 @@
+from unittest.mock import patch
+
 import pytest
 from django.core.management import call_command
 from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from sqlfun import SqlFun
-from sqlfun.utils import make_sqlfun_migrations
+from sqlfun.models import SqlFunDefinition
+from sqlfun.normalize import normalize_many
+from sqlfun.utils import (
+    get_migration_operations,
+    get_registry_by_function_name,
+    get_sql_digest,
+    make_sqlfun_migrations,
+    normalize_sql,
+    update_sqlfun_definition_model,
+)
+
+from test_project.models import BadSum
 
-from .utils import function_exists
+from .utils import function_exists, make_synthetic_sqlfun
 
 
 @pytest.mark.django_db
@@ -151,3 +165,144 @@ def test_dry_run_does_not_consume_detection():
         DryRunProbe.deregister()
         for path in written_paths:
             path.unlink(missing_ok=True)
+
+
+@pytest.mark.django_db
+def test_change_detection_query_count_is_constant(django_assert_num_queries):
+    synthetic = [make_synthetic_sqlfun(f'query_count_probe_{i}') for i in range(2)]
+    try:
+        with django_assert_num_queries(1):
+            operations = get_migration_operations()
+        assert len(operations['test_project']) >= 2
+
+        synthetic.extend(
+            make_synthetic_sqlfun(f'query_count_probe_{i}') for i in range(2, 50)
+        )
+        with django_assert_num_queries(1):
+            operations = get_migration_operations()
+        assert len(operations['test_project']) >= 50
+
+        # with every definition stored, the diff still needs one query
+        update_sqlfun_definition_model()
+        synthetic.pop().deregister()
+        with django_assert_num_queries(1):
+            operations = get_migration_operations()
+        assert len(operations['test_project']) == 1
+    finally:
+        for sqlfun_cls in synthetic:
+            sqlfun_cls.deregister()
+
+
+@pytest.mark.django_db
+def test_definition_sync_statement_count_is_constant():
+    synthetic = [make_synthetic_sqlfun(f'sync_probe_{i}') for i in range(2)]
+    try:
+        update_sqlfun_definition_model()
+        with CaptureQueriesContext(connection) as small_registry:
+            update_sqlfun_definition_model()
+
+        synthetic.extend(make_synthetic_sqlfun(f'sync_probe_{i}') for i in range(2, 50))
+        update_sqlfun_definition_model()
+        with CaptureQueriesContext(connection) as large_registry:
+            update_sqlfun_definition_model()
+
+        # nothing changed: only the read is issued, regardless of registry size
+        assert len(small_registry) == len(large_registry)
+        assert not any(
+            query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+            for query in large_registry.captured_queries
+        )
+
+        synthetic[0].sql = synthetic[0].sql.replace('SELECT 1', 'SELECT 2')
+        synthetic.pop().deregister()
+        with CaptureQueriesContext(connection) as changed_registry:
+            update_sqlfun_definition_model()
+        statements = [query['sql'] for query in changed_registry.captured_queries]
+        assert sum(sql.startswith('INSERT') for sql in statements) == 1
+        assert sum(sql.startswith('DELETE') for sql in statements) == 1
+        assert SqlFunDefinition.objects.get(
+            function_name='sync_probe_0'
+        ).sql_definition == normalize_sql(synthetic[0].sql)
+        assert not SqlFunDefinition.objects.filter(function_name='sync_probe_49').exists()
+    finally:
+        for sqlfun_cls in synthetic:
+            sqlfun_cls.deregister()
+
+
+@pytest.mark.django_db
+def test_change_detection_compares_digests():
+    probe = make_synthetic_sqlfun('digest_probe')
+    try:
+        update_sqlfun_definition_model()
+        stored = SqlFunDefinition.objects.get(function_name='digest_probe')
+        assert stored.sql_digest == get_sql_digest(stored.sql_definition)
+
+        previous_sql = stored.sql_definition
+        probe.sql = probe.sql.replace('SELECT 1', 'SELECT 2')
+        with CaptureQueriesContext(connection) as queries:
+            operations = get_migration_operations()
+
+        # the stored bodies are only fetched for the function that changed
+        assert len(queries) == 2
+        assert 'sql_definition' not in queries[0]['sql']
+        assert operations['test_project'][0].reverse_sql == previous_sql
+    finally:
+        probe.deregister()
+
+
+@pytest.mark.django_db
+def test_change_detection_is_scoped_to_app_labels():
+    in_scope = make_synthetic_sqlfun('scoped_probe')
+    out_of_scope = type('OtherAppProbe', (SqlFun,), {
+        'app_label': 'other_app',
+        'sql': in_scope.sql.replace('scoped_probe', 'other_app_probe'),
+    })
+    try:
+        update_sqlfun_definition_model()
+        in_scope.sql = in_scope.sql.replace('SELECT 1', 'SELECT 2')
+        out_of_scope.sql = out_of_scope.sql.replace('SELECT 1', 'SELECT 2')
+
+        normalized_sqls = []
+
+        def recording_normalize_many(sqls, **kwargs):
+            sqls = list(sqls)
+            normalized_sqls.extend(sqls)
+            return normalize_many(sqls, **kwargs)
+
+        with patch('sqlfun.utils.normalize_many', side_effect=recording_normalize_many):
+            operations = get_migration_operations(app_labels=['test_project'])
+        assert set(operations) == {'test_project'}
+        assert in_scope.sql in normalized_sqls
+        assert out_of_scope.sql not in normalized_sqls
+
+        # syncing one app leaves the other app's pending change detectable
+        update_sqlfun_definition_model(app_labels=['test_project'])
+        assert get_migration_operations(app_labels=['test_project']) == {}
+        assert len(get_migration_operations(app_labels=['other_app'])['other_app']) == 1
+    finally:
+        in_scope.deregister()
+        out_of_scope.deregister()
+
+
+def test_app_label_is_resolved_once_per_class():
+    with patch('inspect.getfile') as mock_getfile:
+        assert BadSum.get_app_label() == 'test_project'
+    mock_getfile.assert_not_called()
+
+
+def test_overloaded_functions_are_rejected():
+    probe = make_synthetic_sqlfun('overload_probe')
+    overload = type('overload_probe_text', (SqlFun,), {
+        'app_label': 'test_project',
+        'sql': """
+            CREATE OR REPLACE FUNCTION overload_probe(value text) RETURNS integer AS $$
+            SELECT 1;
+            $$ LANGUAGE sql IMMUTABLE;
+        """,
+    })
+    try:
+        with pytest.raises(ValueError, match='both define overload_probe'):
+            get_registry_by_function_name()
+    finally:
+        probe.deregister()
+        overload.deregister()
@@ -0,0 +1,128 @@
+import re
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db.models import IntegerField
+
+from sqlfun import SqlFun
+from sqlfun.compare import compare_definitions
+from sqlfun.metadata import rename_definition
+from sqlfun.utils import make_sqlfun_migrations
+
+from test_project.models import Foo
+
+from .utils import function_exists
+
+# not immutable, since postgres folds immutable calls on constants while planning
+PREVIOUS_SQL = """
+    CREATE OR REPLACE FUNCTION public.compare_probe(value integer) RETURNS integer AS $$
+    BEGIN
+        RETURN value + 1;
+    END;
+    $$ LANGUAGE plpgsql STABLE;
+"""
+
+
+def make_compare_probe(**attributes):
+    return type('compare_probe', (SqlFun,), {
+        'app_label': 'test_project',
+        'sql': PREVIOUS_SQL,
+        'output_field': IntegerField(),
+        **attributes,
+    })
+
+
+def test_rename_definition():
+    renamed = rename_definition(PREVIOUS_SQL, 'Other name')
+    assert 'FUNCTION public."Other name"(value integer)' in renamed
+
+
+@pytest.mark.django_db
+def test_compare_definitions():
+    probe = make_compare_probe(sample_arguments=[(1,), (2,)], cost=10_000)
+    try:
+        comparison = compare_definitions(probe, PREVIOUS_SQL, iterations=3)
+    finally:
+        probe.deregister()
+
+    assert len(comparison.previous.durations) == len(comparison.current.durations) == 6
+    assert comparison.previous.p50 <= comparison.previous.p99
+    assert comparison.cost_change > 10
+    assert comparison.is_regression(0.2)
+    assert not function_exists('sqlfun_compare_previous')
+    assert not function_exists('sqlfun_compare_current')
+
+
+@pytest.mark.django_db
+def test_compare_definitions_with_sample_query():
+    Foo.objects.bulk_create(Foo(foo=number) for number in range(10))
+    probe = make_compare_probe(
+        sample_query='SELECT %(function)s(foo) FROM test_project_foo WHERE foo %% 2 = 0',
+    )
+    try:
+        comparison = compare_definitions(probe, PREVIOUS_SQL, iterations=2)
+    finally:
+        probe.deregister()
+
+    assert len(comparison.current.durations) == 2
+    assert not comparison.is_regression(0.2)
+
+
+@pytest.mark.django_db
+def test_compare_command_fails_on_regression(capsys):
+    probe = make_compare_probe(sample_arguments=[(1,)])
+    migration_paths = []
+    try:
+        migration_paths = make_sqlfun_migrations('compare_probe', offline=True)
+        probe.cost = 10_000
+        with pytest.raises(CommandError, match='public.compare_probe'):
+            call_command(
+                'sqlfun_compare', 'test_project', '--sqlfun-offline', '--iterations', '2'
+            )
+        previous_cost, current_cost = re.search(
+            r'cost ([\d.]+) -> ([\d.]+)', capsys.readouterr().out
+        ).groups()
+        assert float(current_cost) > float(previous_cost)
+
+        call_command(
+            'sqlfun_compare', 'test_project', '--sqlfun-offline',
+            '--iterations', '2', '--threshold', '1000',
+        )
+    finally:
+        probe.deregister()
+        for path in migration_paths:
+            path.unlink()
+
+
+@pytest.mark.django_db
+def test_compare_skips_samples_that_cannot_call_both_definitions(capsys):
+    probe = make_compare_probe(
+        sql=PREVIOUS_SQL.replace('(value integer)', '(value integer, other integer)'),
+        sample_arguments=[(1, 2)],
+    )
+    try:
+        with pytest.raises(ValueError, match=r'changed from \(integer\) to \(integer, integer\)'):
+            compare_definitions(probe, PREVIOUS_SQL, iterations=2)
+
+        probe.sql = PREVIOUS_SQL
+        with pytest.raises(ValueError, match='cannot be called with the sample arguments'):
+            compare_definitions(probe, PREVIOUS_SQL, iterations=2)
+    finally:
+        probe.deregister()
+
+
+@pytest.mark.django_db
+def test_compare_command_skips_changed_arguments(capsys):
+    probe = make_compare_probe(sample_arguments=[(1,)])
+    migration_paths = []
+    try:
+        migration_paths = make_sqlfun_migrations('compare_arguments', offline=True)
+        probe.sql = PREVIOUS_SQL.replace('(value integer)', '(value integer, other integer)')
+        probe.sample_arguments = [(1, 2)]
+
+        call_command('sqlfun_compare', 'test_project', '--sqlfun-offline', '--iterations', '2')
+        assert 'public.compare_probe: skipped.' in capsys.readouterr().err
+    finally:
+        probe.deregister()
+        for path in migration_paths:
+            path.unlink()
@@ -0,0 +1,76 @@
+from django.db import migrations, models
+from django.db.models import F, Q, Value
+from django.test.utils import isolate_apps
+
+from sqlfun.checks import check_indexed_functions
+from sqlfun.dependencies import add_function_dependencies, find_sqlfun_classes
+from sqlfun.utils import make_sqlfun_migrations
+
+from test_project.models import BadSum
+
+from .utils import make_synthetic_sqlfun
+
+
+def test_find_sqlfun_classes():
+    probe = make_synthetic_sqlfun('dependency_probe')
+    try:
+        assert find_sqlfun_classes(models.Index(BadSum(F('foo'), Value(1)), name='idx')) == {BadSum}
+        assert find_sqlfun_classes(models.UniqueConstraint(
+            F('foo'), name='unique', condition=Q(foo__gt=probe(output_field=models.IntegerField())),
+        )) == {probe}
+        assert find_sqlfun_classes(migrations.AddField('foo', 'bar', models.GeneratedField(
+            expression=BadSum(F('foo'), Value(1)),
+            output_field=models.IntegerField(),
+            db_persist=True,
+        ))) == {BadSum}
+        assert find_sqlfun_classes(models.Index(F('foo'), name='plain')) == set()
+    finally:
+        probe.deregister()
+
+
+@isolate_apps('test_project')
+def test_check_refuses_functions_that_are_not_immutable():
+    probe = make_synthetic_sqlfun('dependency_immutable_probe')
+
+    class Indexed(models.Model):
+        foo = models.IntegerField()
+        doubled = models.GeneratedField(
+            expression=BadSum(F('foo'), F('foo')),
+            output_field=models.IntegerField(),
+            db_persist=True,
+        )
+
+        class Meta:
+            app_label = 'test_project'
+            indexes = [
+                models.Index(BadSum(F('foo'), Value(1)), name='bad_sum_idx'),
+                models.Index(probe(output_field=models.IntegerField()), name='probe_idx'),
+            ]
+
+    try:
+        messages = check_indexed_functions([Indexed._meta.apps.get_app_config('test_project')])
+    finally:
+        probe.deregister()
+
+    assert [message.id for message in messages] == ['sqlfun.E001', 'sqlfun.E001']
+    assert 'index bad_sum_idx' in messages[0].msg
+    assert 'generated field doubled' in messages[1].msg
+    assert 'STABLE' in messages[0].msg
+
+
+def test_indexes_depend_on_the_function_migration():
+    probe = make_synthetic_sqlfun('dependency_migration_probe')
+    migration_paths = []
+    try:
+        migration_paths = make_sqlfun_migrations('dependency_probe', offline=True)
+        migration = migrations.Migration('0001_probe_index', 'myapp')
+        migration.operations = [migrations.AddIndex(
+            'foo', models.Index(probe(output_field=models.IntegerField()), name='probe_idx'),
+        )]
+        add_function_dependencies({'myapp': [migration]})
+    finally:
+        probe.deregister()
+        for path in migration_paths:
+            path.unlink()
+
+    assert migration.dependencies == [('test_project', migration_paths[0].stem)]
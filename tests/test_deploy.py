@@ -0,0 +1,138 @@
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from sqlfun import SqlFun
+from sqlfun.deploy import FINGERPRINT_PREFIX, apply_definitions, rollout
+
+from .utils import make_synthetic_sqlfun
+
+
+def call(function_name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {function_name}()')
+        return cursor.fetchone()[0]
+
+
+def count_function_definitions(captured_queries):
+    return sum(
+        query['sql'].count('CREATE OR REPLACE FUNCTION') for query in captured_queries
+    )
+
+
+@pytest.mark.django_db
+def test_apply_definitions_skips_deployed_functions():
+    synthetic = [make_synthetic_sqlfun(f'deploy_probe_{i}') for i in range(3)]
+    try:
+        assert apply_definitions(synthetic) == synthetic
+        assert [call(f'deploy_probe_{i}') for i in range(3)] == [1, 1, 1]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT obj_description('deploy_probe_0()'::regprocedure, 'pg_proc')"
+            )
+            assert cursor.fetchone()[0].startswith(FINGERPRINT_PREFIX)
+
+        # nothing changed: only the deployed fingerprints are read
+        with CaptureQueriesContext(connection) as unchanged:
+            assert apply_definitions(synthetic) == []
+        assert count_function_definitions(unchanged.captured_queries) == 0
+
+        synthetic[1].sql = synthetic[1].sql.replace('SELECT 1', 'SELECT 2')
+        assert apply_definitions(synthetic) == [synthetic[1]]
+        assert call('deploy_probe_1') == 2
+
+        assert apply_definitions(synthetic, force=True) == synthetic
+    finally:
+        for sqlfun_cls in synthetic:
+            sqlfun_cls.deregister()
+
+
+@pytest.mark.django_db
+def test_functions_replaced_since_the_last_deploy_are_applied():
+    probe = make_synthetic_sqlfun('stamp_probe')
+    try:
+        assert probe in SqlFun.update_all()
+
+        # replacing the function keeps the stamp of the previous deploy
+        original_sql = probe.sql
+        probe.sql = original_sql.replace('SELECT 1', 'SELECT 2')
+        probe.update()
+        assert call('stamp_probe') == 2
+
+        probe.sql = original_sql
+        assert probe in SqlFun.update_all()
+        assert call('stamp_probe') == 1
+
+        probe.parallel = 'safe'
+        assert SqlFun.update_all() == [probe]
+        assert SqlFun.update_all() == []
+    finally:
+        probe.deregister()
+
+
+@pytest.mark.django_db
+def test_apply_definitions_batches_statements():
+    synthetic = [make_synthetic_sqlfun(f'batch_probe_{i}') for i in range(5)]
+    try:
+        with CaptureQueriesContext(connection) as batched:
+            apply_definitions(synthetic, batch_size=2)
+        definition_statements = [
+            query for query in batched.captured_queries
+            if 'CREATE OR REPLACE FUNCTION' in query['sql']
+        ]
+        assert len(definition_statements) == 3
+        assert count_function_definitions(definition_statements) == 5
+    finally:
+        for sqlfun_cls in synthetic:
+            sqlfun_cls.deregister()
+
+
+@pytest.mark.django_db
+def test_update_all_applies_the_registry():
+    probe = make_synthetic_sqlfun('update_all_probe')
+    try:
+        assert probe in SqlFun.update_all()
+        assert call('update_all_probe') == 1
+        assert probe not in SqlFun.update_all()
+    finally:
+        probe.deregister()
+
+
+class DenyProbeRouter:
+    def allow_migrate(self, db, app_label, **hints):
+        if hints.get('sqlfun_function') == 'routed_probe_denied':
+            return False
+        return None
+
+
+@pytest.mark.django_db
+def test_apply_definitions_respects_routers(settings):
+    settings.DATABASE_ROUTERS = [DenyProbeRouter()]
+    probes = [make_synthetic_sqlfun(f'routed_probe_{name}') for name in ('allowed', 'denied')]
+    try:
+        assert apply_definitions(probes) == probes[:1]
+    finally:
+        for sqlfun_cls in probes:
+            sqlfun_cls.deregister()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rollout_reports_each_database():
+    probe = make_synthetic_sqlfun('rollout_probe')
+    try:
+        results = rollout(['default', 'missing_alias'], [probe], workers=2)
+
+        assert [result.database for result in results] == ['default', 'missing_alias']
+        assert results[0].ok and results[0].applied == [probe]
+        assert not results[1].ok and results[1].duration >= 0
+        assert call('rollout_probe') == 1
+
+        with pytest.raises(CommandError, match='missing_alias'):
+            call_command('sqlfun_apply', '--database', 'missing_alias', '--database', 'default')
+    finally:
+        probe.deregister()
+        with connection.cursor() as cursor:
+            cursor.execute('DROP FUNCTION IF EXISTS rollout_probe()')
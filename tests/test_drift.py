@@ -0,0 +1,88 @@
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from sqlfun import SqlFun
+from sqlfun.deploy import apply_definitions
+from sqlfun.drift import detect_drift
+from sqlfun.utils import update_sqlfun_definition_model
+
+from .utils import make_synthetic_sqlfun
+
+
+@pytest.mark.django_db
+def test_detect_drift_against_the_catalog(django_assert_num_queries):
+    probes = [make_synthetic_sqlfun(f'drift_probe_{i}') for i in range(3)]
+    try:
+        report = detect_drift(probes)
+        assert report.missing == ['drift_probe_0()', 'drift_probe_1()', 'drift_probe_2()']
+        assert report.has_drift
+
+        apply_definitions(probes)
+        # the catalog, and the names of the functions migrated before
+        with django_assert_num_queries(2):
+            report = detect_drift(probes)
+        assert not report.has_drift
+
+        # changed behind sqlfun's back, comment and all
+        with connection.cursor() as cursor:
+            cursor.execute(probes[0].sql.replace('SELECT 1', 'SELECT 2'))
+            cursor.execute(probes[1].sql.replace('IMMUTABLE', 'VOLATILE'))
+            cursor.execute(
+                'CREATE FUNCTION drift_probe_2(integer) RETURNS integer '
+                'AS $$ SELECT 1 $$ LANGUAGE sql'
+            )
+        report = detect_drift(probes)
+        assert report.stale == ['drift_probe_0()', 'drift_probe_1()']
+        assert report.extra == ['public.drift_probe_2(integer)']
+
+        # deployed by sqlfun, but no longer registered
+        report = detect_drift(probes[:2])
+        assert 'public.drift_probe_2()' in report.extra
+    finally:
+        for sqlfun_cls in probes:
+            sqlfun_cls.deregister()
+
+
+@pytest.mark.django_db
+def test_removed_functions_are_extra():
+    probe = make_synthetic_sqlfun('drift_removed_probe')
+    kept = make_synthetic_sqlfun('drift_kept_probe')
+    try:
+        # migrated, so without the stamp apply_definitions leaves
+        probe.update()
+        kept.update()
+        update_sqlfun_definition_model()
+        assert not detect_drift([probe, kept]).has_drift
+
+        probe.deregister()
+        assert detect_drift([kept]).extra == ['public.drift_removed_probe()']
+    finally:
+        if probe in SqlFun._registry:
+            probe.deregister()
+        kept.deregister()
+
+
+@pytest.mark.django_db
+def test_signatures_are_resolved_by_postgres():
+    probe = make_synthetic_sqlfun('drift_alias_probe')
+    probe.sql = probe.sql.replace('drift_alias_probe()', 'drift_alias_probe(value int4)')
+    try:
+        apply_definitions([probe])
+        assert not detect_drift([probe]).has_drift
+    finally:
+        probe.deregister()
+
+
+@pytest.mark.django_db
+def test_drift_command_exits_with_an_error_on_drift():
+    probe = make_synthetic_sqlfun('drift_command_probe')
+    try:
+        with pytest.raises(SystemExit) as exit_info:
+            call_command('sqlfun_drift')
+        assert exit_info.value.code == 1
+
+        SqlFun.update_all()
+        call_command('sqlfun_drift', '--database', 'default')
+    finally:
+        probe.deregister()
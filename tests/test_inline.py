@@ -0,0 +1,90 @@
+import pytest
+from django.db.models import F, IntegerField, TextField, Value
+
+from sqlfun import SqlFun
+from sqlfun.inline import compile_inline_template
+from sqlfun.metadata import parse_function_definition
+
+from test_project.models import Foo
+
+
+def make_inline_sqlfun(name, sql, output_field=None):
+    return type(name, (SqlFun,), {
+        'sql': sql,
+        'inline': True,
+        'output_field': output_field or IntegerField(),
+    })
+
+
+@pytest.mark.parametrize('body, is_inlinable', [
+    ('SELECT first + second + 1;', True),
+    ('SELECT coalesce(first, 0) * 2 -- doubled', True),
+    ('SELECT $1 + $2', True),
+    ('SELECT first FROM foo', False),
+    ('SELECT first, second', False),
+    ('SELECT (SELECT max(first) FROM foo)', False),
+    ('SELECT probe.first', False),
+    ('UPDATE foo SET foo = 1 RETURNING 1', False),
+])
+def test_compile_inline_template(body, is_inlinable):
+    metadata = parse_function_definition(f"""
+        CREATE OR REPLACE FUNCTION probe(first integer, second integer)
+        RETURNS integer AS $$ {body} $$ LANGUAGE sql IMMUTABLE;
+    """)
+    assert (compile_inline_template(metadata) is not None) == is_inlinable
+
+
+@pytest.mark.parametrize('clauses', ['STRICT', 'SECURITY DEFINER', "SET search_path = ''"])
+def test_functions_changing_semantics_are_not_inlined(clauses):
+    metadata = parse_function_definition(f"""
+        CREATE OR REPLACE FUNCTION probe(first integer) RETURNS integer
+        AS $$ SELECT first $$ LANGUAGE sql IMMUTABLE {clauses};
+    """)
+    assert compile_inline_template(metadata) is None
+
+
+@pytest.mark.django_db
+def test_inlined_function_in_queryset():
+    # never created in the database: only the inlined body can be evaluated
+    InlineSum = make_inline_sqlfun('InlineSum', """
+        CREATE OR REPLACE FUNCTION inline_sum(first integer, second integer)
+        RETURNS integer AS $$
+        SELECT first + second + 1;
+        $$ LANGUAGE sql IMMUTABLE;
+    """)
+    Percent = make_inline_sqlfun('Percent', """
+        CREATE OR REPLACE FUNCTION inline_percent(value integer) RETURNS text AS $$
+        SELECT value * 100 || '%';
+        $$ LANGUAGE sql IMMUTABLE;
+    """, TextField())
+    try:
+        Foo.objects.create(foo=3)
+        queryset = Foo.objects.annotate(
+            total=InlineSum(F('foo'), Value(5)),
+            percent=Percent(F('foo')),
+        )
+        assert 'inline_sum' not in str(queryset.query)
+        result = queryset.get()
+        assert result.total == 3 + 5 + 1
+        assert result.percent == '300%'
+    finally:
+        InlineSum.deregister()
+        Percent.deregister()
+
+
+def test_repeated_arguments_are_only_inlined_when_plain():
+    Square = make_inline_sqlfun('Square', """
+        CREATE OR REPLACE FUNCTION inline_square(value integer) RETURNS integer AS $$
+        SELECT value * value;
+        $$ LANGUAGE sql IMMUTABLE;
+    """)
+    try:
+        assert 'inline_square' not in str(
+            Foo.objects.annotate(square=Square(F('foo'))).query
+        )
+        # an expression used twice would be evaluated twice
+        assert 'inline_square' in str(
+            Foo.objects.annotate(square=Square(F('foo') + 1)).query
+        )
+    finally:
+        Square.deregister()
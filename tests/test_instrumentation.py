@@ -0,0 +1,79 @@
+from unittest.mock import patch
+
+import pytest
+from django.db import connection
+from django.db.models import F
+
+from sqlfun.instrumentation import QueryCollector, track_compiled
+
+from test_project.models import BadSum, Foo
+
+from .utils import make_synthetic_sqlfun
+
+
+@pytest.mark.django_db
+def test_collector_attributes_queries_to_functions():
+    BadSum.update()
+    Foo.objects.bulk_create([Foo(foo=1), Foo(foo=2)])
+
+    with QueryCollector().collect() as collector:
+        list(Foo.objects.annotate(total=BadSum(F('foo'), 1)))
+        Foo.objects.count()
+
+    stats = collector.reset()
+    assert list(stats) == ['bad_sum']
+    assert stats['bad_sum'].queries == 1
+    assert stats['bad_sum'].rows == 2
+    assert stats['bad_sum'].duration > 0
+    assert not collector.stats
+
+
+@pytest.mark.django_db
+def test_query_tags(settings):
+    settings.SQLFUN_QUERY_TAGS = True
+    BadSum.update()
+    Foo.objects.create(foo=1)
+    queryset = Foo.objects.annotate(total=BadSum(F('foo'), 1))
+    assert '/* sqlfun:bad_sum */ bad_sum(' in str(queryset.query)
+
+    # installed collectors rely on the tags alone
+    collector = QueryCollector()
+    collector.install()
+    try:
+        assert collector in connection.execute_wrappers
+        assert queryset.get().total == 3
+    finally:
+        collector.uninstall()
+    assert collector not in connection.execute_wrappers
+    assert collector.stats['bad_sum'].queries == 1
+
+
+@pytest.mark.django_db
+def test_unsampled_queries_are_not_measured():
+    BadSum.update()
+    with patch('sqlfun.instrumentation.random.random', side_effect=[0.5, 0.05]):
+        with QueryCollector(sample_rate=0.1).collect() as collector:
+            list(Foo.objects.annotate(total=BadSum(F('foo'), 1)))
+            list(Foo.objects.annotate(total=BadSum(F('foo'), 2)))
+
+    assert collector.stats['bad_sum'].queries == 1
+
+
+def test_untagged_compiles_skip_the_function_name(settings):
+    settings.SQLFUN_QUERY_TAGS = False
+    with patch.object(BadSum, 'get_qualified_name') as get_qualified_name:
+        assert track_compiled(BadSum, 'bad_sum(1, 2)') == 'bad_sum(1, 2)'
+    get_qualified_name.assert_not_called()
+
+    settings.SQLFUN_QUERY_TAGS = True
+    assert track_compiled(BadSum, 'bad_sum(1, 2)') == '/* sqlfun:bad_sum */ bad_sum(1, 2)'
+
+
+def test_qualified_name_follows_sql():
+    probe = make_synthetic_sqlfun('instrumentation_probe')
+    try:
+        assert probe.get_qualified_name() == 'instrumentation_probe'
+        probe.sql = probe.sql.replace('instrumentation_probe()', 'instrumentation_renamed()')
+        assert probe.get_qualified_name() == 'instrumentation_renamed'
+    finally:
+        probe.deregister()
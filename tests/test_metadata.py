@@ -0,0 +1,82 @@
+import pytest
+
+from sqlfun import SqlFun
+from sqlfun.metadata import FunctionArgument, parse_function_definition
+from test_project.models import BadSum
+
+
+def test_parse_function_definition():
+    metadata = parse_function_definition(BadSum.sql)
+
+    assert metadata.name == 'bad_sum'
+    assert metadata.schema is None
+    assert metadata.qualified_name == 'bad_sum'
+    assert metadata.arguments == (
+        FunctionArgument(name='first', type='integer'),
+        FunctionArgument(name='second', type='integer'),
+    )
+    assert metadata.argument_types == ('integer', 'integer')
+    assert metadata.return_type == 'integer'
+    assert metadata.language == 'sql'
+    assert metadata.volatility == 'stable'
+    assert metadata.body.strip() == 'SELECT first + second + 1;'
+
+
+def test_parse_function_definition_ignores_body_contents():
+    metadata = parse_function_definition("""
+        create or replace function reporting.describe(
+            double precision,
+            OUT label text,
+            since timestamp with time zone DEFAULT now()
+        ) returns table (label text, total bigint) as $body$
+        BEGIN
+            -- LANGUAGE sql IMMUTABLE
+            RETURN QUERY SELECT 'x', 1;
+        END;
+        $body$ LANGUAGE plpgsql;
+    """)
+
+    assert metadata.qualified_name == 'reporting.describe'
+    assert metadata.argument_types == ('double precision', 'timestamp with time zone')
+    assert metadata.arguments[1] == FunctionArgument(name='label', type='text', mode='out')
+    assert metadata.arguments[2].has_default
+    assert metadata.return_type == 'table (label text, total bigint)'
+    assert metadata.language == 'plpgsql'
+    assert metadata.volatility is None
+
+
+def test_parse_function_definition_without_function_name():
+    with pytest.raises(ValueError, match='Could not determine function name'):
+        parse_function_definition('SELECT 1;')
+
+
+def test_metadata_is_reparsed_when_sql_changes():
+    class Renamed(SqlFun):
+        sql = """
+            CREATE OR REPLACE FUNCTION renamed_before() RETURNS integer AS $$
+            SELECT 1;
+            $$ LANGUAGE sql IMMUTABLE;
+        """
+
+    try:
+        metadata = Renamed.get_metadata()
+        assert metadata.name == 'renamed_before'
+        assert Renamed.get_metadata() is metadata
+
+        Renamed.sql = Renamed.sql.replace('renamed_before', 'renamed_after')
+        assert Renamed.get_metadata().name == 'renamed_after'
+        assert Renamed.get_function_name_from_sql() == 'renamed_after'
+    finally:
+        Renamed.deregister()
+
+
+def test_parse_table_columns():
+    assert parse_function_definition("""
+        CREATE FUNCTION top_scores(n integer)
+        RETURNS TABLE (player_id integer, "Score" numeric(10, 2)) AS $$ SELECT 1, 2 $$ LANGUAGE sql;
+    """).table_columns == ('player_id', '"Score"')
+    assert parse_function_definition("""
+        CREATE FUNCTION split(value integer, OUT low integer, OUT high integer)
+        RETURNS SETOF record AS $$ SELECT 1, 2 $$ LANGUAGE sql;
+    """).table_columns == ('low', 'high')
+    assert parse_function_definition(BadSum.sql).table_columns == ()
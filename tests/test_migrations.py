@@ -1,13 +1,20 @@
+import importlib
 import pathlib
 from unittest.mock import mock_open, patch
 
+from django.db.migrations.loader import MigrationLoader
+
 import pytest
+from django.apps import apps
 from django.conf import settings
 from django.core.management import call_command
+from django.db import connection
 
 from sqlfun import SqlFun
+from sqlfun.models import SqlFunDefinition
 from sqlfun.utils import (
     generate_migration,
+    get_next_migration_number,
     make_sqlfun_migrations,
 )
 
@@ -72,3 +79,59 @@ def test_generate_migration_write():
         )
         assert migration_path == expected_path
         mock_file.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_migration_loader_is_shared_across_apps():
+    sqlfun_classes = [
+        type(f'LoaderProbe{i}', (SqlFun,), {
+            'app_label': f'loader_probe_app_{i}',
+            'sql': f"""
+                CREATE OR REPLACE FUNCTION loader_probe_{i}() RETURNS integer AS $$
+                SELECT {i};
+                $$ LANGUAGE sql IMMUTABLE;
+            """,
+        })
+        for i in range(3)
+    ]
+    try:
+        with patch('sqlfun.utils.MigrationLoader', wraps=MigrationLoader) as mock_loader:
+            migration_paths = make_sqlfun_migrations('shared_loader', is_dry_run=True)
+        assert len(migration_paths) >= 3
+        mock_loader.assert_called_once()
+    finally:
+        for sqlfun_cls in sqlfun_classes:
+            sqlfun_cls.deregister()
+
+
+def test_next_migration_number_from_loader_matches_directory():
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    assert get_next_migration_number('test_project', loader) == (
+        get_next_migration_number('test_project')
+    )
+    assert get_next_migration_number('sqlfun', loader) == 4
+
+
+@pytest.mark.django_db
+def test_stored_function_names_are_qualified():
+    migration = importlib.import_module('sqlfun.migrations.0003_qualify_function_names')
+    qualified_sql = """
+        CREATE OR REPLACE FUNCTION public.qualified_probe() RETURNS integer AS $$
+        SELECT 1;
+        $$ LANGUAGE sql IMMUTABLE;
+    """
+    SqlFunDefinition.objects.create(
+        function_name='public', sql_definition=qualified_sql, app_label='test_project'
+    )
+    SqlFunDefinition.objects.create(
+        function_name='plain_probe',
+        sql_definition=qualified_sql.replace('public.qualified_probe', 'plain_probe'),
+        app_label='test_project',
+    )
+
+    with connection.schema_editor() as schema_editor:
+        migration.qualify_function_names(apps, schema_editor)
+
+    assert sorted(
+        SqlFunDefinition.objects.values_list('function_name', flat=True)
+    ) == ['plain_probe', 'public.qualified_probe']
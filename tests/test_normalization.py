@@ -0,0 +1,74 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from sqlfun.normalize import NormalizationCache, normalize_many, normalize_sql
+
+SQL = """
+    create or replace function cache_probe() returns integer as $$
+    select 1;
+    $$ language sql immutable;
+"""
+
+
+@pytest.fixture
+def cache_path(settings, tmp_path):
+    settings.SQLFUN_NORMALIZATION_CACHE = tmp_path / 'normalized_sql.json'
+    return settings.SQLFUN_NORMALIZATION_CACHE
+
+
+def test_warm_cache_skips_formatting(cache_path):
+    assert normalize_many([SQL]) == [normalize_sql(SQL)]
+    assert cache_path.exists()
+
+    with patch('sqlfun.normalize.normalize_sql') as mock_normalize:
+        assert normalize_many([SQL]) == [normalize_sql(SQL)]
+    mock_normalize.assert_not_called()
+
+
+def test_cache_is_keyed_by_sqlparse_version(cache_path):
+    normalize_many([SQL])
+
+    with patch('sqlparse.__version__', '0.0.0'):
+        with patch('sqlfun.normalize.normalize_sql', return_value='') as mock_normalize:
+            normalize_many([SQL])
+    mock_normalize.assert_called_once_with(SQL)
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path):
+    cache = NormalizationCache(tmp_path / 'normalized_sql.json', max_entries=2)
+    cache.set('first', 'FIRST')
+    cache.set('second', 'SECOND')
+    cache.save()
+
+    cache = NormalizationCache(cache.path, max_entries=2)
+    assert cache.get('first') == 'FIRST'
+    cache.set('third', 'THIRD')
+    cache.save()
+
+    with cache.path.open() as cache_file:
+        entries = json.load(cache_file)
+    assert set(entries) == {
+        NormalizationCache.get_key('first'),
+        NormalizationCache.get_key('third'),
+    }
+
+
+def test_cache_is_opt_in():
+    assert NormalizationCache.from_settings() is None
+
+
+def test_cache_can_be_disabled(settings, tmp_path):
+    settings.SQLFUN_NORMALIZATION_CACHE = None
+
+    assert NormalizationCache.from_settings() is None
+    assert normalize_many([SQL]) == [normalize_sql(SQL)]
+    assert not list(tmp_path.iterdir())
+
+
+def test_parallel_normalization_matches_serial(settings):
+    settings.SQLFUN_NORMALIZATION_CACHE = None
+    sqls = [SQL.replace('cache_probe', f'parallel_probe_{i}') for i in range(100)]
+
+    assert normalize_many(sqls, workers=2) == normalize_many(sqls, workers=1)
@@ -0,0 +1,122 @@
+import json
+import pathlib
+from unittest.mock import patch
+
+from django.conf import settings
+from django.db import migrations
+
+from sqlfun import SqlFun
+from sqlfun.state import SQLFUN_HINT, get_sqlfun_operations
+from sqlfun.utils import get_migration_operations, make_sqlfun_migrations
+
+
+MIGRATIONS_DIR = pathlib.Path(settings.BASE_DIR) / 'test_project' / 'migrations'
+TRIGGER_MIGRATION = """
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [('test_project', '0001_initial')]
+    operations = [
+        migrations.RunSQL(
+            'CREATE FUNCTION my_trigger_fn() RETURNS trigger AS $$ '
+            'BEGIN RETURN NEW; END $$ LANGUAGE plpgsql;'
+        ),
+    ]
+"""
+
+
+def get_operations_by_function(app_label='test_project', **kwargs):
+    return {
+        operation.hints[SQLFUN_HINT]: operation
+        for operation in get_migration_operations(offline=True, **kwargs)[app_label]
+    }
+
+
+# no django_db marker: touching the database at all fails these tests
+def test_offline_change_detection_from_migration_files():
+    class OfflineProbe(SqlFun):
+        """Function used only by this test."""
+        app_label = 'test_project'
+        sql = """
+            CREATE OR REPLACE FUNCTION offline_probe(
+                first integer
+            ) RETURNS integer as $$
+            SELECT first;
+            $$
+            LANGUAGE sql
+            IMMUTABLE;
+        """
+
+    migration_paths = []
+    try:
+        assert 'offline_probe' in get_operations_by_function()
+
+        migration_paths = make_sqlfun_migrations('offline_probe', offline=True)
+        assert len(migration_paths) == 1
+        assert 'offline_probe' not in get_operations_by_function()
+
+        previous_sql = OfflineProbe.sql
+        OfflineProbe.sql = OfflineProbe.sql.replace('SELECT first', 'SELECT first + 1')
+        operation = get_operations_by_function()['offline_probe']
+        assert operation.sql == OfflineProbe.sql
+        assert operation.reverse_sql == previous_sql
+
+        OfflineProbe.deregister()
+        operation = get_operations_by_function()['offline_probe']
+        assert operation.sql == 'DROP FUNCTION IF EXISTS offline_probe;'
+    finally:
+        if OfflineProbe in SqlFun._registry:
+            OfflineProbe.deregister()
+        for path in migration_paths:
+            path.unlink(missing_ok=True)
+
+
+def test_offline_state_snapshot_skips_replayed_migrations(settings, tmp_path):
+    settings.SQLFUN_STATE_SNAPSHOT = tmp_path / 'sqlfun_state.json'
+
+    first_operations = get_operations_by_function()
+    with settings.SQLFUN_STATE_SNAPSHOT.open() as snapshot_file:
+        assert ['test_project', '0001_initial'] in json.load(snapshot_file)['leaf_nodes']
+
+    with patch('sqlfun.state.get_sqlfun_operations') as mock_get_sqlfun_operations:
+        assert get_operations_by_function().keys() == first_operations.keys()
+    mock_get_sqlfun_operations.assert_not_called()
+
+
+def test_sqlfun_operations_without_hints_are_recognized():
+    create_sql = """
+        CREATE OR REPLACE FUNCTION legacy_probe() RETURNS integer AS $$
+        SELECT 1;
+        $$ LANGUAGE sql IMMUTABLE;
+    """
+    legacy_migration = migrations.Migration('0002_legacy', 'test_project')
+    legacy_migration.operations = [
+        migrations.RunSQL(sql=create_sql),
+        migrations.RunSQL(sql='DROP FUNCTION IF EXISTS other_probe;'),
+    ]
+    assert get_sqlfun_operations(legacy_migration, {'legacy_probe', 'other_probe'}) == [
+        ('legacy_probe', create_sql),
+        ('other_probe', None),
+    ]
+    # functions sqlfun doesn't know of could be hand-written ones
+    assert get_sqlfun_operations(legacy_migration, {'legacy_probe'}) == [
+        ('legacy_probe', create_sql),
+    ]
+
+    # hand-written SQL mixed in with other operations is left alone
+    mixed_migration = migrations.Migration('0003_mixed', 'test_project')
+    mixed_migration.operations = [
+        migrations.RunSQL(sql=create_sql),
+        migrations.RunSQL(sql='CREATE INDEX foo_idx ON test_project_foo (foo);'),
+    ]
+    assert get_sqlfun_operations(mixed_migration, {'legacy_probe'}) == []
+
+
+def test_handwritten_functions_are_left_alone_offline():
+    migration_path = MIGRATIONS_DIR / '0002_handwritten_trigger.py'
+    migration_path.write_text(TRIGGER_MIGRATION)
+    try:
+        assert 'my_trigger_fn' not in get_operations_by_function()
+    finally:
+        migration_path.unlink()
@@ -0,0 +1,130 @@
+import pytest
+from django.core import checks
+from django.db.models import IntegerField
+
+from sqlfun import SqlFun
+from sqlfun.checks import check_planner_attributes
+from sqlfun.metadata import merge_attributes, parse_function_definition
+from sqlfun.state import SQLFUN_HINT
+from sqlfun.utils import get_migration_operations, update_sqlfun_definition_model
+
+from .utils import make_synthetic_sqlfun
+
+
+def test_attributes_are_merged_into_the_definition():
+    class Planned(SqlFun):
+        sql = """
+            CREATE OR REPLACE FUNCTION planned(value integer) RETURNS integer AS $$
+            SELECT value;
+            $$ LANGUAGE sql;
+        """
+        volatility = 'immutable'
+        parallel = 'safe'
+        cost = 5
+        leakproof = True
+        output_field = IntegerField()
+
+    try:
+        definition = Planned.get_definition()
+        assert 'RETURNS integer IMMUTABLE PARALLEL SAFE COST 5 LEAKPROOF AS $$' in definition
+
+        metadata = Planned.get_metadata()
+        assert metadata.volatility == 'immutable'
+        assert metadata.parallel == 'safe'
+        assert metadata.cost == 5
+        assert metadata.leakproof is True
+
+        Planned.parallel = 'restricted'
+        assert 'PARALLEL RESTRICTED' in Planned.get_definition()
+    finally:
+        Planned.deregister()
+
+
+def test_attributes_are_merged_after_comments():
+    sql = """
+        CREATE FUNCTION commented(value integer) -- returns as is
+        /* no attributes yet */ RETURNS integer -- stable?
+        AS $$ SELECT value -- immutable
+        $$ LANGUAGE sql;
+    """
+    metadata = parse_function_definition(sql)
+    assert metadata.return_type == 'integer'
+    assert metadata.volatility is None
+    assert metadata.body == ' SELECT value -- immutable\n        '
+
+    definition = merge_attributes(sql, volatility='immutable', parallel='safe')
+    assert 'RETURNS integer IMMUTABLE PARALLEL SAFE -- stable?' in definition
+    assert parse_function_definition(definition).parallel == 'safe'
+
+
+def test_attributes_conflicting_with_the_definition_are_rejected():
+    with pytest.raises(ValueError, match='conflicts with the SQL definition'):
+        class Conflicting(SqlFun):
+            sql = """
+                CREATE OR REPLACE FUNCTION conflicting() RETURNS integer AS $$
+                SELECT 1;
+                $$ LANGUAGE sql STABLE;
+            """
+            volatility = 'immutable'
+
+    with pytest.raises(ValueError, match='parallel must be one of'):
+        class Invalid(SqlFun):
+            sql = """
+                CREATE OR REPLACE FUNCTION invalid() RETURNS integer AS $$
+                SELECT 1;
+                $$ LANGUAGE sql;
+            """
+            parallel = 'yes'
+
+
+@pytest.mark.django_db
+def test_attributes_are_part_of_change_detection():
+    probe = make_synthetic_sqlfun('planned_probe')
+    try:
+        update_sqlfun_definition_model()
+        assert not any(
+            operation.hints[SQLFUN_HINT] == 'planned_probe'
+            for operation in get_migration_operations()['test_project']
+        )
+
+        probe.parallel = 'safe'
+        [operation] = [
+            operation for operation in get_migration_operations()['test_project']
+            if operation.hints[SQLFUN_HINT] == 'planned_probe'
+        ]
+        assert 'PARALLEL SAFE' in operation.sql
+    finally:
+        probe.deregister()
+
+
+def test_check_planner_attributes():
+    class Unmarked(SqlFun):
+        sql = """
+            CREATE OR REPLACE FUNCTION unmarked() RETURNS SETOF integer AS $$
+            SELECT 1;
+            $$ LANGUAGE sql;
+        """
+
+    try:
+        messages = [
+            message for message in check_planner_attributes()
+            if message.obj is Unmarked
+        ]
+        assert [message.id for message in messages] == ['sqlfun.W001', 'sqlfun.W003']
+        assert all(message.level == checks.WARNING for message in messages)
+
+        Unmarked.volatility = 'volatile'
+        assert 'sqlfun.W002' not in [
+            message.id for message in check_planner_attributes() if message.obj is Unmarked
+        ]
+
+        Unmarked.volatility = 'stable'
+        assert 'sqlfun.W002' in [
+            message.id for message in check_planner_attributes() if message.obj is Unmarked
+        ]
+
+        Unmarked.parallel = 'safe'
+        Unmarked.rows = 1
+        assert not any(message.obj is Unmarked for message in check_planner_attributes())
+    finally:
+        Unmarked.deregister()
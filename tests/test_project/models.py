@@ -26,3 +26,7 @@ class BadSum(SqlFun):
     """
 
     output_field = IntegerField()
+
+    @staticmethod
+    def python_function(first, second):
+        return first + second + 1
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db import ProgrammingError, connection
+from django.test.utils import CaptureQueriesContext
+
+from sqlfun.deploy import apply_definitions, install_in_schemas
+from sqlfun.drift import detect_drift
+from sqlfun.metadata import qualify_definition
+
+from .utils import make_synthetic_sqlfun
+
+
+def create_schemas(*schemas):
+    with connection.cursor() as cursor:
+        for schema in schemas:
+            cursor.execute(f'CREATE SCHEMA "{schema}"')
+
+
+def call_in(schema, function_name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT "{schema}".{function_name}()')
+        return cursor.fetchone()[0]
+
+
+def test_qualify_definition():
+    sql = 'CREATE OR REPLACE FUNCTION probe() RETURNS integer AS $$ SELECT 1 $$ LANGUAGE sql'
+    assert qualify_definition(sql, 'Tenant "1"').startswith(
+        'CREATE OR REPLACE FUNCTION "Tenant ""1""".probe()'
+    )
+    with pytest.raises(ValueError, match='already schema qualified'):
+        qualify_definition(qualify_definition(sql, 'tenant'), 'tenant')
+
+
+@pytest.mark.django_db
+def test_install_in_schemas_batches_schemas_per_chunk():
+    probes = [make_synthetic_sqlfun(f'tenant_probe_{i}') for i in range(2)]
+    schemas = [f'tenant_{i}' for i in range(5)]
+    create_schemas(*schemas)
+    try:
+        with CaptureQueriesContext(connection) as installing:
+            assert install_in_schemas(schemas, probes, chunk_size=2, batch_size=3) == schemas
+        definition_statements = [
+            query for query in installing.captured_queries
+            if 'CREATE OR REPLACE FUNCTION' in query['sql']
+        ]
+        # chunks of 2, 2 and 1 schemas, with 4, 4 and 2 definitions
+        assert len(definition_statements) == 5
+        assert all(call_in(schema, 'tenant_probe_1') == 1 for schema in schemas)
+
+        # everything is up to date, so only the fingerprints are read
+        with CaptureQueriesContext(connection) as reinstalling:
+            install_in_schemas(schemas, probes, chunk_size=2)
+        assert not any(
+            'CREATE OR REPLACE FUNCTION' in query['sql']
+            for query in reinstalling.captured_queries
+        )
+    finally:
+        for sqlfun_cls in probes:
+            sqlfun_cls.deregister()
+
+
+@pytest.mark.django_db
+def test_install_in_schemas_resumes_from_checkpoint(tmp_path):
+    probe = make_synthetic_sqlfun('resume_probe')
+    checkpoint = tmp_path / 'checkpoint.json'
+    create_schemas('resume_a', 'resume_c')
+    try:
+        with pytest.raises(ProgrammingError, match='resume_b'):
+            install_in_schemas(
+                ['resume_a', 'resume_b', 'resume_c'], [probe],
+                chunk_size=1, checkpoint=checkpoint,
+            )
+        assert json.loads(checkpoint.read_text())['completed_schemas'] == ['resume_a']
+
+        create_schemas('resume_b')
+        call_command(
+            'sqlfun_install_schemas', 'resume_a', 'resume_b', 'resume_c',
+            '--chunk-size', '1', '--checkpoint', str(checkpoint), verbosity=0,
+        )
+        assert not checkpoint.exists()
+        assert call_in('resume_c', 'resume_probe') == 1
+
+        # a checkpoint written for other definitions is ignored
+        checkpoint.write_text(json.dumps({
+            'rollout': 'stale', 'completed_schemas': ['resume_a'],
+        }))
+        assert install_in_schemas(
+            ['resume_a', 'resume_b'], [probe], checkpoint=checkpoint,
+        ) == ['resume_a', 'resume_b']
+    finally:
+        probe.deregister()
+
+
+@pytest.mark.django_db
+def test_schema_copies_are_not_drift():
+    probe = make_synthetic_sqlfun('drift_tenant_probe')
+    create_schemas('drift_tenant_1', 'drift_tenant_2')
+    try:
+        apply_definitions([probe])
+        install_in_schemas(['drift_tenant_1', 'drift_tenant_2'], [probe])
+        assert not detect_drift([probe]).has_drift
+    finally:
+        probe.deregister()
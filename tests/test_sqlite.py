@@ -0,0 +1,116 @@
+import pytest
+from django.core.management import call_command
+from django.db import NotSupportedError, connections, router
+from django.db.models import F, IntegerField, Value
+from django.db.utils import OperationalError
+from django.test import override_settings
+
+from sqlfun import SqlFun
+from sqlfun.deploy import apply_definitions
+from sqlfun.state import SQLFUN_HINT
+
+from test_project.models import BadSum, Foo
+
+from .utils import make_synthetic_sqlfun
+
+
+@pytest.fixture(scope='module', autouse=True)
+def sqlite_database(django_db_setup, django_db_blocker):
+    """Add an in-memory SQLite database next to postgres, for this module only.
+
+    It isn't in the test settings, since makemigrations would then check the
+    migration history of every test against it too.
+    """
+    databases = connections.configure_settings({
+        **connections.settings,
+        'sqlite': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+    })
+    connections.settings['sqlite'] = databases['sqlite']
+    try:
+        with override_settings(DATABASE_ROUTERS=['sqlfun.routers.PostgresOnlyRouter']):
+            with django_db_blocker.unblock():
+                call_command('migrate', database='sqlite', verbosity=0)
+            yield
+    finally:
+        if hasattr(connections._connections, 'sqlite'):
+            del connections['sqlite']
+        del connections.settings['sqlite']
+
+
+def make_increment(name, volatility):
+    return type(name, (SqlFun,), {
+        'app_label': 'test_project',
+        'sql': f"""
+            CREATE OR REPLACE FUNCTION {name}(value integer) RETURNS integer AS $$
+            SELECT value + 1;
+            $$ LANGUAGE sql STRICT;
+        """,
+        'volatility': volatility,
+        'output_field': IntegerField(),
+        'python_function': staticmethod(lambda value: value + 1),
+    })
+
+
+@pytest.mark.django_db(databases=['default', 'sqlite'])
+def test_same_expression_on_both_backends():
+    BadSum.update()
+    for using in ('default', 'sqlite'):
+        Foo.objects.using(using).create(foo=2)
+        annotated = Foo.objects.using(using).annotate(bad=BadSum(F('foo'), Value(3)))
+        assert annotated.get().bad == 6
+
+
+@pytest.mark.django_db(databases=['sqlite'])
+def test_call_on_sqlite():
+    assert BadSum.call(1, 2, using='sqlite') == 4
+    assert list(BadSum.call_many([(1, 2), (3, 4)], using='sqlite')) == [4, 8]
+
+
+@pytest.mark.django_db(databases=['sqlite'])
+def test_strict_functions_return_null_on_sqlite():
+    increment = make_increment('sqlite_increment', 'immutable')
+    try:
+        assert increment.call(1, using='sqlite') == 2
+        assert increment.call(None, using='sqlite') is None
+    finally:
+        increment.deregister()
+
+
+@pytest.mark.django_db(databases=['sqlite'])
+def test_only_immutable_functions_are_deterministic():
+    immutable = make_increment('sqlite_immutable', 'immutable')
+    volatile = make_increment('sqlite_volatile', 'volatile')
+    try:
+        assert immutable.call(1, using='sqlite') == 2
+        assert volatile.call(1, using='sqlite') == 2
+
+        # sqlite only allows deterministic functions in index expressions
+        with connections['sqlite'].cursor() as cursor:
+            cursor.execute('CREATE INDEX immutable_idx ON test_project_foo (sqlite_immutable(foo))')
+            with pytest.raises(OperationalError, match='non-deterministic'):
+                cursor.execute('CREATE INDEX volatile_idx ON test_project_foo (sqlite_volatile(foo))')
+    finally:
+        immutable.deregister()
+        volatile.deregister()
+
+
+@pytest.mark.django_db(databases=['sqlite'])
+def test_functions_without_python_function_on_sqlite():
+    probe = make_synthetic_sqlfun('sqlite_unsupported')
+    try:
+        with pytest.raises(NotSupportedError, match='python_function'):
+            probe.call(using='sqlite')
+    finally:
+        probe.deregister()
+
+
+def test_sqlfun_migrations_are_routed_to_postgres_only():
+    hints = {SQLFUN_HINT: 'bad_sum'}
+    assert router.allow_migrate('default', 'test_project', **hints)
+    assert not router.allow_migrate('sqlite', 'test_project', **hints)
+    assert router.allow_migrate('sqlite', 'test_project', model_name='foo')
+
+
+@pytest.mark.django_db(databases=['sqlite'])
+def test_nothing_is_deployed_to_sqlite():
+    assert apply_definitions([BadSum], using='sqlite') == []
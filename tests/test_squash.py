@@ -0,0 +1,86 @@
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db.migrations.loader import MigrationLoader
+
+from sqlfun.squash import squash_sqlfun_migrations
+from sqlfun.state import SQLFUN_HINT
+from sqlfun.utils import make_sqlfun_migrations
+
+from .utils import make_synthetic_sqlfun
+
+
+def test_squash_keeps_latest_definitions():
+    probe = make_synthetic_sqlfun('squash_probe')
+    dropped = None
+    migration_paths = make_sqlfun_migrations('squash_probe', offline=True)
+    squashed_path = None
+
+    try:
+        probe.sql = probe.sql.replace('SELECT 1', 'SELECT 2')
+        dropped = make_synthetic_sqlfun('squash_dropped')
+        migration_paths.extend(make_sqlfun_migrations('squash_probe', offline=True))
+
+        probe.sql = probe.sql.replace('SELECT 2', 'SELECT 3')
+        migration_paths.extend(make_sqlfun_migrations('squash_probe', offline=True))
+
+        dropped.deregister()
+        dropped = None
+        migration_paths.extend(make_sqlfun_migrations('squash_probe', offline=True))
+
+        start, end = migration_paths[1].stem, migration_paths[-1].stem
+        result = squash_sqlfun_migrations('test_project', start, end)
+        squashed_path = result.path
+
+        # the function dropped within the range never needs creating
+        assert result.original_statements == 4
+        assert result.squashed_statements == 1
+        (operation,) = result.migration.operations
+        assert operation.hints == {SQLFUN_HINT: 'squash_probe'}
+        assert 'SELECT 3' in operation.sql
+        assert 'SELECT 1' in operation.reverse_sql
+        assert result.migration.replaces == [
+            ('test_project', path.stem) for path in migration_paths[1:]
+        ]
+        assert result.migration.dependencies == [('test_project', migration_paths[0].stem)]
+
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        assert ('test_project', result.migration.name) in loader.graph.nodes
+        assert ('test_project', end) not in loader.graph.nodes
+    finally:
+        probe.deregister()
+        if dropped is not None:
+            dropped.deregister()
+        for path in migration_paths:
+            path.unlink()
+        if squashed_path is not None:
+            squashed_path.unlink(missing_ok=True)
+
+
+def test_squash_command():
+    probe = make_synthetic_sqlfun('squash_command_probe')
+    migration_paths = make_sqlfun_migrations('squash_command', offline=True)
+
+    try:
+        probe.sql = probe.sql.replace('SELECT 1', 'SELECT 2')
+        migration_paths.extend(make_sqlfun_migrations('squash_command', offline=True))
+
+        out = StringIO()
+        call_command(
+            'sqlfun_squash', 'test_project', migration_paths[0].stem,
+            migration_paths[-1].stem, '--squashed-name', 'squashed_command', '--dry-run',
+            stdout=out,
+        )
+        assert '[sqlfun] Would write' in out.getvalue()
+        assert '-> ' in out.getvalue()
+        assert 'replacing 2 migration(s)' in out.getvalue()
+        assert not list(migration_paths[0].parent.glob('*_squashed_command.py'))
+
+        # the initial migration creates a model, which only squashmigrations can move
+        with pytest.raises(CommandError, match='squashmigrations'):
+            call_command('sqlfun_squash', 'test_project', migration_paths[-1].stem)
+    finally:
+        probe.deregister()
+        for path in migration_paths:
+            path.unlink()
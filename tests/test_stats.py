@@ -0,0 +1,85 @@
+import datetime
+from unittest.mock import Mock
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from sqlfun.stats import FunctionStats, StatsSnapshot, take_snapshot
+
+from .utils import make_synthetic_sqlfun
+
+
+def make_snapshot(minute, **calls):
+    return StatsSnapshot(
+        database='default',
+        taken_at=datetime.datetime(2024, 1, 1, 0, minute),
+        functions={
+            signature: FunctionStats(sqlfun_cls, calls=count, total_time=count * 2.0, self_time=count)
+            for signature, (sqlfun_cls, count) in calls.items()
+        },
+        track_functions='all',
+    )
+
+
+def test_snapshot_deltas():
+    first, second = make_synthetic_sqlfun('stats_first'), make_synthetic_sqlfun('stats_second')
+    second.app_label = 'other_app'
+    try:
+        earlier = make_snapshot(0, a=(first, 5))
+        later = make_snapshot(1, a=(first, 8), b=(second, 2))
+
+        delta = later - earlier
+        assert delta.since == earlier.taken_at
+        assert delta.functions['a'].calls == 3
+        assert delta.functions['a'].total_time == 6.0
+        assert delta.functions['b'].calls == 2
+        assert delta.by_app() == {'test_project': (3, 6.0, 3.0), 'other_app': (2, 4.0, 2.0)}
+
+        # statistics were reset between the snapshots
+        assert (make_snapshot(2, a=(first, 1)) - later).functions['a'].calls == 1
+    finally:
+        first.deregister()
+        second.deregister()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_take_snapshot_reads_function_statistics(django_assert_num_queries):
+    probe = make_synthetic_sqlfun('stats_probe')
+    # LANGUAGE sql functions would be inlined by the planner and never counted
+    probe.sql = """
+        CREATE OR REPLACE FUNCTION stats_probe() RETURNS integer AS $$
+        BEGIN RETURN 1; END;
+        $$ LANGUAGE plpgsql;
+    """
+    uncalled = make_synthetic_sqlfun('stats_uncalled')
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SET track_functions = 'all'")
+            cursor.execute(probe.sql)
+            before = take_snapshot([probe, uncalled])
+            cursor.execute('SELECT stats_probe() FROM generate_series(1, 3)')
+            cursor.execute('SELECT pg_stat_force_next_flush()')
+
+        with django_assert_num_queries(1):
+            after = take_snapshot([probe, uncalled])
+
+        assert after.track_functions == 'all'
+        assert (after - before).functions['stats_probe()'].calls == 3
+        assert after.functions['stats_uncalled()'].calls == 0
+
+        sink = Mock()
+        call_command('sqlfun_stats', '--by-app', sink=sink)
+        [snapshot], _ = sink.call_args
+        assert isinstance(snapshot, StatsSnapshot)
+
+        # one delta per interval
+        call_command('sqlfun_stats', interval=0, count=2, sink=sink)
+        assert sink.call_count == 3
+        assert sink.call_args[0][0].since is not None
+    finally:
+        probe.deregister()
+        uncalled.deregister()
+        with connection.cursor() as cursor:
+            cursor.execute('DROP FUNCTION IF EXISTS stats_probe()')
+            cursor.execute('RESET track_functions')
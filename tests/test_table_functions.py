@@ -0,0 +1,88 @@
+import pytest
+from django.db import connection, transaction
+from django.db.models import IntegerField
+
+from sqlfun import SqlFun, SqlTableFun
+from sqlfun.state import SQLFUN_HINT
+from sqlfun.utils import get_migration_operations
+
+from test_project.models import Foo
+
+
+@pytest.fixture
+def top_foos():
+    class TopFoos(SqlTableFun):
+        """The ids and values of the n largest foos."""
+        app_label = 'test_project'
+        sql = """
+            CREATE OR REPLACE FUNCTION top_foos(n integer)
+            RETURNS TABLE (id integer, foo integer) AS $$
+            SELECT id, foo FROM test_project_foo ORDER BY foo DESC LIMIT n;
+            $$ LANGUAGE sql STABLE;
+        """
+        column = 'id'
+        output_field = IntegerField()
+
+    TopFoos.update()
+    Foo.objects.bulk_create(Foo(foo=foo) for foo in range(5))
+    yield TopFoos
+    TopFoos.deregister()
+
+
+def test_table_function_base_class_is_not_registered():
+    assert SqlTableFun not in SqlFun._registry
+
+
+@pytest.mark.django_db
+def test_iterate_streams_rows_in_chunks(top_foos, monkeypatch):
+    fetched_chunks = []
+    chunked_cursor = connection.chunked_cursor
+
+    def recording_chunked_cursor():
+        cursor = chunked_cursor()
+        fetchmany = cursor.fetchmany
+
+        def recording_fetchmany(size):
+            rows = fetchmany(size)
+            fetched_chunks.append(len(rows))
+            return rows
+
+        cursor.fetchmany = recording_fetchmany
+        return cursor
+
+    monkeypatch.setattr(connection, 'chunked_cursor', recording_chunked_cursor)
+
+    with transaction.atomic():
+        rows = top_foos.iterate(4, chunk_size=3)
+        assert not fetched_chunks
+        assert [foo for _, foo in rows] == [4, 3, 2, 1]
+    assert fetched_chunks == [3, 1, 0]
+
+    assert [foo for _, foo in top_foos.call(2)] == [4, 3]
+    with pytest.raises(TypeError):
+        top_foos.call_many([(1,)])
+
+
+@pytest.mark.django_db
+def test_table_function_selects_its_first_column_by_default(top_foos):
+    top_foos.column = None
+    assert top_foos.get_default_column() == 'id'
+    assert sorted(
+        Foo.objects.filter(pk__in=top_foos(2)).values_list('foo', flat=True)
+    ) == [3, 4]
+
+
+@pytest.mark.django_db
+def test_table_function_as_subquery(top_foos):
+    assert sorted(
+        Foo.objects.filter(pk__in=top_foos(2)).values_list('foo', flat=True)
+    ) == [3, 4]
+    assert sorted(
+        Foo.objects.exclude(id__in=top_foos(3, column='id')).values_list('foo', flat=True)
+    ) == [0, 1]
+
+
+@pytest.mark.django_db
+def test_table_functions_are_migrated(top_foos):
+    operations = get_migration_operations()['test_project']
+    assert 'top_foos' in {operation.hints[SQLFUN_HINT] for operation in operations}
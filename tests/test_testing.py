@@ -0,0 +1,172 @@
+import pathlib
+from types import SimpleNamespace
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, migrations
+from django.test.utils import CaptureQueriesContext
+
+from sqlfun import pytest_plugin
+
+from sqlfun.testing import fast_function_setup, install_test_functions
+from sqlfun.utils import make_sqlfun_migrations
+
+from .utils import function_exists, make_synthetic_sqlfun
+
+MIGRATIONS_DIR = pathlib.Path(settings.BASE_DIR) / 'test_project' / 'migrations'
+HANDWRITTEN_MIGRATION = """
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [('test_project', '0001_initial')]
+    operations = [
+        migrations.RunSQL(
+            'CREATE FUNCTION testing_handwritten() RETURNS integer AS $$ SELECT 1 $$ LANGUAGE sql;'
+        ),
+    ]
+"""
+CONSTRAINT_MIGRATION = """
+from django.db import migrations, models
+from django.db.models import F, Q, Value
+
+from test_project.models import BadSum
+
+
+class Migration(migrations.Migration):
+    dependencies = [('test_project', '{dependency}')]
+    operations = [
+        migrations.AddConstraint('foo', models.CheckConstraint(
+            condition=Q(foo__lt=BadSum(F('foo'), Value(1))), name='foo_below_bad_sum',
+        )),
+    ]
+"""
+
+
+@pytest.mark.django_db
+def test_install_test_functions_skips_unchanged_registry():
+    probe = make_synthetic_sqlfun('testing_probe')
+
+    try:
+        assert probe in install_test_functions()
+        assert function_exists('testing_probe')
+        assert install_test_functions() is None
+
+        probe.sql = probe.sql.replace('SELECT 1', 'SELECT 2')
+        assert install_test_functions() == [probe]
+        assert install_test_functions(force=True)
+    finally:
+        probe.deregister()
+
+
+@pytest.mark.django_db
+def test_fast_function_setup_skips_sqlfun_migrations():
+    probe = make_synthetic_sqlfun('testing_skipped_probe')
+    migration_paths = []
+    try:
+        migration_paths = make_sqlfun_migrations('testing_skipped')
+        probe.sql = probe.sql.replace('SELECT 1', 'SELECT 2')
+
+        with fast_function_setup(), CaptureQueriesContext(connection) as queries:
+            call_command('migrate', verbosity=0)
+
+        # the migrated definition never runs, only the registered one
+        definitions = [
+            query['sql'] for query in queries.captured_queries
+            if 'testing_skipped_probe' in query['sql']
+        ]
+        assert definitions
+        assert not any('SELECT 1' in sql for sql in definitions)
+    finally:
+        probe.deregister()
+        for path in migration_paths:
+            path.unlink()
+
+
+@pytest.mark.django_db
+def test_fast_function_setup_migrates_functions_used_by_migrations():
+    migration_paths = make_sqlfun_migrations('testing_constraint_function')
+    constraint_path = MIGRATIONS_DIR / '0003_testing_constraint.py'
+    constraint_path.write_text(CONSTRAINT_MIGRATION.format(dependency=migration_paths[0].stem))
+    try:
+        # as in a new test database, where the function doesn't exist yet
+        with connection.cursor() as cursor:
+            cursor.execute('DROP FUNCTION IF EXISTS bad_sum(integer, integer)')
+
+        with fast_function_setup():
+            call_command('migrate', verbosity=0)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_constraint WHERE conname = 'foo_below_bad_sum'"
+            )
+            assert cursor.fetchone()
+    finally:
+        constraint_path.unlink()
+        for path in migration_paths:
+            path.unlink()
+
+
+@pytest.mark.django_db
+def test_fast_function_setup_runs_handwritten_sql():
+    migration_path = MIGRATIONS_DIR / '0002_testing_handwritten.py'
+    migration_path.write_text(HANDWRITTEN_MIGRATION)
+    try:
+        with fast_function_setup():
+            call_command('migrate', verbosity=0)
+
+        assert function_exists('testing_handwritten')
+    finally:
+        migration_path.unlink()
+
+
+@pytest.mark.django_db
+def test_fast_function_setup_installs_registry():
+    probe = make_synthetic_sqlfun('testing_installed_probe')
+
+    try:
+        with fast_function_setup():
+            call_command('migrate', verbosity=0)
+
+        assert function_exists('testing_installed_probe')
+    finally:
+        probe.deregister()
+
+
+def make_plugin_request(option=None, ini=False):
+    config = SimpleNamespace(
+        getoption=lambda name: option,
+        getini=lambda name: ini,
+    )
+    return SimpleNamespace(config=config)
+
+
+@pytest.mark.parametrize('option, ini, is_enabled', [
+    (None, False, False),
+    (None, True, True),
+    (True, False, True),
+])
+def test_pytest_plugin_wraps_database_setup(option, ini, is_enabled):
+    database_forwards = migrations.RunSQL.database_forwards
+    hook = pytest_plugin.pytest_fixture_setup(
+        SimpleNamespace(argname='django_db_setup'), make_plugin_request(option, ini)
+    )
+
+    next(hook)
+    assert (migrations.RunSQL.database_forwards is not database_forwards) == is_enabled
+    with pytest.raises(StopIteration):
+        next(hook)
+    assert migrations.RunSQL.database_forwards is database_forwards
+
+
+def test_pytest_plugin_ignores_other_fixtures():
+    database_forwards = migrations.RunSQL.database_forwards
+    hook = pytest_plugin.pytest_fixture_setup(
+        SimpleNamespace(argname='db'), make_plugin_request(True)
+    )
+
+    next(hook)
+    assert migrations.RunSQL.database_forwards is database_forwards
+    with pytest.raises(StopIteration):
+        next(hook)
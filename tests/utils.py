@@ -1,8 +1,21 @@
 
 from django.db import connection
 
+from sqlfun import SqlFun
+
 
 def function_exists(function_name):
     with connection.cursor() as cursor:
         cursor.execute('SELECT COUNT(*) FROM information_schema.routines WHERE routine_name = %s', [function_name])
         return cursor.fetchone()[0] == 1
+
+
+def make_synthetic_sqlfun(name):
+    return type(name, (SqlFun,), {
+        'app_label': 'test_project',
+        'sql': f"""
+            CREATE OR REPLACE FUNCTION {name}() RETURNS integer AS $$
+            SELECT 1;
+            $$ LANGUAGE sql IMMUTABLE;
+        """,
+    })